@@ -1,8 +1,9 @@
 # auth/dependencies.py
-from fastapi import Header, HTTPException, Query
-from typing import Dict, Any
+import math
+from fastapi import Header, HTTPException, Query, Request
+from typing import Dict, Any, Optional
 from services.challenge_auth_service import challenge_auth_service
-from database import mongodb
+from services.rate_limiter import rate_limiter, RATE_LIMIT_ENABLED, RATE_LIMIT_POLICIES
 
 
 async def get_current_user(token: str = Query(..., alias="session-token")):
@@ -10,20 +11,62 @@ async def get_current_user(token: str = Query(..., alias="session-token")):
     This dependency validates the session token and gets the associated user.
     It can be used in other route handlers that require authentication.
     """
-    is_valid = await challenge_auth_service.is_session_valid(token)
-    if not is_valid:
+    # Session and user are resolved together (and cached) in one step
+    session = await challenge_auth_service.resolve_session(token)
+    if not session:
         raise HTTPException(status_code=401, detail="Invalid or expired token")
 
-    # Get the public key from the session
-    public_key = await challenge_auth_service.get_public_key_for_session(token)
-    if not public_key:
-        raise HTTPException(status_code=401, detail="Invalid session")
-
-    # Fetch the user from the database using the public key
-    from database import mongodb
-    user = await mongodb.db.users.find_one({"nostr_public_key": public_key})
+    user = session["user"]
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
     # Return user data for use in protected routes
-    return user
\ No newline at end of file
+    return user
+
+
+async def get_optional_user(token: Optional[str] = Query(None, alias="session-token")):
+    """Like get_current_user for routes that also serve anonymous callers, who get None"""
+    if token is None:
+        return None
+    return await get_current_user(token)
+
+
+async def _request_pubkey(request: Request) -> Optional[str]:
+    """The pubkey a request acts for: the public_key query parameter or the JSON body's pubkey"""
+    pubkey = request.query_params.get("public_key")
+    if pubkey or request.method != "POST":
+        return pubkey
+    try:
+        # Starlette caches the body, so the route handler does not read it again
+        body = await request.json()
+    except Exception:
+        return None
+    return body.get("pubkey") if isinstance(body, dict) else None
+
+
+def rate_limit(policy_name: str):
+    """
+    Dependency factory applying a policy from RATE_LIMIT_POLICIES. Rejections are
+    plain 429s raised before the route handler does any work.
+    """
+    scopes = {limit.scope for limit in RATE_LIMIT_POLICIES[policy_name]}
+
+    async def dependency(request: Request):
+        if not RATE_LIMIT_ENABLED:
+            return
+
+        ip = request.client.host if request.client else "unknown"
+        identities = {"ip": ip}
+        if "ip_pubkey" in scopes:
+            pubkey = await _request_pubkey(request)
+            identities["ip_pubkey"] = f"{ip}|{pubkey}" if pubkey else None
+
+        retry_after = rate_limiter.check(policy_name, identities)
+        if retry_after is not None:
+            raise HTTPException(
+                status_code=429,
+                detail="Too many requests",
+                headers={"Retry-After": str(math.ceil(retry_after))}
+            )
+
+    return dependency
\ No newline at end of file
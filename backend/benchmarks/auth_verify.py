@@ -0,0 +1,82 @@
+"""
+Throughput benchmark for POST /auth/verify against a running backend.
+
+Registers a few users, then runs the challenge/verify handshake with the given
+concurrency and reports verify requests per second and latency percentiles.
+
+    RATE_LIMIT_ENABLED=false uvicorn main:app --port 8000
+    python benchmarks/auth_verify.py --users 20 --requests 2000 --concurrency 50
+"""
+import argparse
+import asyncio
+import base64
+import statistics
+import time
+
+import httpx
+import nacl.signing
+
+
+async def register_users(client: httpx.AsyncClient, count: int) -> list:
+    users = []
+    for _ in range(count):
+        resp = await client.post("/users/register")
+        resp.raise_for_status()
+        user = resp.json()
+        users.append((user["nostr_public_key"], nacl.signing.SigningKey(bytes.fromhex(user["raw_seed"]))))
+    return users
+
+
+async def handshake(client: httpx.AsyncClient, public_key: str, signing_key: nacl.signing.SigningKey) -> float:
+    """Run one challenge/verify round and return the verify latency in seconds"""
+    resp = await client.get("/auth/challenge", params={"public_key": public_key})
+    resp.raise_for_status()
+    challenge = resp.json()
+
+    signature = signing_key.sign(challenge["challenge"].encode()).signature
+    body = {"session_id": challenge["session_id"], "signature_b64": base64.b64encode(signature).decode()}
+
+    started = time.perf_counter()
+    resp = await client.post("/auth/verify", json=body)
+    elapsed = time.perf_counter() - started
+    resp.raise_for_status()
+    if not resp.json()["authenticated"]:
+        raise RuntimeError("verify rejected a valid signature")
+    return elapsed
+
+
+async def run(base_url: str, users_count: int, requests: int, concurrency: int):
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        users = await register_users(client, users_count)
+        # Warm up the verify-key caches once per user
+        for public_key, signing_key in users:
+            await handshake(client, public_key, signing_key)
+
+        latencies = []
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def worker(index: int):
+            public_key, signing_key = users[index % len(users)]
+            async with semaphore:
+                latencies.append(await handshake(client, public_key, signing_key))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(i) for i in range(requests)))
+        total = time.perf_counter() - started
+
+    latencies.sort()
+    print(f"verify requests:   {len(latencies)} (concurrency {concurrency})")
+    print(f"handshakes/s:      {len(latencies) / total:.1f}")
+    print(f"verify p50:        {statistics.median(latencies) * 1000:.2f} ms")
+    print(f"verify p99:        {latencies[int(len(latencies) * 0.99) - 1] * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(run(args.base_url, args.users, args.requests, args.concurrency))
@@ -0,0 +1,81 @@
+"""
+Microbenchmark of the per-request NWC crypto: parse the connection string, encrypt
+the request, sign the event and decrypt the response.
+
+"before" is the original nwc.py path (parse and ECDH on every call), "after" uses a
+cached NWCSession with the pre-derived shared key.
+
+    python benchmarks/nwc_crypto.py --iterations 2000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from secp256k1 import PrivateKey  # noqa: E402
+
+from services.nwc import processNWCstring, encrypt, decrypt, getSignedEvent  # noqa: E402
+from services.nwc_session import get_nwc_session  # noqa: E402
+
+REQUEST = json.dumps({"method": "lookup_invoice", "params": {"invoice": "lnbc10u1p" + "q" * 300}})
+
+
+def make_connection_string() -> tuple:
+    wallet = PrivateKey()
+    app = PrivateKey()
+    wallet_pubkey = wallet.pubkey.serialize().hex()[2:]
+    connection_string = (
+        f"nostr+walletconnect://{wallet_pubkey}"
+        f"?relay=wss%3A%2F%2Frelay.example.com&secret={app.serialize()}"
+    )
+    response = encrypt(wallet.serialize(), app.pubkey.serialize().hex()[2:], REQUEST)
+    return connection_string, response
+
+
+def before(connection_string: str, response: str):
+    nwc_obj = processNWCstring(connection_string)
+    content = encrypt(nwc_obj["app_privkey"], nwc_obj["wallet_pubkey"], REQUEST)
+    getSignedEvent({
+        "kind": 23194,
+        "content": content,
+        "tags": [["p", nwc_obj["wallet_pubkey"]]],
+        "created_at": int(time.time()),
+        "pubkey": nwc_obj["app_pubkey"],
+    }, nwc_obj["app_privkey"])
+    decrypt(nwc_obj["app_privkey"], nwc_obj["wallet_pubkey"], response)
+
+
+def after(connection_string: str, response: str):
+    session = get_nwc_session(connection_string)
+    session.sign_event({
+        "kind": 23194,
+        "content": session.encrypt(REQUEST),
+        "tags": [["p", session.wallet_pubkey]],
+        "created_at": int(time.time()),
+        "pubkey": session.app_pubkey,
+    })
+    session.decrypt(response)
+
+
+def measure(label: str, func, iterations: int, *args):
+    func(*args)  # warm-up, also populates the session cache
+    started = time.perf_counter()
+    for _ in range(iterations):
+        func(*args)
+    elapsed = time.perf_counter() - started
+    print(f"{label:7} {elapsed / iterations * 1e6:9.1f} us/request  {iterations / elapsed:10.0f} requests/s")
+    return elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    connection_string, response = make_connection_string()
+    slow = measure("before", before, args.iterations, connection_string, response)
+    fast = measure("after", after, args.iterations, connection_string, response)
+    print(f"speedup {slow / fast:.1f}x")
@@ -0,0 +1,126 @@
+"""
+Load driver for InvoiceService and NostrService against local stand-ins (see standins.py):
+an in-process relay, a scripted NWC wallet and an LNURL-pay endpoint, so no live relays
+or wallets are needed. Reports p50/p99 latency and throughput per scenario.
+
+Invoices are recorded in the configured MongoDB, so point it at a scratch database:
+
+    MONGODB_URL=mongodb://localhost:27017 DB_NAME=loadtest \\
+        python benchmarks/nwc_load.py --requests 500 --concurrency 50 --wallet-latency-ms 50
+
+Scenarios: create (LNURL invoice + ledger insert), lookup (check_invoice_status of a
+pending invoice), pay (pay_invoice through the wallet) and publish (listing event).
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from nostr_sdk import Keys, Tag, TagKind  # noqa: E402
+
+os.environ.setdefault("NOSTR_PRIVATE_KEY", Keys.generate().secret_key().to_hex())
+
+import httpx  # noqa: E402
+
+from benchmarks.standins import StandInRelay, StandInWallet  # noqa: E402
+from database import mongodb  # noqa: E402
+from services.http_client import http_client  # noqa: E402
+from services.invoice_service import invoice_service  # noqa: E402
+from services.nostr_service import NostrService  # noqa: E402
+from services.nwc_client import nwc_client  # noqa: E402
+
+SCENARIOS = ("create", "lookup", "pay", "publish")
+LIGHTNING_ADDRESS = "shop@standin.local"
+
+
+async def measure(name: str, operation, requests: int, concurrency: int):
+    """Run operation(index) requests times with the given concurrency and print the stats"""
+    latencies = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def worker(index: int):
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await operation(index)
+            except Exception:
+                errors += 1
+                return
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(requests)))
+    total = time.perf_counter() - started
+
+    if not latencies:
+        print(f"{name:8} all {requests} requests failed")
+        return
+    latencies.sort()
+    p99 = latencies[max(int(len(latencies) * 0.99) - 1, 0)]
+    print(f"{name:8} {len(latencies):6} ok {errors:5} err  {len(latencies) / total:9.1f} req/s  "
+          f"p50 {statistics.median(latencies) * 1000:8.2f} ms  p99 {p99 * 1000:8.2f} ms")
+
+
+async def run(args):
+    relay = StandInRelay(latency=args.relay_latency_ms / 1000)
+    await relay.start()
+    wallet = StandInWallet(relay, latency=args.wallet_latency_ms / 1000, failure_rate=args.failure_rate)
+    nwc_string = wallet.connection_string()
+
+    mongodb.connect_to_mongo()
+    await invoice_service.ensure_indexes()
+    http_client.client = httpx.AsyncClient(transport=wallet.lnurl_transport())
+    publisher = NostrService(private_key_hex=Keys.generate().secret_key().to_hex(), relays=[relay.url])
+    await publisher.connect()
+
+    print(f"relay {relay.url}, wallet latency {args.wallet_latency_ms} ms, failure rate {args.failure_rate}, "
+          f"{args.requests} requests per scenario at concurrency {args.concurrency}")
+
+    invoices = []
+
+    async def create(index: int):
+        invoice = await invoice_service.create_invoice(LIGHTNING_ADDRESS, 1000 + index, "load test")
+        invoices.append(invoice["invoice"])
+
+    async def lookup(index: int):
+        await invoice_service.check_invoice_status(nwc_string, invoices[index % len(invoices)])
+
+    async def pay(index: int):
+        result = await invoice_service.try_to_pay_invoice(nwc_string, invoices[index % len(invoices)])
+        if result.get("error"):
+            raise RuntimeError(result["error"])
+
+    async def publish(index: int):
+        tags = [Tag.custom(TagKind.TITLE(), [f"Load test listing {index}"])]
+        result = await publisher.publish_event(f"Load test listing {index}", tags)
+        if not result["delivery"]["quorum_met"]:
+            raise RuntimeError(result["delivery"]["rejected"])
+
+    operations = {"create": create, "lookup": lookup, "pay": pay, "publish": publish}
+    for name in args.scenarios:
+        if name in ("lookup", "pay") and not invoices:
+            await measure("create", create, args.requests, args.concurrency)
+        await measure(name, operations[name], args.requests, args.concurrency)
+
+    await publisher.close()
+    await nwc_client.close()
+    await http_client.close()
+    await relay.stop()
+    mongodb.close_mongo_connection()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--wallet-latency-ms", type=float, default=50)
+    parser.add_argument("--relay-latency-ms", type=float, default=0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    asyncio.run(run(parser.parse_args()))
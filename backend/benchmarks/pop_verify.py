@@ -0,0 +1,75 @@
+"""
+Microbenchmark of proof-of-purchase verification with the native libsecp256k1 Schnorr
+binding, one signature at a time over proofs from a few hundred sellers.
+
+"ecdsa" is the previous pure-Python ECDSA check of the same message, for reference;
+it is only run when the ecdsa package is installed.
+
+    python benchmarks/pop_verify.py --proofs 5000 --sellers 200
+"""
+import argparse
+import os
+import sys
+import time
+from uuid import uuid4
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from secp256k1 import PrivateKey  # noqa: E402
+
+from models.pop import ProofOfPurchase  # noqa: E402
+from services.pop_service import PoPService, create_signature, verify_signature  # noqa: E402
+
+
+def make_proofs(proofs: int, sellers: int):
+    seller_keys = [PrivateKey() for _ in range(sellers)]
+    buyer = PrivateKey().pubkey.serialize().hex()[2:]
+    pops = []
+    for index in range(proofs):
+        seller = seller_keys[index % sellers]
+        pop = ProofOfPurchase(
+            transaction_id=str(uuid4()),
+            listing_id=str(uuid4()),
+            buyer_pubkey=buyer,
+            seller_pubkey=seller.pubkey.serialize().hex()[2:],
+            seller_signature="",
+        )
+        pop.seller_signature = create_signature(seller.serialize(), PoPService._message(pop))
+        pops.append(pop)
+    return seller_keys, pops
+
+
+def measure(label: str, func, count: int):
+    started = time.perf_counter()
+    valid = func()
+    elapsed = time.perf_counter() - started
+    assert all(valid), f"{label}: not every proof verified"
+    print(f"{label:7} {elapsed / count * 1e6:9.1f} us/proof  {count / elapsed:10.0f} verifications/s")
+    return elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--proofs", type=int, default=5000)
+    parser.add_argument("--sellers", type=int, default=200)
+    args = parser.parse_args()
+
+    seller_keys, pops = make_proofs(args.proofs, args.sellers)
+    messages = [(pop.seller_pubkey, pop.seller_signature, PoPService._message(pop)) for pop in pops]
+
+    single = measure("single", lambda: [verify_signature(*message) for message in messages], args.proofs)
+
+    try:
+        from ecdsa import SigningKey
+        from ecdsa.curves import SECP256k1
+    except ImportError:
+        sys.exit(0)
+    import hashlib
+    count = min(args.proofs, 500)
+    signed = []
+    for index, (_, _, message) in enumerate(messages[:count]):
+        signing_key = SigningKey.from_string(seller_keys[index % args.sellers].private_key, curve=SECP256k1)
+        message_hash = hashlib.sha256(message.encode("utf-8")).digest()
+        signed.append((signing_key.get_verifying_key(), signing_key.sign(message_hash), message_hash))
+    slow = measure("ecdsa", lambda: [key.verify(signature, message_hash) for key, signature, message_hash in signed], count)
+    print(f"speedup {slow / count / (single / args.proofs):.1f}x")
@@ -0,0 +1,109 @@
+"""
+End-to-end benchmark of ReputationScoringService.recompute over synthetic reviews:
+the $group pass in MongoDB, the NumPy scoring and the bulk write of the scores.
+
+"stream" is the previous approach for reference: every review document is read into
+Python and the sellers are summed in a per-review loop (the write is not included).
+
+Reviews are inserted into the configured MongoDB, so point it at a scratch database:
+
+    MONGODB_URL=mongodb://localhost:27017 DB_NAME=loadtest \\
+        python benchmarks/reputation_scoring.py --reviews 1000000 --sellers 50000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+from bson import Binary  # noqa: E402
+
+from database import mongodb  # noqa: E402
+from services.reputation_scoring import (  # noqa: E402
+    reputation_scoring_service, REPUTATION_HALF_LIFE_DAYS, REPUTATION_PRIOR_WEIGHT,
+)
+from services.review_service import review_service  # noqa: E402
+
+YEAR_SECONDS = 365 * 86400
+INSERT_BATCH_SIZE = 10000
+
+
+async def insert_reviews(reviews: int, sellers: int, seed: int = 1):
+    rng = np.random.default_rng(seed)
+    pubkeys = rng.bytes(32 * sellers)
+    pubkeys = [Binary(pubkeys[i * 32:(i + 1) * 32]) for i in range(sellers)]
+    # Skewed like a real marketplace: a few sellers get most of the reviews
+    owners = np.minimum(rng.zipf(1.3, reviews) - 1, sellers - 1).tolist()
+    ratings = rng.integers(1, 6, reviews).tolist()
+    ages = rng.uniform(0, 3 * YEAR_SECONDS, reviews).tolist()
+    now = datetime.utcnow()
+
+    collection = mongodb.db[review_service.collection_name]
+    await collection.drop()
+    await mongodb.db[review_service.reputation_collection_name].drop()
+    for start in range(0, reviews, INSERT_BATCH_SIZE):
+        await collection.insert_many([
+            {
+                "seller_pubkey": pubkeys[owners[i]],
+                "rating": ratings[i],
+                "created_at": now - timedelta(seconds=ages[i]),
+                "verified": True,
+            }
+            for i in range(start, min(start + INSERT_BATCH_SIZE, reviews))
+        ], ordered=False)
+
+
+async def stream() -> int:
+    now = datetime.utcnow()
+    cursor = mongodb.db[review_service.collection_name].find(
+        {"verified": True}, {"_id": 0, "seller_pubkey": 1, "rating": 1, "created_at": 1}
+    ).batch_size(INSERT_BATCH_SIZE)
+    totals = {}
+    async for review in cursor:
+        age_days = max((now - review["created_at"]).total_seconds(), 0) / 86400
+        weight = 0.5 ** (age_days / REPUTATION_HALF_LIFE_DAYS)
+        total = totals.setdefault(bytes(review["seller_pubkey"]), [0, 0, 0.0, 0.0])
+        total[0] += 1
+        total[1] += review["rating"]
+        total[2] += weight
+        total[3] += weight * review["rating"]
+    prior_mean = sum(total[1] for total in totals.values()) / sum(total[0] for total in totals.values())
+    prior = REPUTATION_PRIOR_WEIGHT * prior_mean
+    scores = {
+        seller: ((prior + total[1]) / (REPUTATION_PRIOR_WEIGHT + total[0]),
+                 (prior + total[3]) / (REPUTATION_PRIOR_WEIGHT + total[2]))
+        for seller, total in totals.items()
+    }
+    return len(scores)
+
+
+async def measure(label: str, operation, reviews: int) -> float:
+    started = time.perf_counter()
+    sellers = await operation()
+    elapsed = time.perf_counter() - started
+    print(f"{label:12} {elapsed:8.3f} s  {reviews / elapsed:12.0f} reviews/s  {sellers} sellers")
+    return elapsed
+
+
+async def main(args):
+    mongodb.connect_to_mongo()
+    try:
+        await insert_reviews(args.reviews, args.sellers)
+        fast = await measure("recompute", reputation_scoring_service.recompute, args.reviews)
+        if not args.skip_stream:
+            slow = await measure("stream", stream, args.reviews)
+            print(f"speedup      {slow / fast:8.1f}x")
+    finally:
+        mongodb.close_mongo_connection()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reviews", type=int, default=1_000_000)
+    parser.add_argument("--sellers", type=int, default=50_000)
+    parser.add_argument("--skip-stream", action="store_true")
+    asyncio.run(main(parser.parse_args()))
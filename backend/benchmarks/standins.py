@@ -0,0 +1,245 @@
+"""
+Local stand-ins for load testing without live infrastructure:
+
+- StandInRelay: an in-process NIP-01 relay (REQ/EVENT/EOSE/OK/CLOSE) on a websocket port.
+- StandInWallet: a scripted NIP-47 wallet service listening on that relay. It answers
+  kind 23194 requests after a configurable latency, fails a configurable share of them,
+  and also serves LNURL-pay for lightning addresses via lnurl_transport().
+
+Signatures are not verified by the relay; the point is to exercise our client code.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import random
+import time
+from typing import Callable, Dict, List, Optional
+
+import httpx
+from bech32 import CHARSET, bech32_create_checksum, convertbits
+from secp256k1 import PrivateKey
+from websockets.asyncio.server import serve
+
+from services.bolt11 import decode_bolt11
+from services.nwc_client import NWC_REQUEST_KIND, NWC_RESPONSE_KIND
+from services.nwc_session import NWCSession
+
+
+def _matches(subscription_filter: dict, event: dict) -> bool:
+    if "ids" in subscription_filter and event["id"] not in subscription_filter["ids"]:
+        return False
+    if "kinds" in subscription_filter and event["kind"] not in subscription_filter["kinds"]:
+        return False
+    if "authors" in subscription_filter and event["pubkey"] not in subscription_filter["authors"]:
+        return False
+    if "since" in subscription_filter and event["created_at"] < subscription_filter["since"]:
+        return False
+    if "until" in subscription_filter and event["created_at"] > subscription_filter["until"]:
+        return False
+    for key, values in subscription_filter.items():
+        if key.startswith("#"):
+            tag_values = {tag[1] for tag in event.get("tags", []) if len(tag) >= 2 and tag[0] == key[1:]}
+            if not tag_values & set(values):
+                return False
+    return True
+
+
+class StandInRelay:
+    """In-memory NIP-01 relay; in-process listeners see every accepted event"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.events: List[dict] = []
+        self.listeners: List[Callable[[dict], None]] = []
+        self._subscriptions: Dict[tuple, List[dict]] = {}
+        self._server = None
+
+    @property
+    def url(self) -> str:
+        return f"ws://{self.host}:{self.port}"
+
+    async def start(self):
+        self._server = await serve(self._handle, self.host, self.port, max_size=2 ** 22)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def publish(self, event: dict):
+        self.events.append(event)
+        for (websocket, subscription_id), filters in list(self._subscriptions.items()):
+            if any(_matches(f, event) for f in filters):
+                try:
+                    await websocket.send(json.dumps(["EVENT", subscription_id, event]))
+                except Exception:
+                    self._subscriptions.pop((websocket, subscription_id), None)
+        for listener in self.listeners:
+            listener(event)
+
+    async def _handle(self, websocket):
+        try:
+            async for raw_message in websocket:
+                message = json.loads(raw_message)
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                if message[0] == "EVENT":
+                    await websocket.send(json.dumps(["OK", message[1]["id"], True, ""]))
+                    await self.publish(message[1])
+                elif message[0] == "REQ":
+                    filters = message[2:]
+                    self._subscriptions[(websocket, message[1])] = filters
+                    for event in self.events:
+                        if any(_matches(f, event) for f in filters):
+                            await websocket.send(json.dumps(["EVENT", message[1], event]))
+                    await websocket.send(json.dumps(["EOSE", message[1]]))
+                elif message[0] == "CLOSE":
+                    self._subscriptions.pop((websocket, message[1]), None)
+        finally:
+            for key in [key for key in self._subscriptions if key[0] is websocket]:
+                del self._subscriptions[key]
+
+
+def _int_to_words(value: int, length: int) -> List[int]:
+    return [(value >> (5 * (length - 1 - i))) & 31 for i in range(length)]
+
+
+def make_bolt11(amount_msat: int, payment_hash: bytes, expiry: int = 3600) -> str:
+    """Build a BOLT 11 string with a valid checksum (and a dummy signature)"""
+    hrp = f"lnbc{amount_msat * 10}p"
+    data = _int_to_words(int(time.time()), 7)
+    hash_words = convertbits(payment_hash, 8, 5, True)
+    data += [CHARSET.index("p")] + _int_to_words(len(hash_words), 2) + hash_words
+    data += [CHARSET.index("x")] + _int_to_words(4, 2) + _int_to_words(expiry, 4)
+    data += [0] * 104
+    data += bech32_create_checksum(hrp, data)
+    return hrp + "1" + "".join(CHARSET[word] for word in data)
+
+
+class StandInWallet:
+    """
+    Scripted NWC wallet service. Invoices it issues (through make_invoice or LNURL) are
+    settled when some client pays them; latency and failure_rate apply to every request.
+    """
+
+    def __init__(self, relay: StandInRelay, latency: float = 0.05, failure_rate: float = 0.0):
+        self.relay = relay
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.private_key = PrivateKey()
+        self.pubkey = self.private_key.pubkey.serialize().hex()[2:]
+        # payment hash -> transaction in NIP-47 shape
+        self.transactions: Dict[str, dict] = {}
+        self._preimages: Dict[str, str] = {}
+        self._sessions: Dict[str, NWCSession] = {}
+        self._tasks = set()
+        relay.listeners.append(self._on_event)
+
+    def connection_string(self, app_secret: Optional[str] = None) -> str:
+        app_secret = app_secret or PrivateKey().serialize()
+        relay = self.relay.url.replace(":", "%3A").replace("/", "%2F")
+        return f"nostr+walletconnect://{self.pubkey}?relay={relay}&secret={app_secret}"
+
+    def issue_invoice(self, amount_msat: int, description: str = "") -> str:
+        preimage = os.urandom(32)
+        payment_hash = hashlib.sha256(preimage).digest()
+        invoice = make_bolt11(amount_msat, payment_hash)
+        self._preimages[payment_hash.hex()] = preimage.hex()
+        self.transactions[payment_hash.hex()] = {
+            "type": "incoming",
+            "invoice": invoice,
+            "description": description,
+            "payment_hash": payment_hash.hex(),
+            "amount": amount_msat,
+            "created_at": int(time.time()),
+            "settled_at": None,
+        }
+        return invoice
+
+    def lnurl_transport(self) -> httpx.MockTransport:
+        """httpx transport answering LNURL-pay discovery and callbacks for any lightning address"""
+        def handler(request: httpx.Request) -> httpx.Response:
+            if "/.well-known/lnurlp/" in request.url.path:
+                return httpx.Response(200, json={
+                    "tag": "payRequest",
+                    "callback": f"https://{request.url.host}/lnurlp/callback",
+                    "minSendable": 1000,
+                    "maxSendable": 10 ** 11,
+                    "metadata": "[]",
+                })
+            amount = int(request.url.params["amount"])
+            return httpx.Response(200, json={"pr": self.issue_invoice(amount), "routes": []})
+        return httpx.MockTransport(handler)
+
+    def _session(self, app_pubkey: str) -> NWCSession:
+        # A session seen from the wallet's side: same shared key, signs with the wallet key
+        session = self._sessions.get(app_pubkey)
+        if session is None:
+            session = self._sessions[app_pubkey] = NWCSession(
+                f"nostr+walletconnect://{app_pubkey}?relay=x&secret={self.private_key.serialize()}"
+            )
+        return session
+
+    def _on_event(self, event: dict):
+        if event["kind"] != NWC_REQUEST_KIND or ["p", self.pubkey] not in event.get("tags", []):
+            return
+        task = asyncio.create_task(self._answer(event))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _answer(self, event: dict):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        session = self._session(event["pubkey"])
+        request = json.loads(session.decrypt(event["content"]))
+        method, params = request["method"], request.get("params") or {}
+
+        if random.random() < self.failure_rate:
+            response = {"result_type": method, "error": {"code": "INTERNAL", "message": "scripted failure"}}
+        else:
+            response = {"result_type": method, "result": self._handle(method, params)}
+
+        await self.relay.publish(session.sign_event({
+            "kind": NWC_RESPONSE_KIND,
+            "content": session.encrypt(json.dumps(response)),
+            "tags": [["p", event["pubkey"]], ["e", event["id"]]],
+            "created_at": int(time.time()),
+            "pubkey": self.pubkey,
+        }))
+
+    def _handle(self, method: str, params: dict) -> dict:
+        if method == "get_info":
+            return {"alias": "stand-in", "methods": ["pay_invoice", "make_invoice", "lookup_invoice",
+                                                     "list_transactions", "get_balance", "get_info"]}
+        if method == "get_balance":
+            return {"balance": 10 ** 11}
+        if method == "make_invoice":
+            invoice = self.issue_invoice(params["amount"], params.get("description", ""))
+            return self.transactions[self._hash_of(invoice)]
+        if method == "pay_invoice":
+            payment_hash = self._hash_of(params["invoice"])
+            transaction = self.transactions.get(payment_hash)
+            if transaction is not None:
+                transaction["settled_at"] = int(time.time())
+                transaction["preimage"] = self._preimages[payment_hash]
+            return {"preimage": self._preimages.get(payment_hash, "00" * 32), "fees_paid": 0}
+        if method == "lookup_invoice":
+            payment_hash = params.get("payment_hash") or self._hash_of(params["invoice"])
+            return self.transactions.get(payment_hash) or {"payment_hash": payment_hash, "settled_at": None}
+        if method == "list_transactions":
+            since = params.get("from", 0)
+            offset, limit = params.get("offset", 0), params.get("limit", 50)
+            transactions = sorted(
+                (t for t in self.transactions.values() if t["created_at"] >= since),
+                key=lambda t: t["created_at"], reverse=True
+            )
+            return {"transactions": transactions[offset:offset + limit]}
+        return {}
+
+    @staticmethod
+    def _hash_of(invoice: str) -> str:
+        return decode_bolt11(invoice).payment_hash
@@ -1,3 +1,4 @@
+import asyncio
 import json
 from contextlib import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
@@ -8,9 +9,22 @@ from starlette.types import Message
 
 from routers import invoices
 from database import mongodb
-from routers import listings, users, auth, reviews
+from routers import listings, users, auth, reviews, diagnostics
 from services.nostr_service import nostr_service
 from services.user_service import user_service
+from services.listing_service import listing_service
+from services.review_service import review_service
+from services.invoice_service import invoice_service
+from services.migration_service import migration_service
+from services.challenge_auth_service import challenge_auth_service
+from services.token_service import token_service
+from services.nwc_client import nwc_client
+from services.http_client import http_client
+from services.settlement_watcher import settlement_watcher
+from services.payment_job_service import payment_job_service
+from services.reconciliation_service import reconciliation_service
+from services.ingestion_service import ingestion_service
+from services.reputation_scoring import reputation_scoring_service
 
 
 # Create a lifespan context manager
@@ -19,6 +33,29 @@ async def lifespan(app: FastAPI):
     # Startup: Connect to the database and Nostr
     mongodb.connect_to_mongo()
     print("Connected to MongoDB")
+    http_client.start()
+
+    try:
+        await user_service.ensure_indexes()
+        await listing_service.ensure_indexes()
+        await review_service.ensure_indexes()
+        await invoice_service.ensure_indexes()
+        await nostr_service.ensure_indexes()
+        await challenge_auth_service.ensure_indexes()
+        await payment_job_service.ensure_indexes()
+        await token_service.load_revocations()
+    except Exception as e:
+        print(f"Error creating indexes: {e}")
+
+    # Seller aggregates are rebuilt, if needed, before any review is written
+    await migration_service.migrate_reviews()
+
+    # Convert legacy string pubkeys and ids without blocking startup
+    migration_task = asyncio.create_task(migration_service.run())
+    reconciliation_task = asyncio.create_task(reconciliation_service.run())
+    settlement_sweep_task = asyncio.create_task(settlement_watcher.run())
+    reputation_scoring_task = asyncio.create_task(reputation_scoring_service.run())
+    delivery_retry_task = asyncio.create_task(nostr_service.run_delivery_retries())
 
     # Initialize Nostr connection
     try:
@@ -32,16 +69,30 @@ async def lifespan(app: FastAPI):
         print(f"❌ Error connecting to Nostr relays: {e}")
         print("Continuing without Nostr integration")
 
+    # Index marketplace listings published by other clients
+    ingestion_task = asyncio.create_task(ingestion_service.run())
+
     yield  # This is where FastAPI runs and serves requests
 
     # Shutdown: Close connections
     print("Shutting down...")
+    migration_task.cancel()
+    reconciliation_task.cancel()
+    settlement_sweep_task.cancel()
+    reputation_scoring_task.cancel()
+    delivery_retry_task.cancel()
+    ingestion_task.cancel()
     try:
         await nostr_service.close()
         print("Nostr connections closed")
     except Exception as e:
         print(f"Error closing Nostr connection: {e}")
 
+    await payment_job_service.close()
+    await settlement_watcher.close()
+    await nwc_client.close()
+    await http_client.close()
+
     mongodb.close_mongo_connection()
     print("All connections closed")
 
@@ -86,6 +137,7 @@ app.include_router(auth.router)
 app.include_router(reviews.router)
 
 app.include_router(invoices.router)
+app.include_router(diagnostics.router)
 
 
 @app.get("/")
@@ -0,0 +1,28 @@
+from enum import Enum
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+
+class RelayState(str, Enum):
+    HEALTHY = "healthy"
+    PROBATION = "probation"
+    DEGRADED = "degraded"
+
+class RelayHealthStatus(BaseModel):
+    url: str
+    state: RelayState
+    score: float
+    latency_ms: Optional[float] = None
+    error_rate: float
+    samples: int
+    failures: int
+    rate_limit_notices: int
+    rate_limited: bool
+    retry_in_seconds: Optional[float] = None
+    last_error: Optional[str] = None
+
+class RelayDiagnostics(BaseModel):
+    write_relays: List[RelayHealthStatus]
+    read_relays: List[RelayHealthStatus]
+    quorum: int
@@ -1,4 +1,6 @@
 from decimal import Decimal
+from enum import Enum
+from typing import Optional
 
 from pydantic import BaseModel
 from datetime import datetime
@@ -10,4 +12,45 @@ class Invoice(BaseModel):
     payment_hash: str
     amount: int
     fees_paid: int
-    created_at: int
\ No newline at end of file
+    created_at: int
+
+class InvoiceState(str, Enum):
+    PENDING = "pending"
+    SETTLED = "settled"
+    EXPIRED = "expired"
+
+class InvoiceRecord(BaseModel):
+    id: str
+    payment_hash: str
+    invoice: str
+    listing_id: Optional[str] = None
+    seller_pubkey: Optional[str] = None
+    buyer_pubkey: Optional[str] = None
+    amount: int
+    description: str = ""
+    state: InvoiceState = InvoiceState.PENDING
+    created_at: datetime
+    updated_at: datetime
+    expires_at: datetime
+    settled_at: Optional[datetime] = None
+
+class PaymentJobState(str, Enum):
+    QUEUED = "queued"
+    PAYING = "paying"
+    CONFIRMING = "confirming"
+    SETTLED = "settled"
+    FAILED = "failed"
+
+class PaymentJobCreate(BaseModel):
+    nwc_buyer_string: str
+    invoicestr: str
+
+class PaymentJob(BaseModel):
+    id: str
+    state: PaymentJobState
+    payment_hash: str
+    listing_id: Optional[str] = None
+    preimage: Optional[str] = None
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
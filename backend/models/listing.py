@@ -15,6 +15,7 @@ class ListingCondition(str, Enum):
 class ListingStatus(str, Enum):
     ACTIVE = "active"
     ENDED = "ended"
+    SOLD = "sold"
 
 class Image(BaseModel):
     url: HttpUrl
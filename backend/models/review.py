@@ -1,3 +1,7 @@
+from datetime import datetime
+from enum import Enum
+from typing import Dict, List, Optional
+
 from pydantic import BaseModel
 
 class ReviewCreate(BaseModel):
@@ -6,8 +10,44 @@ class ReviewCreate(BaseModel):
     comment: str
 
 class ReviewResponse(BaseModel):
+    id: Optional[str] = None
     seller_pubkey: str
+    reviewer_pubkey: Optional[str] = None
     rating: int
     comment: str
     transaction_id: str
-    verified: bool
\ No newline at end of file
+    verified: bool
+    created_at: Optional[datetime] = None
+
+class ReviewSort(str, Enum):
+    NEWEST = "newest"
+    OLDEST = "oldest"
+    HIGHEST = "highest"
+    LOWEST = "lowest"
+
+class TrustScoreKind(str, Enum):
+    # Plain average rating, always current
+    MEAN = "mean"
+    # Average pulled towards the marketplace mean until a seller has enough reviews
+    BAYESIAN = "bayesian"
+    # Bayesian average with older reviews weighing less
+    DECAYED = "decayed"
+
+class ReviewPage(BaseModel):
+    items: List[ReviewResponse]
+    # Pass as cursor to get the next page; None on the last page
+    next_cursor: Optional[str] = None
+
+class SellerReputation(BaseModel):
+    seller_pubkey: str
+    review_count: int = 0
+    rating_sum: int = 0
+    average_rating: float = 0.0
+    # rating ("1".."5") -> number of reviews
+    histogram: Dict[str, int] = {}
+    last_review_at: Optional[datetime] = None
+    # Written by the periodic scoring job; review_count may have moved on since
+    bayesian_score: Optional[float] = None
+    decayed_score: Optional[float] = None
+    scored_review_count: Optional[int] = None
+    scored_at: Optional[datetime] = None
@@ -1,8 +1,10 @@
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 from uuid import UUID
 
+from models.review import SellerReputation
+
 class UserBase(BaseModel):
     pass
 class UserCreate(UserBase):
@@ -25,4 +27,20 @@ class UserProfileResponse(BaseModel):
     created_at: datetime
 
     class Config:
-        orm_mode = True
\ No newline at end of file
+        orm_mode = True
+
+class SellerSummary(BaseModel):
+    id: str
+    nostr_public_key: str
+    created_at: datetime
+    username: str = ""
+    display_name: str = ""
+    about: str = ""
+    active_listings: int = 0
+    sold_listings: int = 0
+    reputation: SellerReputation
+
+class SellerPage(BaseModel):
+    items: List[SellerSummary]
+    # Pass as cursor to get the next page; None on the last page
+    next_cursor: Optional[str] = None
@@ -3,6 +3,7 @@ from pydantic import BaseModel
 import base64
 from typing import Optional
 from services.challenge_auth_service import challenge_auth_service
+from auth.dependencies import rate_limit
 
 router = APIRouter(prefix="/auth", tags=["authentication"])
 
@@ -22,34 +23,31 @@ class VerifyResponse(BaseModel):
     token: Optional[str] = None
 
 
-@router.get("/challenge", response_model=ChallengeResponse)
+@router.get("/challenge", response_model=ChallengeResponse, dependencies=[Depends(rate_limit("auth_challenge"))])
 async def get_challenge(public_key: str = Query(...)):
-    session_id, challenge = await challenge_auth_service.get_challenge(public_key)
+    try:
+        session_id, challenge = await challenge_auth_service.get_challenge(public_key)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     return {"session_id": session_id, "challenge": challenge}
 
 
-@router.post("/verify", response_model=VerifyResponse)
+@router.post("/verify", response_model=VerifyResponse, dependencies=[Depends(rate_limit("auth_verify"))])
 async def verify_signature(req: VerifyRequest):
     try:
         signature_bytes = base64.b64decode(req.signature_b64)
 
-        # Verify the signature with the challenge
-        is_valid = await challenge_auth_service.verify_challenge_signature(req.session_id, signature_bytes)
+        # Verify the signature with the challenge and obtain the bearer token
+        token = await challenge_auth_service.authenticate(req.session_id, signature_bytes)
 
-        if not is_valid:
+        if not token:
             return {"authenticated": False, "token": None}
-        return {"authenticated": True, "token": req.session_id}
+        return {"authenticated": True, "token": token}
     except Exception as e:
         return {"authenticated": False, "token": None}
 
 
-@router.get("/validate")
-async def validate_token(
-        token: str = Query(None, alias="session-token"),
-        token_header: str = Header(None, alias="session-token"),
-        authorization: str = Header(None)
-):
-    """Validates if a token is still valid"""
+def _extract_token(token: Optional[str], token_header: Optional[str], authorization: Optional[str]) -> str:
     # Try to get the token from various sources
     actual_token = token or token_header or None
 
@@ -60,10 +58,33 @@ async def validate_token(
 
     if not actual_token:
         raise HTTPException(status_code=422, detail="Token is required")
+    return actual_token
+
+
+@router.get("/validate")
+async def validate_token(
+        token: str = Query(None, alias="session-token"),
+        token_header: str = Header(None, alias="session-token"),
+        authorization: str = Header(None)
+):
+    """Validates if a token is still valid"""
+    actual_token = _extract_token(token, token_header, authorization)
 
     is_valid = await challenge_auth_service.is_session_valid(actual_token)
 
     if not is_valid:
         raise HTTPException(status_code=401, detail="Invalid or expired token")
 
-    return {"valid": True}
\ No newline at end of file
+    return {"valid": True}
+
+
+@router.post("/logout")
+async def logout(
+        token: str = Query(None, alias="session-token"),
+        token_header: str = Header(None, alias="session-token"),
+        authorization: str = Header(None)
+):
+    """Revokes a session token"""
+    actual_token = _extract_token(token, token_header, authorization)
+    await challenge_auth_service.revoke_session(actual_token)
+    return {"logged_out": True}
\ No newline at end of file
@@ -0,0 +1,15 @@
+from fastapi import APIRouter
+
+from models.diagnostics import RelayDiagnostics
+from services.nostr_service import nostr_service
+
+
+router = APIRouter(
+    prefix="/diagnostics",
+    tags=["diagnostics"],
+)
+
+@router.get("/relays", response_model=RelayDiagnostics)
+async def get_relay_health():
+    """Rolling latency, error rate, rate-limit notices and probation state of every relay"""
+    return nostr_service.relay_diagnostics()
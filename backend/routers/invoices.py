@@ -1,13 +1,13 @@
 from decimal import Decimal
 
 from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from uuid import UUID, uuid4
 from fastapi import APIRouter, HTTPException
 
-from models.invoice import Invoice
+from models.invoice import Invoice, InvoiceRecord, PaymentJob, PaymentJobCreate
 from datetime import datetime
-from auth.dependencies import get_current_user
+from auth.dependencies import get_current_user, get_optional_user, rate_limit
 from models.listing import ListingCreate, ListingResponse, ListingUpdate
 from pydantic import BaseModel
 from services.listing_service import listing_service
@@ -15,7 +15,9 @@ from models.invoice import Invoice
 
 from services.invoice_service import invoice_service
 
-from services.invoice_service import InvoiceService
+from services.invoice_service import InvoiceService, InvoiceAmountError
+from services.settlement_watcher import settlement_watcher, SETTLEMENT_WAIT_MAX_SECONDS
+from services.payment_job_service import payment_job_service
 
 
 router = APIRouter(
@@ -35,25 +37,90 @@ async def get_nwc_info(nwc_string: str):
         # Handle any errors that may occur
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.post("/create_invoice/")
-async def create_invoice(seller_ln_address: str, amount: int, description: str):
+@router.post("/create_invoice/", dependencies=[Depends(rate_limit("invoice_create"))])
+async def create_invoice(seller_ln_address: str,
+                         amount: int,
+                         description: str,
+                         listing_id: Optional[str] = None,
+                         current_user: Optional[Dict[str, Any]] = Depends(get_optional_user)):
+    # The buyer recorded for a listing is the logged-in user, never a client-supplied pubkey
+    if listing_id is not None and current_user is None:
+        raise HTTPException(status_code=401, detail="Log in to buy a listing")
+    buyer_pubkey = current_user["nostr_public_key"] if current_user else None
     try:
 
-        new_invoice = await invoice_service.create_invoice(seller_ln_address, amount, description)
+        new_invoice = await invoice_service.create_invoice(
+            seller_ln_address, amount, description, listing_id=listing_id, buyer_pubkey=buyer_pubkey
+        )
 
         return new_invoice['invoice']
+    except InvoiceAmountError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error creating zap invoice: {e}")
 
 
+@router.get("/listing/{listing_id}", response_model=List[InvoiceRecord])
+async def get_listing_invoices(listing_id: str):
+    """Get the ledger entries of the invoices issued for a listing."""
+    try:
+        return await invoice_service.get_invoices_for_listing(listing_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/listing/{listing_id}/wait", response_model=ListingResponse)
+async def wait_for_listing_settlement(listing_id: str, timeout: float = SETTLEMENT_WAIT_MAX_SECONDS):
+    """
+    Long-poll until the listing's invoice settles (the listing is no longer active)
+    or the timeout passes, then return the listing.
+    """
+    try:
+        listing = await settlement_watcher.wait_for_listing(listing_id, timeout)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if listing is None:
+        raise HTTPException(status_code=404, detail="Listing not found")
+    return listing
+
+
 @router.get("/check_invoice_status/")
 async def check_invoice_status(nwc_string:str,invoicestr: str):
     """Get Lightning Network invoice status."""
     result = await invoice_service.check_invoice_status(nwc_string,invoicestr)
+    await settlement_watcher.track(nwc_string, invoicestr)
     return result
 
-@router.get("/pay_invoice/")
+@router.post("/jobs/", response_model=PaymentJob, status_code=202,
+             dependencies=[Depends(rate_limit("invoice_pay"))])
+async def submit_payment_job(job: PaymentJobCreate):
+    """Queue an invoice payment; poll /invoices/jobs/{job_id} for the outcome."""
+    try:
+        return await payment_job_service.submit(job.nwc_buyer_string, job.invoicestr)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/jobs/{job_id}", response_model=PaymentJob)
+async def get_payment_job(job_id: str, timeout: float = 0):
+    """
+    Get a payment job. With a timeout, long-poll until the job changes state
+    (queued, paying, confirming, settled or failed).
+    """
+    if timeout > 0:
+        job = await payment_job_service.wait_for_job(job_id, timeout)
+    else:
+        job = await payment_job_service.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Payment job not found")
+    return job
+
+
+@router.get("/pay_invoice/", response_model=PaymentJob, status_code=202,
+            dependencies=[Depends(rate_limit("invoice_pay"))])
 async def pay_invoice(nwc_buyer_string:str,invoicestr:str):
-    await invoice_service.try_to_pay_invoice(nwc_buyer_string, invoicestr)
-    result = await invoice_service.check_payment(nwc_buyer_string,invoicestr)
-    return result
+    """Deprecated alias of POST /invoices/jobs/, returns the queued payment job."""
+    try:
+        return await payment_job_service.submit(nwc_buyer_string, invoicestr)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
@@ -1,8 +1,10 @@
+import json
+
 from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks
 from typing import List, Dict, Any
 from uuid import UUID, uuid4
 
-from auth.dependencies import get_current_user
+from auth.dependencies import get_current_user, rate_limit
 from models.listing import ListingCreate, ListingResponse, ListingUpdate
 from services.listing_service import listing_service
 
@@ -12,7 +14,7 @@ router = APIRouter(
     responses={404: {"description": "Listing not found"}},
 )
 
-@router.post("/", response_model=ListingResponse)
+@router.post("/", response_model=ListingResponse, dependencies=[Depends(rate_limit("listing_create"))])
 async def create_listing(
     listing: ListingCreate,
 ):
@@ -77,6 +79,25 @@ async def get_listing(listing_id: str, background_tasks: BackgroundTasks):
     return listing
 
 
+@router.get("/{listing_id}/event")
+async def get_listing_event(listing_id: str):
+    """
+    Get the listing's NIP-99 event as currently published on the relays,
+    so clients can check its signature themselves
+    """
+    listing = await listing_service.get_listing(listing_id)
+    if not listing:
+        raise HTTPException(status_code=404, detail="Listing not found")
+
+    try:
+        event = await listing_service.fetch_listing_event(listing)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error reading listing event: {str(e)}")
+    if event is None:
+        raise HTTPException(status_code=404, detail="Listing event not found on the relays")
+    return json.loads(event.as_json())
+
+
 @router.put("/{listing_id}", response_model=ListingResponse)
 async def update_listing(listing_id: str, listing_update: ListingUpdate):
     """
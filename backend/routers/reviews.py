@@ -1,7 +1,9 @@
-from fastapi import APIRouter, HTTPException, Depends, Body
-from typing import List, Dict, Any
-from models.review import ReviewCreate, ReviewResponse
+from fastapi import APIRouter, HTTPException, Depends, Body, Query
+from typing import List, Dict, Any, Optional
+from models.review import ReviewCreate, ReviewResponse, ReviewPage, ReviewSort, SellerReputation, TrustScoreKind
+from services.review_service import REVIEW_PAGE_DEFAULT_SIZE, REVIEW_PAGE_MAX_SIZE
 from services.review_service import review_service
+from services.reputation_scoring import reputation_scoring_service
 from auth.dependencies import get_current_user
 
 router = APIRouter(
@@ -24,24 +26,41 @@ async def create_review(review: ReviewCreate, current_user: Dict[str, Any] = Dep
 @router.delete("/{review_id}", status_code=204)
 async def delete_review(review_id: str, current_user: Dict[str, Any] = Depends(get_current_user)):
     try:
-        result = await review_service.delete_review(review_id, current_user["pubkey"])
-        if not result:
-            raise HTTPException(status_code=404, detail="review not found or not authorized to delete")
+        result = await review_service.delete_review(review_id, current_user["nostr_public_key"])
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"error deleting review: {str(e)}")
+    if not result:
+        raise HTTPException(status_code=404, detail="review not found or not authorized to delete")
 
-@router.get("/seller/{seller_pubkey}", response_model=List[ReviewResponse])
-async def get_seller_reviews(seller_pubkey: str):
+@router.get("/seller/{seller_pubkey}", response_model=ReviewPage)
+async def get_seller_reviews(
+    seller_pubkey: str,
+    limit: int = Query(REVIEW_PAGE_DEFAULT_SIZE, ge=1, le=REVIEW_PAGE_MAX_SIZE),
+    cursor: Optional[str] = None,
+    sort: ReviewSort = ReviewSort.NEWEST,
+    rating: Optional[int] = Query(None, ge=1, le=5),
+):
+    """
+    A page of the seller's verified reviews; pass next_cursor back as cursor
+    (with the same sort) for the following page
+    """
     try:
-        reviews = await review_service.get_reviews_for_seller(seller_pubkey)
-        return reviews
+        return await review_service.get_reviews_for_seller(seller_pubkey, limit, cursor, sort, rating)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving reviews: {str(e)}")
 
+@router.get("/reputation/{seller_pubkey}", response_model=SellerReputation)
+async def get_seller_reputation(seller_pubkey: str):
+    try:
+        return await review_service.get_reputation(seller_pubkey)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"error reading reputation: {str(e)}")
+
 @router.get("/trust-score/{seller_pubkey}", response_model=float)
-async def get_seller_trust_score(seller_pubkey: str):
+async def get_seller_trust_score(seller_pubkey: str, score: TrustScoreKind = TrustScoreKind.MEAN):
     try:
-        score = await review_service.calculate_trust_score(seller_pubkey)
-        return score
+        return await reputation_scoring_service.get_trust_score(seller_pubkey, score)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"error calculating trust score: {str(e)}")
\ No newline at end of file
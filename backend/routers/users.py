@@ -2,8 +2,8 @@ from typing import Optional, Any, Dict
 
 from fastapi import APIRouter, HTTPException, status, Query, Depends
 
-from models.user import UserResponse, UserProfileResponse
-from services.user_service import user_service
+from models.user import UserResponse, UserProfileResponse, SellerPage
+from services.user_service import user_service, SELLER_PAGE_DEFAULT_SIZE, SELLER_PAGE_MAX_SIZE
 from services.nostr_service import nostr_service
 from pydantic import BaseModel
 from typing import List
@@ -27,6 +27,25 @@ async def get_users():
             detail=f"Error getting users: {e}"
         )
 
+@router.get("/sellers", response_model=SellerPage)
+async def get_seller_directory(
+    limit: int = Query(SELLER_PAGE_DEFAULT_SIZE, ge=1, le=SELLER_PAGE_MAX_SIZE),
+    cursor: Optional[str] = None,
+):
+    """
+    A page of sellers with their active and sold listing counts and reputation;
+    pass next_cursor back as cursor for the following page
+    """
+    try:
+        return await user_service.get_seller_directory(limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error getting sellers: {e}"
+        )
+
 @router.post("/register", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
 async def register_user():
     """
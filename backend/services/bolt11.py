@@ -0,0 +1,92 @@
+import re
+from typing import NamedTuple, Optional
+
+from bech32 import CHARSET, bech32_verify_checksum
+
+# BOLT 11 defaults and field layout (in 5-bit words)
+DEFAULT_EXPIRY_SECONDS = 3600
+TIMESTAMP_WORDS = 7
+SIGNATURE_WORDS = 104
+TAG_PAYMENT_HASH = CHARSET.index("p")
+TAG_EXPIRY = CHARSET.index("x")
+
+# Amount multipliers expressed in millisatoshis per unit of the hrp amount
+_MULTIPLIERS_MSAT = {"m": 100_000_000, "u": 100_000, "n": 100, "p": 0.1, "": 100_000_000_000}
+_HRP_PATTERN = re.compile(r"^ln(bcrt|tbs|bc|tb|sb)(\d*)([munp]?)$")
+
+
+class Bolt11Invoice(NamedTuple):
+    payment_hash: str
+    amount_msat: Optional[int]
+    timestamp: int
+    expiry: int
+
+    @property
+    def expires_at(self) -> int:
+        return self.timestamp + self.expiry
+
+
+def _words_to_int(words) -> int:
+    value = 0
+    for word in words:
+        value = value << 5 | word
+    return value
+
+
+def _words_to_bytes(words) -> bytes:
+    bits = _words_to_int(words)
+    total_bits = len(words) * 5
+    # Drop the padding bits that round the field up to a whole number of words
+    return (bits >> (total_bits % 8)).to_bytes(total_bits // 8, "big")
+
+
+def decode_bolt11(invoice: str) -> Bolt11Invoice:
+    """
+    Decode the parts of a BOLT 11 payment request the ledger needs: payment hash,
+    amount, creation time and expiry. The node signature is not checked, the
+    wallet does that when paying.
+    """
+    invoice = invoice.strip().lower()
+    if invoice.startswith("lightning:"):
+        invoice = invoice[len("lightning:"):]
+
+    separator = invoice.rfind("1")
+    hrp, data_part = invoice[:separator], invoice[separator + 1:]
+    if separator < 1 or len(data_part) < TIMESTAMP_WORDS + SIGNATURE_WORDS + 6:
+        raise ValueError("Invalid BOLT 11 invoice")
+    if any(char not in CHARSET for char in data_part):
+        raise ValueError("Invalid character in BOLT 11 invoice")
+
+    data = [CHARSET.find(char) for char in data_part]
+    if not bech32_verify_checksum(hrp, data):
+        raise ValueError("Invalid BOLT 11 checksum")
+
+    match = _HRP_PATTERN.match(hrp)
+    if not match:
+        raise ValueError(f"Unsupported BOLT 11 prefix: {hrp}")
+    _, amount, multiplier = match.groups()
+    amount_msat = int(int(amount) * _MULTIPLIERS_MSAT[multiplier]) if amount else None
+
+    data = data[:-6]  # checksum
+    timestamp = _words_to_int(data[:TIMESTAMP_WORDS])
+    fields = data[TIMESTAMP_WORDS:-SIGNATURE_WORDS]
+
+    payment_hash = None
+    expiry = DEFAULT_EXPIRY_SECONDS
+    position = 0
+    while position + 3 <= len(fields):
+        tag = fields[position]
+        length = fields[position + 1] << 5 | fields[position + 2]
+        value = fields[position + 3:position + 3 + length]
+        position += 3 + length
+
+        # Readers must skip a p field of the wrong length rather than fail
+        if tag == TAG_PAYMENT_HASH and length == 52 and payment_hash is None:
+            payment_hash = _words_to_bytes(value).hex()
+        elif tag == TAG_EXPIRY:
+            expiry = _words_to_int(value)
+
+    if payment_hash is None:
+        raise ValueError("BOLT 11 invoice has no payment hash")
+
+    return Bolt11Invoice(payment_hash, amount_msat, timestamp, expiry)
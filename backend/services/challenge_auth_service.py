@@ -1,30 +1,52 @@
 # services/challenge_auth_service.py
+import asyncio
+import hashlib
+import hmac
+import os
+import secrets
+import time
 import uuid
 from datetime import datetime, timedelta
-from bech32 import bech32_decode, convertbits
 import nacl.signing
 import nacl.exceptions
 import binascii
+from typing import Optional, Tuple
+from pymongo.errors import DuplicateKeyError
 from database import mongodb
+from services.cache import TTLCache
+from services.encoding import npub_to_bytes, pubkey_to_db, pubkey_filter, b64url_encode, b64url_decode
+from services.user_service import user_service
+from services.token_service import token_service
 
 # Session lifetime in seconds (1 hour = 3600 seconds)
 SESSION_LIFETIME_SECONDS = 3600  # 1 hour
 
+# A signed challenge must be answered within this many seconds
+CHALLENGE_LIFETIME_SECONDS = 300
+CHALLENGE_NONCE_BYTES = 16
+
+# HMAC key for challenges; must be shared by all workers. Without it a random key
+# is used, which only invalidates challenges that are outstanding during a restart.
+CHALLENGE_SECRET = bytes.fromhex(os.getenv("AUTH_CHALLENGE_SECRET", "")) or secrets.token_bytes(32)
+
+# How long a resolved session is served from memory before MongoDB is asked again
+SESSION_CACHE_TTL_SECONDS = 30
+SESSION_CACHE_MAX_ENTRIES = 10000
+
+# Verify keys are derived once per pubkey and reused across logins
+VERIFY_KEY_CACHE_TTL_SECONDS = 3600
+VERIFY_KEY_CACHE_MAX_ENTRIES = 10000
+
+# Signature checks move to a worker thread when more than this many run concurrently
+VERIFY_OFFLOAD_THRESHOLD = 4
+
 
 def parse_public_key(npub: str) -> bytes:
     """
     Decodes a Nostr public key in bech32 format (npub...) into its raw 32-byte value.
+    Decoding is cached, so repeated calls for the same key are cheap.
     """
-    try:
-        hrp, data = bech32_decode(npub)
-        if data is None:
-            raise ValueError("bech32_decode returned None")
-        raw_pubkey = bytes(convertbits(data, 5, 8, False))
-        if len(raw_pubkey) != 32:
-            raise ValueError(f"Invalid public key length: {len(raw_pubkey)} (expected 32 bytes)")
-        return raw_pubkey
-    except Exception as e:
-        raise e
+    return npub_to_bytes(npub)
 
 
 def get_public_key_from_seed(raw_seed_hex: str) -> bytes:
@@ -50,119 +72,251 @@ def get_public_key_from_seed(raw_seed_hex: str) -> bytes:
         raise e
 
 
-class ChallengeAuthService:
-    async def get_challenge(self, public_key: str) -> (str, str):
-        session_id = str(uuid.uuid4())
-        challenge = f"auth-challenge:{session_id}"
-        expires_at = datetime.utcnow() + timedelta(seconds=SESSION_LIFETIME_SECONDS)
-
-        # Store session in MongoDB
-        session_data = {
-            "session_id": session_id,
-            "public_key": public_key,  # stored in bech32 format, e.g., "npub1..."
-            "challenge": challenge,
-            "expires_at": expires_at,
-            "verified": False,
-            "created_at": datetime.utcnow()
-        }
+def _verify_with_key(verify_key: nacl.signing.VerifyKey, message: bytes, signature: bytes) -> bool:
+    try:
+        verify_key.verify(message, signature)
+        return True
+    except nacl.exceptions.BadSignatureError:
+        return False
 
-        # Insert into sessions collection
-        await mongodb.db.sessions.insert_one(session_data)
 
-        # Create TTL index if it doesn't exist (only needs to be done once)
-        # This will automatically delete expired sessions
+class ChallengeAuthService:
+    def __init__(self):
+        # Resolved sessions keyed by token; revoke_session evicts explicitly
+        self.session_cache = TTLCache(maxsize=SESSION_CACHE_MAX_ENTRIES, ttl=SESSION_CACHE_TTL_SECONDS)
+        # Users behind signed tokens keyed by raw pubkey
+        self.user_cache = TTLCache(maxsize=SESSION_CACHE_MAX_ENTRIES, ttl=SESSION_CACHE_TTL_SECONDS)
+        # Verify keys per raw pubkey, see _verify_signature
+        self.verify_keys = TTLCache(maxsize=VERIFY_KEY_CACHE_MAX_ENTRIES, ttl=VERIFY_KEY_CACHE_TTL_SECONDS)
+        self._verifications_in_flight = 0
+
+    async def ensure_indexes(self):
+        """Create the session indexes; expired sessions are removed by the TTL index"""
+        await mongodb.db.sessions.create_index("session_id", unique=True)
+        await mongodb.db.sessions.create_index("challenge_nonce", unique=True, sparse=True)
         await mongodb.db.sessions.create_index("expires_at", expireAfterSeconds=0)
 
+    def _sign_challenge(self, payload: bytes) -> bytes:
+        return hmac.new(CHALLENGE_SECRET, payload, hashlib.sha256).digest()
+
+    async def get_challenge(self, public_key: str) -> (str, str):
+        """
+        Issue a self-authenticating challenge: the challenge id carries the pubkey,
+        a random nonce and an expiry, bound together by an HMAC. Nothing is stored
+        until the client has proven possession of the key in verify.
+        """
+        raw_pubkey = parse_public_key(public_key)
+        expires_at = int(time.time()) + CHALLENGE_LIFETIME_SECONDS
+        payload = raw_pubkey + secrets.token_bytes(CHALLENGE_NONCE_BYTES) + expires_at.to_bytes(8, "big")
+
+        session_id = f"{b64url_encode(payload)}.{b64url_encode(self._sign_challenge(payload))}"
+        challenge = f"auth-challenge:{session_id}"
         return session_id, challenge
 
-    async def verify_challenge_signature(self, session_id: str, signature: bytes) -> bool:
-        # Get session from MongoDB
-        session_data = await mongodb.db.sessions.find_one({"session_id": session_id})
+    def _open_challenge(self, session_id: str) -> Optional[Tuple[bytes, bytes]]:
+        """Check the challenge HMAC and expiry; returns (raw_pubkey, nonce) if it is ours and fresh"""
+        try:
+            payload_b64, mac_b64 = session_id.split(".")
+            payload = b64url_decode(payload_b64)
+            mac = b64url_decode(mac_b64)
+        except (ValueError, TypeError):
+            return None
 
-        if not session_data:
-            return False
+        if len(payload) != 32 + CHALLENGE_NONCE_BYTES + 8:
+            return None
+        if not hmac.compare_digest(mac, self._sign_challenge(payload)):
+            return None
+        if int.from_bytes(payload[-8:], "big") <= time.time():
+            return None
 
-        if datetime.utcnow() > session_data["expires_at"]:
-            await mongodb.db.sessions.delete_one({"session_id": session_id})
-            return False
+        return payload[:32], payload[32:-8]
 
-        stored_pubkey_bech32 = session_data["public_key"]
-        challenge_str = session_data["challenge"]
+    async def _verify_challenge(self, session_id: str, signature: bytes) -> Optional[Tuple[bytes, str]]:
+        """
+        Verify the signed challenge and persist the resulting session.
+        Returns (raw_pubkey, session_id of the stored session) on success, otherwise None.
+        """
+        opened = self._open_challenge(session_id)
+        if not opened:
+            return None
+        raw_pubkey, nonce = opened
+
+        # Encode the challenge
+        challenge_bytes = f"auth-challenge:{session_id}".encode()
 
         try:
-            # Decode the stored public key using our helper
-            raw_pubkey = parse_public_key(stored_pubkey_bech32)
-
-            # Encode the challenge
-            challenge_bytes = challenge_str.encode()
-
-            verify_key = nacl.signing.VerifyKey(raw_pubkey)
-            # Attempt to verify the signature
-            try:
-                verify_key.verify(challenge_bytes, signature)
-                # Update verification status in MongoDB
-                await mongodb.db.sessions.update_one(
-                    {"session_id": session_id},
-                    {"$set": {"verified": True}}
-                )
-                return True
-            except nacl.exceptions.BadSignatureError:
-                # If verification fails with the bech32-derived key, try using the user's raw seed
-                # This is a fallback to handle TweetNaCl's key derivation on the frontend
-                user = await mongodb.db.users.find_one({"nostr_public_key": stored_pubkey_bech32})
-
-                if user and "raw_seed" in user:
-                    try:
-                        # Generate the public key using TweetNaCl's method
-                        tweetnacl_pubkey = get_public_key_from_seed(user["raw_seed"])
-
-                        # Verify with the TweetNaCl-derived public key
-                        tweetnacl_verify_key = nacl.signing.VerifyKey(tweetnacl_pubkey)
-                        tweetnacl_verify_key.verify(challenge_bytes, signature)
-
-                        # Update verification status in MongoDB
-                        await mongodb.db.sessions.update_one(
-                            {"session_id": session_id},
-                            {"$set": {"verified": True}}
-                        )
-                        return True
-                    except nacl.exceptions.BadSignatureError as bse:
-                        return False
-                    except Exception as e:
-                        return False
-                else:
-                    return False
-        except nacl.exceptions.BadSignatureError as bse:
-            return False
-        except Exception as e:
-            return False
+            if not await self._verify_signature(raw_pubkey, challenge_bytes, signature):
+                return None
+        except Exception:
+            return None
 
-    async def is_session_valid(self, session_id: str) -> bool:
-        session_data = await mongodb.db.sessions.find_one({"session_id": session_id})
+        # Only now is anything written. The unique challenge_nonce index rejects replays
+        # of the same signed challenge; in signed token mode the document is just that record.
+        new_session_id = str(uuid.uuid4())
+        session_data = {
+            "session_id": new_session_id,
+            "public_key": pubkey_to_db(raw_pubkey),  # stored as raw 32 bytes
+            "challenge_nonce": nonce,
+            "expires_at": datetime.utcnow() + timedelta(seconds=SESSION_LIFETIME_SECONDS),
+            "verified": True,
+            "created_at": datetime.utcnow()
+        }
+        try:
+            await mongodb.db.sessions.insert_one(session_data)
+        except DuplicateKeyError:
+            return None
 
-        if not session_data:
-            return False
+        return raw_pubkey, new_session_id
+
+    async def _verify_signature(self, raw_pubkey: bytes, message: bytes, signature: bytes) -> bool:
+        """
+        Verify a signature against the cached verify keys of a pubkey: the key decoded
+        from the npub and the key TweetNaCl derives on the frontend from the user's raw
+        seed. The key that last succeeded is tried first, so repeat logins need neither
+        a users lookup nor a second verification.
+        """
+        keys = self.verify_keys.get(raw_pubkey)
+        if keys is None:
+            # "seed" is None until the users lookup ran, False if the user has no seed key
+            keys = {"bech32": nacl.signing.VerifyKey(raw_pubkey), "seed": None, "preferred": "bech32"}
+            self.verify_keys.set(raw_pubkey, keys)
+
+        order = ["seed", "bech32"] if keys["preferred"] == "seed" else ["bech32", "seed"]
+        self._verifications_in_flight += 1
+        try:
+            for kind in order:
+                if kind == "seed" and keys["seed"] is None:
+                    # This is a fallback to handle TweetNaCl's key derivation on the frontend;
+                    # a miss is cached too, so failing signatures cost no further lookups
+                    keys["seed"] = await self._load_seed_verify_key(raw_pubkey) or False
+                verify_key = keys[kind]
+                if verify_key is False:
+                    continue
+
+                if self._verifications_in_flight > VERIFY_OFFLOAD_THRESHOLD:
+                    # Login burst: keep the event loop free, PyNaCl releases the GIL
+                    is_valid = await asyncio.to_thread(_verify_with_key, verify_key, message, signature)
+                else:
+                    is_valid = _verify_with_key(verify_key, message, signature)
 
-        if datetime.utcnow() > session_data["expires_at"]:
-            await mongodb.db.sessions.delete_one({"session_id": session_id})
+                if is_valid:
+                    keys["preferred"] = kind
+                    return True
             return False
+        finally:
+            self._verifications_in_flight -= 1
+
+    async def _load_seed_verify_key(self, raw_pubkey: bytes) -> Optional[nacl.signing.VerifyKey]:
+        user = await mongodb.db.users.find_one(
+            {"nostr_public_key": pubkey_filter(raw_pubkey)},
+            {"raw_seed": 1}
+        )
+        if not user or not user.get("raw_seed"):
+            return None
 
-        return session_data["verified"]
-
-    async def get_public_key_for_session(self, session_id: str) -> str:
-        session_data = await mongodb.db.sessions.find_one({"session_id": session_id})
+        # Generate the public key using TweetNaCl's method
+        return nacl.signing.VerifyKey(get_public_key_from_seed(user["raw_seed"]))
 
-        if not session_data:
+    async def verify_challenge_signature(self, session_id: str, signature: bytes) -> bool:
+        return await self._verify_challenge(session_id, signature) is not None
+
+    async def authenticate(self, session_id: str, signature: bytes) -> Optional[str]:
+        """
+        Verify the signed challenge and return the bearer token for the client:
+        the id of the new session, or a stateless signed token in "signed" token mode.
+        """
+        verified = await self._verify_challenge(session_id, signature)
+        if verified is None:
             return None
 
-        if datetime.utcnow() > session_data["expires_at"]:
-            await mongodb.db.sessions.delete_one({"session_id": session_id})
+        raw_pubkey, new_session_id = verified
+        if token_service.enabled:
+            return token_service.issue(raw_pubkey, SESSION_LIFETIME_SECONDS)
+        return new_session_id
+
+    async def resolve_session(self, session_id: str) -> Optional[dict]:
+        """
+        Resolve a token to its verified session and user in a single round trip.
+        Returns the session with the user embedded under "user" (None if the user
+        no longer exists), or None if the session is unknown, unverified or expired.
+        Resolved sessions are cached in memory for a short time; callers get a copy.
+        """
+        cached = self.session_cache.get(session_id)
+        if cached is not None:
+            return self._copy_session(cached)
+
+        if token_service.is_signed_token(session_id):
+            return await self._resolve_signed_token(session_id)
+
+        now = datetime.utcnow()
+        pipeline = [
+            {"$match": {"session_id": session_id, "verified": True, "expires_at": {"$gt": now}}},
+            {"$limit": 1},
+            {"$lookup": {
+                "from": "users",
+                "localField": "public_key",
+                "foreignField": "nostr_public_key",
+                "as": "users",
+            }},
+        ]
+        results = await mongodb.db.sessions.aggregate(pipeline).to_list(length=1)
+        if not results:
             return None
 
-        if not session_data["verified"]:
+        session_data = results[0]
+        users = session_data.pop("users")
+        if users:
+            session_data["user"] = user_service._deserialize_user(users[0])
+        else:
+            # Users the migration has not converted yet still hold the npub string
+            session_data["user"] = await user_service.get_user_by_public_key(session_data["public_key"])
+
+        # A missing user is not cached, so one registering right after is found at once;
+        # and a session is never served from the cache past its expiry
+        if session_data["user"] is not None:
+            remaining = (session_data["expires_at"] - now).total_seconds()
+            self.session_cache.set(session_id, session_data, ttl=min(SESSION_CACHE_TTL_SECONDS, remaining))
+            return self._copy_session(session_data)
+        return session_data
+
+    @staticmethod
+    def _copy_session(session_data: dict) -> dict:
+        session_copy = dict(session_data)
+        if session_copy.get("user") is not None:
+            session_copy["user"] = dict(session_copy["user"])
+        return session_copy
+
+    async def _resolve_signed_token(self, token: str) -> Optional[dict]:
+        """Signed tokens are validated in memory; only the user document may need a lookup"""
+        claims = await token_service.validate_current(token)
+        if not claims:
             return None
 
-        return session_data["public_key"]
+        user = self.user_cache.get(claims.public_key)
+        if user is None:
+            user = await user_service.get_user_by_public_key(claims.public_key)
+            if user:
+                self.user_cache.set(claims.public_key, user)
+
+        return {
+            "public_key": claims.public_key,
+            "expires_at": datetime.utcfromtimestamp(claims.expires_at),
+            "verified": True,
+            "user": dict(user) if user else None,
+        }
+
+    async def is_session_valid(self, session_id: str) -> bool:
+        if token_service.is_signed_token(session_id):
+            return await token_service.validate_current(session_id) is not None
+        return await self.resolve_session(session_id) is not None
+
+    async def revoke_session(self, session_id: str) -> bool:
+        """Invalidate a session immediately, both in memory and in MongoDB"""
+        self.session_cache.pop(session_id)
+        if token_service.is_signed_token(session_id):
+            return await token_service.revoke(session_id)
+        result = await mongodb.db.sessions.delete_one({"session_id": session_id})
+        return result.deleted_count > 0
 
 
 challenge_auth_service = ChallengeAuthService()
\ No newline at end of file
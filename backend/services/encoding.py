@@ -0,0 +1,113 @@
+import base64
+from functools import lru_cache
+from typing import Any, Dict, Optional, Union
+from uuid import UUID
+
+from bech32 import bech32_decode, bech32_encode, convertbits
+from bson.binary import Binary, UUID_SUBTYPE
+
+# Pubkeys and ids are stored in MongoDB in their compact binary form
+# (32-byte pubkeys, 16-byte UUIDs) and converted at the API boundary.
+NPUB_HRP = "npub"
+
+
+@lru_cache(maxsize=4096)
+def npub_to_bytes(npub: str) -> bytes:
+    """
+    Decode a bech32 npub into its raw 32-byte public key.
+    """
+    hrp, data = bech32_decode(npub)
+    if hrp != NPUB_HRP or data is None:
+        raise ValueError(f"Invalid npub: {npub}")
+    raw_pubkey = bytes(convertbits(data, 5, 8, False))
+    if len(raw_pubkey) != 32:
+        raise ValueError(f"Invalid public key length: {len(raw_pubkey)} (expected 32 bytes)")
+    return raw_pubkey
+
+
+@lru_cache(maxsize=4096)
+def bytes_to_npub(raw_pubkey: bytes) -> str:
+    """
+    Encode a raw 32-byte public key as a bech32 npub.
+    """
+    if len(raw_pubkey) != 32:
+        raise ValueError(f"Invalid public key length: {len(raw_pubkey)} (expected 32 bytes)")
+    return bech32_encode(NPUB_HRP, convertbits(raw_pubkey, 8, 5))
+
+
+def pubkey_to_bytes(pubkey: str) -> bytes:
+    """Decode an npub or a 64-character hex pubkey into its raw 32 bytes"""
+    if pubkey.startswith(NPUB_HRP):
+        return npub_to_bytes(pubkey)
+    try:
+        raw_pubkey = bytes.fromhex(pubkey)
+    except ValueError:
+        raise ValueError(f"Invalid pubkey: {pubkey}")
+    if len(raw_pubkey) != 32:
+        raise ValueError(f"Invalid public key length: {len(raw_pubkey)} (expected 32 bytes)")
+    return raw_pubkey
+
+
+def pubkey_to_db(pubkey: Union[str, bytes, None]) -> Optional[Binary]:
+    """Convert an npub or hex pubkey (or raw pubkey bytes) to the binary form stored in MongoDB"""
+    if pubkey is None:
+        return None
+    if isinstance(pubkey, str):
+        return Binary(pubkey_to_bytes(pubkey))
+    return Binary(bytes(pubkey))
+
+
+def pubkey_from_db(value: Any) -> Optional[str]:
+    """Convert a stored pubkey back to npub; legacy string values are returned unchanged"""
+    if value is None or isinstance(value, str):
+        return value
+    return bytes_to_npub(bytes(value))
+
+
+def pubkey_filter(pubkey: Union[str, bytes]) -> Dict[str, Any]:
+    """
+    Query filter matching a pubkey in either its binary or its legacy string form,
+    so lookups keep working while the background migration is still running.
+    """
+    try:
+        if isinstance(pubkey, str):
+            return {"$in": [Binary(pubkey_to_bytes(pubkey)), pubkey]}
+        raw_pubkey = bytes(pubkey)
+        return {"$in": [Binary(raw_pubkey), bytes_to_npub(raw_pubkey)]}
+    except ValueError:
+        return {"$eq": pubkey}
+
+
+def id_to_db(value: Union[str, UUID]) -> Binary:
+    """Convert a UUID string to a binary UUID for use as a MongoDB _id"""
+    if not isinstance(value, UUID):
+        value = UUID(value)
+    return Binary.from_uuid(value)
+
+
+def id_from_db(value: Any) -> Optional[str]:
+    """Convert a stored id back to its UUID string; other values are stringified"""
+    if value is None:
+        return None
+    if isinstance(value, UUID):
+        return str(value)
+    if isinstance(value, Binary) and value.subtype == UUID_SUBTYPE:
+        return str(value.as_uuid())
+    return str(value)
+
+
+def id_filter(value: str) -> Dict[str, Any]:
+    """Query filter matching an id stored either as a binary UUID or as a legacy string"""
+    try:
+        return {"$in": [id_to_db(value), value]}
+    except ValueError:
+        return {"$eq": value}
+
+
+def b64url_encode(data: bytes) -> str:
+    """Unpadded URL-safe base64, used for compact tokens"""
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def b64url_decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
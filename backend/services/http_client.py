@@ -0,0 +1,41 @@
+from typing import Optional
+
+import httpx
+
+# One pooled client for all outgoing HTTP (LNURL, lightning address callbacks), so
+# repeated requests to the same host reuse a kept-alive HTTP/2 or HTTP/1.1 connection
+HTTP_TIMEOUT_SECONDS = 10
+HTTP_MAX_CONNECTIONS = 100
+HTTP_MAX_KEEPALIVE_CONNECTIONS = 20
+HTTP_KEEPALIVE_EXPIRY_SECONDS = 60
+
+
+class HTTPClient:
+    client: Optional[httpx.AsyncClient] = None
+
+    def start(self) -> httpx.AsyncClient:
+        self.client = httpx.AsyncClient(
+            http2=True,
+            timeout=HTTP_TIMEOUT_SECONDS,
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY_SECONDS,
+            ),
+            follow_redirects=True,
+        )
+        return self.client
+
+    def get_client(self) -> httpx.AsyncClient:
+        # Started lazily as well, for scripts that use the services without the app lifespan
+        if self.client is None or self.client.is_closed:
+            self.start()
+        return self.client
+
+    async def close(self):
+        if self.client:
+            await self.client.aclose()
+            self.client = None
+
+
+http_client = HTTPClient()
@@ -0,0 +1,280 @@
+import asyncio
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from uuid import NAMESPACE_URL, uuid5
+
+from nostr_sdk import Event, Filter, Kind, Timestamp
+from pydantic import ValidationError
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from database import mongodb
+from models.listing import ListingInDB, ListingStatus
+from services.cache import TTLCache
+from services.encoding import bytes_to_npub, id_to_db, pubkey_to_db
+from services.listing_service import listing_service, LISTING_KIND, LISTING_DRAFT_KIND
+from services.nostr_service import nostr_service
+
+# Events are written in batches of up to this many, at least this often
+INGEST_BATCH_SIZE = 200
+INGEST_FLUSH_SECONDS = 1
+# Events waiting for the batch writer; beyond this they are dropped and replayed
+# from the checkpoint once the writer has caught up
+INGEST_QUEUE_MAX_EVENTS = 10000
+# The checkpoint trails the newest ingested event by this much, so events that
+# reach a relay late are still picked up after a restart
+INGEST_CHECKPOINT_OVERLAP_SECONDS = 600
+# Ids of recently ingested events, so relays repeating them cost no write
+INGEST_SEEN_MAX_ENTRIES = 20000
+INGEST_SEEN_TTL_SECONDS = 3600
+INGEST_RETRY_SECONDS = 30
+
+# Only prices in satoshis can be paid through the marketplace
+SATS_PER_UNIT = {"": 1, "SAT": 1, "SATS": 1, "BTC": 100_000_000}
+DUPLICATE_KEY_ERROR = 11000
+
+
+class IngestionService:
+    """
+    Streams marketplace listing events (NIP-99 kinds 30402/30403) from the configured
+    relays into the listings collection, so listings published by other clients are
+    served from the local index like our own. Events are signature-checked, deduplicated
+    by id and upserted in batches keyed by author and d tag; an older version never
+    overwrites a newer one. A checkpoint per relay set bounds the replay after a restart.
+
+    The queue between relays and the writer is bounded. Events arriving while it is
+    full are dropped, the checkpoint is held at the oldest of them, and the relays
+    are asked to replay from there once the queue has drained.
+    """
+
+    collection_name = "nostr_ingestion"
+    checkpoint_id = "marketplace"
+
+    def __init__(self):
+        self.queue: "asyncio.Queue[Event]" = asyncio.Queue(maxsize=INGEST_QUEUE_MAX_EVENTS)
+        self.seen = TTLCache(maxsize=INGEST_SEEN_MAX_ENTRIES, ttl=INGEST_SEEN_TTL_SECONDS)
+        self.subscription_id: Optional[str] = None
+        # Creation time of the oldest event dropped on a full queue since the last subscribe
+        self.oldest_dropped: Optional[int] = None
+
+    async def run(self):
+        """Ingestion loop, started from the app lifespan"""
+        while True:
+            try:
+                await self._subscribe()
+                await self._consume()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Marketplace ingestion failed, retrying in {INGEST_RETRY_SECONDS}s: {e}")
+                await asyncio.sleep(INGEST_RETRY_SECONDS)
+
+    async def _subscribe(self):
+        if self.subscription_id:
+            await nostr_service.unsubscribe(self.subscription_id)
+            self.subscription_id = None
+
+        dropped, self.oldest_dropped = self.oldest_dropped, None
+        if dropped is not None:
+            await self._hold_checkpoint(dropped)
+        checkpoint = await mongodb.db[self.collection_name].find_one({"_id": self.checkpoint_id})
+        listing_filter = Filter().kinds([Kind(LISTING_KIND), Kind(LISTING_DRAFT_KIND)])
+        if checkpoint:
+            listing_filter = listing_filter.since(Timestamp.from_secs(checkpoint["since"]))
+        self.subscription_id = await nostr_service.subscribe(listing_filter, self._on_event)
+
+    def _on_event(self, event: Event):
+        if event.id().to_hex() in self.seen:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            created = event.created_at().as_secs()
+            if self.oldest_dropped is None or created < self.oldest_dropped:
+                self.oldest_dropped = created
+
+    async def _consume(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + INGEST_FLUSH_SECONDS
+            while len(batch) < INGEST_BATCH_SIZE:
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), max(deadline - loop.time(), 0)))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self.ingest(batch)
+            except Exception as e:
+                print(f"Error ingesting {len(batch)} marketplace events: {e}")
+            if self.oldest_dropped is not None and self.queue.empty():
+                # Caught up: resubscribe, so the relays replay what was dropped
+                print(f"Marketplace ingestion fell behind, replaying events since {self.oldest_dropped}")
+                return
+
+    async def ingest(self, events: List[Event]) -> int:
+        """Verify, convert and upsert a batch of listing events; returns how many were written"""
+        service_pubkey = (await nostr_service.signer.get_public_key()).to_hex() if nostr_service.signer else None
+        latest: Dict[Any, Event] = {}
+        newest = 0
+        for event in events:
+            event_id = event.id().to_hex()
+            if event_id in self.seen:
+                continue
+            self.seen.set(event_id, True)
+            if not event.verify():
+                continue
+            newest = max(newest, event.created_at().as_secs())
+            # Our own listings are published from the listings collection, not read back into it
+            if event.author().to_hex() == service_pubkey:
+                continue
+            key = (event.author().to_hex(), self._identifier(event))
+            if key[1] is not None and (key not in latest or latest[key].created_at().as_secs() < event.created_at().as_secs()):
+                latest[key] = event
+
+        operations = []
+        upserted: List[Event] = []
+        for event in latest.values():
+            operation = self._to_upsert(event)
+            if operation is not None:
+                operations.append(operation)
+                upserted.append(event)
+
+        written = 0
+        if operations:
+            try:
+                result = await mongodb.db[listing_service.collection_name].bulk_write(operations, ordered=False)
+                written = result.upserted_count + result.modified_count
+            except BulkWriteError as e:
+                # A stored version at least as new makes the filter miss and the upsert collide
+                errors = [error for error in e.details.get("writeErrors", []) if error["code"] != DUPLICATE_KEY_ERROR]
+                written = e.details.get("nUpserted", 0) + e.details.get("nModified", 0)
+                if errors:
+                    print(f"Error upserting marketplace listings: {errors[:3]}")
+                    failed = [upserted[error["index"]] for error in errors]
+                    self._forget(failed)
+                    # Hold the checkpoint at the oldest failed event, so a replay writes it again
+                    newest = min(newest, min(event.created_at().as_secs() for event in failed))
+            except Exception:
+                self._forget(upserted)
+                raise
+
+        if self.oldest_dropped is not None:
+            await self._hold_checkpoint(self.oldest_dropped)
+        elif newest:
+            await self._advance_checkpoint(newest)
+        return written
+
+    def _forget(self, events: List[Event]):
+        """Drop events that were not written from the seen cache, so they are ingested when seen again"""
+        for event in events:
+            self.seen.pop(event.id().to_hex())
+
+    async def _advance_checkpoint(self, newest: int):
+        since = min(newest, int(time.time())) - INGEST_CHECKPOINT_OVERLAP_SECONDS
+        await mongodb.db[self.collection_name].update_one(
+            {"_id": self.checkpoint_id},
+            {"$max": {"since": since}},
+            upsert=True
+        )
+
+    async def _hold_checkpoint(self, oldest: int):
+        """Move the checkpoint back so a replay covers events created since oldest"""
+        await mongodb.db[self.collection_name].update_one(
+            {"_id": self.checkpoint_id},
+            {"$min": {"since": oldest - INGEST_CHECKPOINT_OVERLAP_SECONDS}},
+            upsert=True
+        )
+
+    @staticmethod
+    def _identifier(event: Event) -> Optional[str]:
+        for tag in event.tags().to_vec():
+            values = tag.as_vec()
+            if values[0] == "d" and len(values) > 1:
+                return values[1]
+        return None
+
+    @staticmethod
+    def listing_id(author_hex: str, identifier: str) -> str:
+        """Stable listing id for an external author's d tag"""
+        return str(uuid5(NAMESPACE_URL, f"nostr:{author_hex}:{identifier}"))
+
+    def _to_upsert(self, event: Event) -> Optional[UpdateOne]:
+        """The upsert of a listing event, or None if it does not describe a valid listing"""
+        tags: Dict[str, List[str]] = {}
+        for tag in event.tags().to_vec():
+            values = tag.as_vec()
+            tags.setdefault(values[0], values[1:])
+
+        author = event.author().to_hex()
+        created = event.created_at().as_secs()
+        price = self._price_in_sats(tags.get("price"))
+        status_tag = (tags.get("status") or [""])[0]
+        if event.kind().as_u16() == LISTING_DRAFT_KIND:
+            status = ListingStatus.ENDED.value
+        elif status_tag in {item.value for item in ListingStatus}:
+            status = status_tag
+        else:
+            status = ListingStatus.ACTIVE.value
+        try:
+            published = int((tags.get("published_at") or [created])[0])
+        except ValueError:
+            published = created
+
+        listing = {
+            "id": self.listing_id(author, self._identifier(event)),
+            "title": (tags.get("title") or [""])[0],
+            "description": event.content(),
+            "condition": (tags.get("condition") or [""])[0],
+            "price": price,
+            "pubkey": bytes_to_npub(bytes.fromhex(author)),
+            "image": {"url": (tags.get("image") or [""])[0]},
+            "created_at": datetime.utcfromtimestamp(published),
+            "updated_at": datetime.utcfromtimestamp(created),
+            "status": status,
+            "nostr_event_id": event.id().to_hex(),
+        }
+        try:
+            listing = listing_service._serialize_listing(ListingInDB(**listing).dict())
+        except (ValidationError, ValueError):
+            return None
+
+        listing.pop("id")
+        listing.pop("created_at")
+        listing.pop("status")
+        listing.pop("paid_by", None)
+        listing["pubkey"] = pubkey_to_db(bytes.fromhex(author))
+        listing["nostr_created_at"] = created
+        # The event's address, for reading the current version back from the relays
+        listing["nostr_kind"] = event.kind().as_u16()
+        listing["nostr_identifier"] = self._identifier(event)
+        listing["source"] = "nostr"
+
+        # A pipeline update, so a listing sold through us stays sold; values are
+        # wrapped in $literal because event content may start with "$"
+        stage = {key: {"$literal": value} for key, value in listing.items()}
+        stage["created_at"] = {"$ifNull": ["$created_at", {"$literal": datetime.utcfromtimestamp(published)}]}
+        stage["status"] = {"$cond": [
+            {"$eq": ["$status", ListingStatus.SOLD.value]}, ListingStatus.SOLD.value, {"$literal": status}
+        ]}
+        return UpdateOne(
+            {"_id": id_to_db(self.listing_id(author, self._identifier(event))), "nostr_created_at": {"$lt": created}},
+            [{"$set": stage}],
+            upsert=True
+        )
+
+    @staticmethod
+    def _price_in_sats(price_tag: Optional[List[str]]) -> int:
+        """NIP-99 price tag ["price", amount, currency, frequency] to whole satoshis, 0 if unusable"""
+        if not price_tag or len(price_tag) > 2 and price_tag[2]:
+            return 0
+        try:
+            amount = float(price_tag[0])
+        except ValueError:
+            return 0
+        currency = price_tag[1].upper() if len(price_tag) > 1 else ""
+        return int(amount * SATS_PER_UNIT.get(currency, 0))
+
+
+ingestion_service = IngestionService()
@@ -1,87 +1,340 @@
+import calendar
+import hashlib
 import urllib
 from typing import List, Dict, Any, Optional, cast
-from datetime import datetime
+from datetime import datetime, timedelta
 from uuid import UUID, uuid4
 import urllib.parse
 import httpx
+from fastapi import HTTPException
 from datetime import datetime
 from models.listing import ListingCreate, ListingInDB, ListingUpdate
-from models.invoice import Invoice
+from models.invoice import Invoice, InvoiceState
 from database import mongodb
 from services.nostr_service import nostr_service
 
-from services.nwc import processNWCstring, makeInvoice, getInfo, checkInvoice, tryToPayInvoice, didPaymentSucceed
+from services.bolt11 import decode_bolt11
+from services.cache import TTLCache
+from services.encoding import pubkey_to_db, pubkey_from_db, id_to_db, id_from_db
+from services.http_client import http_client
+from services.listing_service import listing_service
+from services.nwc_client import nwc_client
+from services.nwc_session import get_nwc_session
+
+# LNURL-pay metadata of lightning addresses changes rarely
+LNURL_CACHE_TTL_SECONDS = 600
+LNURL_CACHE_MAX_ENTRIES = 2048
+# A pending invoice is checked through its LUD-21 verify URL at most this often
+LNURL_VERIFY_INTERVAL_SECONDS = 60
+
+
+def preimage_matches(preimage: Optional[str], payment_hash: str) -> bool:
+    """A payment is only proven by a preimage whose sha256 is the invoice's payment hash"""
+    if not preimage:
+        return False
+    try:
+        return hashlib.sha256(bytes.fromhex(preimage)).hexdigest() == payment_hash
+    except ValueError:
+        return False
 
 
+class InvoiceAmountError(ValueError):
+    """The requested amount is outside what the lightning address accepts"""
 
 
 class InvoiceService:
     """Service for handling LN invoices"""
 
     collection_name = "invoices"
+
+    def __init__(self):
+        self.lnurl_cache = TTLCache(maxsize=LNURL_CACHE_MAX_ENTRIES, ttl=LNURL_CACHE_TTL_SECONDS)
+
+    async def ensure_indexes(self):
+        """Create the ledger indexes: one invoice per payment hash, lookups per listing, pending sweeps"""
+        collection = mongodb.db[self.collection_name]
+        await collection.create_index("payment_hash", unique=True)
+        await collection.create_index("listing_id")
+        await collection.create_index([("state", 1), ("expires_at", 1)])
+
+    @staticmethod
+    def _deserialize_invoice(db_invoice: Dict[Any, Any]) -> Dict[Any, Any]:
+        """Convert a ledger document to its API representation"""
+        if db_invoice is None:
+            return None
+
+        db_invoice["id"] = id_from_db(db_invoice.pop("_id"))
+        if db_invoice.get("listing_id") is not None:
+            db_invoice["listing_id"] = id_from_db(db_invoice["listing_id"])
+        for key in ("seller_pubkey", "buyer_pubkey"):
+            if db_invoice.get(key) is not None:
+                db_invoice[key] = pubkey_from_db(db_invoice[key])
+        return db_invoice
+
+    @staticmethod
+    def _to_lookup_result(record: Dict[Any, Any]) -> dict:
+        """Shape a ledger entry like a NIP-47 lookup_invoice response"""
+        def unix(value: Optional[datetime]) -> Optional[int]:
+            return calendar.timegm(value.utctimetuple()) if value else None
+
+        return {
+            "result_type": "lookup_invoice",
+            "result": {
+                "type": "incoming",
+                "state": record["state"],
+                "invoice": record["invoice"],
+                "description": record.get("description", ""),
+                "payment_hash": record["payment_hash"],
+                "preimage": record.get("preimage"),
+                "amount": record["amount"] * 1000,
+                "created_at": unix(record["created_at"]),
+                "expires_at": unix(record["expires_at"]),
+                "settled_at": unix(record.get("settled_at")),
+            },
+        }
+
+    async def get_ledger_entry(self, payment_hash: str) -> Optional[Dict[Any, Any]]:
+        collection = mongodb.db[self.collection_name]
+        return self._deserialize_invoice(await collection.find_one({"payment_hash": payment_hash}))
+
+    async def get_invoices_for_listing(self, listing_id: str) -> List[Dict[Any, Any]]:
+        collection = mongodb.db[self.collection_name]
+        cursor = collection.find({"listing_id": id_to_db(listing_id)})
+        return [self._deserialize_invoice(invoice) async for invoice in cursor]
+
+    async def mark_settled(self, payment_hash: str, preimage: Optional[str], settled_at: Optional[int] = None) -> bool:
+        """
+        Move a pending ledger entry to settled; returns False if it was not pending or the
+        preimage does not prove the payment. A wallet's settled_at alone is never trusted,
+        the wallet may be the buyer's own.
+        """
+        if not preimage_matches(preimage, payment_hash):
+            print(f"Ignoring settlement of {payment_hash} without a matching preimage")
+            return False
+        now = datetime.utcnow()
+        update = {
+            "state": InvoiceState.SETTLED.value,
+            "settled_at": datetime.utcfromtimestamp(settled_at) if settled_at else now,
+            "updated_at": now,
+            "preimage": preimage,
+        }
+        collection = mongodb.db[self.collection_name]
+        result = await collection.update_one(
+            {"payment_hash": payment_hash, "state": InvoiceState.PENDING.value},
+            {"$set": update}
+        )
+        return result.modified_count == 1
+
+    async def mark_expired(self, payment_hash: str) -> bool:
+        collection = mongodb.db[self.collection_name]
+        result = await collection.update_one(
+            {"payment_hash": payment_hash, "state": InvoiceState.PENDING.value},
+            {"$set": {"state": InvoiceState.EXPIRED.value, "updated_at": datetime.utcnow()}}
+        )
+        return result.modified_count == 1
+
+    async def expire_overdue(self, before: datetime) -> int:
+        """Mark every pending invoice that expired before the given time as expired; returns how many"""
+        collection = mongodb.db[self.collection_name]
+        result = await collection.update_many(
+            {"state": InvoiceState.PENDING.value, "expires_at": {"$lt": before}},
+            {"$set": {"state": InvoiceState.EXPIRED.value, "updated_at": datetime.utcnow()}}
+        )
+        return result.modified_count
+
+    async def claim_verifications(self, exclude: List[str], limit: int) -> List[Dict[Any, Any]]:
+        """
+        Pending invoices with a LUD-21 verify URL not checked within LNURL_VERIFY_INTERVAL_SECONDS,
+        up to limit and leaving out the excluded payment hashes. Each one is claimed atomically,
+        so concurrent workers check different invoices.
+        """
+        now = datetime.utcnow()
+        due = {
+            "state": InvoiceState.PENDING.value,
+            "verify_url": {"$ne": None},
+            "payment_hash": {"$nin": exclude},
+            "$or": [
+                {"verify_checked_at": None},
+                {"verify_checked_at": {"$lt": now - timedelta(seconds=LNURL_VERIFY_INTERVAL_SECONDS)}},
+            ],
+        }
+        collection = mongodb.db[self.collection_name]
+        claimed = []
+        while len(claimed) < limit:
+            record = await collection.find_one_and_update(due, {"$set": {"verify_checked_at": now}})
+            if record is None:
+                break
+            claimed.append(self._deserialize_invoice(record))
+        return claimed
+
+    async def verify_settlement(self, verify_url: str) -> dict:
+        """LUD-21: ask the LNURL-pay service whether its invoice was paid, e.g. {"settled": true, "preimage": ...}"""
+        resp = await http_client.get_client().get(verify_url)
+        resp.raise_for_status()
+        result = resp.json()
+        if result.get("status") == "ERROR":
+            raise RuntimeError(result.get("reason", "LNURL verify failed"))
+        return result
+
     async def get_nwc_info(self,nwc_string: str) -> Any:
         try:
-            return processNWCstring(nwc_string)
+            return get_nwc_session(nwc_string).info
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Error processing NWC string: {e}")
 
     async def get_lnurl_info(self, lightning_address: str) -> dict:
-        """Resolve a Nostr Lightning Address to its LNURL-pay endpoint"""
+        """Resolve a Nostr Lightning Address to its LNURL-pay endpoint (cached per address)"""
+        address = lightning_address.strip().lower()
+        lnurl_info = self.lnurl_cache.get(address)
+        if lnurl_info is not None:
+            return lnurl_info
+
         try:
-            username, domain = lightning_address.split("@")
+            username, domain = address.split("@")
             url = f"https://{domain}/.well-known/lnurlp/{username}"
-            async with httpx.AsyncClient() as client:
-                resp = await client.get(url)
-                resp.raise_for_status()
-                return resp.json()
+            resp = await http_client.get_client().get(url)
+            resp.raise_for_status()
+            lnurl_info = resp.json()
         except Exception as e:
             raise RuntimeError(f"Failed to resolve LNURL: {e}")
 
-    async def create_invoice(self, lightning_address: str, amount_sats: int, comment: str = "") -> dict:
-        """Request an invoice from a Nostr Lightning Address"""
+        if lnurl_info.get("status") == "ERROR" or "callback" not in lnurl_info:
+            raise RuntimeError(f"Failed to resolve LNURL: {lnurl_info.get('reason', 'no callback')}")
+        self.lnurl_cache.set(address, lnurl_info)
+        return lnurl_info
+
+    @staticmethod
+    def _check_sendable(lnurl_info: dict, amount_msats: int):
+        """Reject amounts the LNURL-pay service would refuse, without a round trip"""
+        min_sendable = lnurl_info.get("minSendable")
+        max_sendable = lnurl_info.get("maxSendable")
+        if min_sendable is not None and amount_msats < int(min_sendable):
+            raise InvoiceAmountError(f"Amount is below the minimum of {int(min_sendable) // 1000} sats")
+        if max_sendable is not None and amount_msats > int(max_sendable):
+            raise InvoiceAmountError(f"Amount is above the maximum of {int(max_sendable) // 1000} sats")
+
+    async def create_invoice(self,
+                             lightning_address: str,
+                             amount_sats: int,
+                             comment: str = "",
+                             listing_id: str = None,
+                             buyer_pubkey: str = None) -> dict:
+        """Request an invoice from a Nostr Lightning Address and record it in the ledger"""
         try:
+            seller_pubkey = None
+            if listing_id is not None:
+                listing = await listing_service.get_listing(listing_id)
+                if not listing:
+                    raise ValueError(f"Listing {listing_id} not found")
+                seller_pubkey = listing["pubkey"]
+
             lnurl_info = await self.get_lnurl_info(lightning_address)
             callback_url = lnurl_info["callback"]
             params = {
                 "amount": amount_sats * 1000, #in milisats
             }
+            self._check_sendable(lnurl_info, params["amount"])
             if comment:
-                params["comment"] = comment
-            full_url = f"{callback_url}?{urllib.parse.urlencode(params)}"
-            async with httpx.AsyncClient() as client:
-                resp = await client.get(full_url)
+                # LUD-12: services reject comments longer than they allow
+                comment_allowed = lnurl_info.get("commentAllowed")
+                params["comment"] = comment[:comment_allowed] if comment_allowed else comment
+            try:
+                # Merge rather than replace, callbacks may carry their own query parameters
+                full_url = httpx.URL(callback_url).copy_merge_params(params)
+                resp = await http_client.get_client().get(full_url)
                 resp.raise_for_status()
                 response_data = resp.json()
+            except Exception:
+                # The cached metadata may be stale (e.g. a moved callback), refetch next time
+                self.lnurl_cache.pop(lightning_address.strip().lower())
+                raise
+            if response_data.get("status") == "ERROR":
+                raise RuntimeError(response_data.get("reason", "LNURL callback failed"))
+
+            payment_request = response_data.get("pr", "")
+            decoded = decode_bolt11(payment_request)
+            if decoded.amount_msat is not None and decoded.amount_msat != amount_sats * 1000:
+                raise ValueError("invoice amount does not match the requested amount")
 
-                invoice_data = {
-                    "type": "zap",
-                    "invoice": response_data.get("pr", ""),
-                    "payment_hash": response_data.get("payment_hash", ""),
-                    "amount": amount_sats,
-                    "fees_paid": 0,
-                    "description": comment,
-                    "created_at": datetime.now().timestamp(),
-                }
+            invoice_data = {
+                "type": "zap",
+                "invoice": payment_request,
+                "payment_hash": decoded.payment_hash,
+                "amount": amount_sats,
+                "fees_paid": 0,
+                "description": comment,
+                "created_at": datetime.now().timestamp(),
+            }
+            await self._record_invoice(
+                invoice_data, decoded.expires_at, listing_id, seller_pubkey, buyer_pubkey, response_data.get("verify")
+            )
 
-                return invoice_data
+            return invoice_data
 
+        except InvoiceAmountError:
+            raise
         except Exception as e:
             raise RuntimeError(f"Failed to create an invoice: {e}")
 
+    async def _record_invoice(self,
+                              invoice_data: dict,
+                              expires_at: int,
+                              listing_id: Optional[str],
+                              seller_pubkey: Optional[str],
+                              buyer_pubkey: Optional[str],
+                              verify_url: Optional[str] = None):
+        now = datetime.utcnow()
+        collection = mongodb.db[self.collection_name]
+        await collection.insert_one({
+            "_id": id_to_db(str(uuid4())),
+            "payment_hash": invoice_data["payment_hash"],
+            "invoice": invoice_data["invoice"],
+            "listing_id": id_to_db(listing_id) if listing_id is not None else None,
+            "seller_pubkey": pubkey_to_db(seller_pubkey),
+            "buyer_pubkey": pubkey_to_db(buyer_pubkey),
+            "amount": invoice_data["amount"],
+            "description": invoice_data["description"],
+            "state": InvoiceState.PENDING.value,
+            "created_at": now,
+            "updated_at": now,
+            "expires_at": datetime.utcfromtimestamp(expires_at),
+            "settled_at": None,
+            # LUD-21, lets the settlement be checked without any wallet, see SettlementWatcher.sweep
+            "verify_url": verify_url,
+        })
+
     async def check_invoice_status(self,nwc_string, invoicestr) -> Invoice:
+        """
+        Answer from the ledger when the invoice is already settled or expired; only
+        pending invoices (and ones we never issued) are looked up in the wallet.
+        """
         try:
-            nwc_info = processNWCstring(nwc_string)
-            nwc_info['relay'] = urllib.parse.unquote(nwc_info['relay'])
-            result = checkInvoice(nwc_info, invoicestr)
+            payment_hash = decode_bolt11(invoicestr).payment_hash
+            record = await self.get_ledger_entry(payment_hash)
+            if record and record["state"] == InvoiceState.PENDING.value and record["expires_at"] <= datetime.utcnow():
+                if await self.mark_expired(payment_hash):
+                    record["state"] = InvoiceState.EXPIRED.value
+            if record and record["state"] != InvoiceState.PENDING.value:
+                return self._to_lookup_result(record)
+
+            session = get_nwc_session(nwc_string)
+            result = await nwc_client.lookup_invoice(session, invoice=invoicestr)
+            settlement = (result or {}).get("result") or {}
+            if record and settlement.get("settled_at") is not None:
+                await self.mark_settled(payment_hash, settlement.get("preimage"), settlement["settled_at"])
             return result
         except Exception as e:
             raise RuntimeError(f"Failed to check invoice: {e}")
 
     async def try_to_pay_invoice(self,nwc_buyer_string, invoicestr) -> Invoice:
         try:
-            nwc_info = processNWCstring(nwc_buyer_string)
-            nwc_info['relay'] = urllib.parse.unquote(nwc_info['relay'])
-            result = tryToPayInvoice(nwc_info, invoicestr)
+            session = get_nwc_session(nwc_buyer_string)
+            result = await nwc_client.pay_invoice(session, invoicestr)
+
+            # A preimage matching the payment hash proves the payment, no lookup needed
+            preimage = ((result or {}).get("result") or {}).get("preimage")
+            if preimage:
+                await self.mark_settled(decode_bolt11(invoicestr).payment_hash, preimage)
             return result
         except Exception as e:
             raise RuntimeError(f"Failed to try to pay invoice: {e}")
@@ -89,10 +342,10 @@ class InvoiceService:
     async def check_payment(self, nwc_buyer_string, invoicestr) -> bool:
         try:
             result = await self.check_invoice_status(nwc_buyer_string, invoicestr)
+            settlement = (result or {}).get("result") or {}
             return (
-                    result and
-                    "result" in result and
-                    result["result"].get("settled_at") is not None
+                    settlement.get("settled_at") is not None and
+                    preimage_matches(settlement.get("preimage"), decode_bolt11(invoicestr).payment_hash)
             )
         except Exception as e:
             raise RuntimeError(f"Failed to check payment: {e}")
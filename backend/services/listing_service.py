@@ -1,14 +1,23 @@
+import calendar
 import hashlib
 import json
 from typing import List, Dict, Any, Optional, cast
 from datetime import datetime
 from uuid import UUID, uuid4
 
-from nostr_sdk import Tag, TagKind
+from pymongo import ReturnDocument
+from nostr_sdk import Event, Tag, TagKind
 
-from models.listing import ListingCreate, ListingInDB, ListingUpdate
+from models.listing import ListingCreate, ListingInDB, ListingUpdate, ListingStatus
 from database import mongodb
 from services.nostr_service import nostr_service
+from services.encoding import (pubkey_to_db, pubkey_from_db, pubkey_filter, id_to_db, id_from_db, id_filter,
+                               npub_to_bytes)
+
+# NIP-99 classified listings: active, and draft/inactive. Both are addressable,
+# so relays keep only the newest event per d tag (the listing id)
+LISTING_KIND = 30402
+LISTING_DRAFT_KIND = 30403
 
 
 class ListingService:
@@ -16,6 +25,12 @@ class ListingService:
 
     collection_name = "listings"
 
+    async def ensure_indexes(self):
+        """Create the indexes used by the per-seller and per-buyer listing queries"""
+        collection = mongodb.db[self.collection_name]
+        await collection.create_index("pubkey")
+        await collection.create_index("paid_by", sparse=True)
+
     @staticmethod
     def _serialize_listing(listing_dict: Dict[Any, Any]) -> Dict[Any, Any]:
         """Convert UUID, datetime, and Pydantic objects to strings for MongoDB"""
@@ -46,13 +61,89 @@ class ListingService:
         if db_listing is None:
             return None
 
-        # Handle ObjectId
+        # Binary UUID _id and pubkeys are converted back to their API representation
         if "_id" in db_listing:
-            db_listing["id"] = str(db_listing["_id"])
+            db_listing["id"] = id_from_db(db_listing["_id"])
             del db_listing["_id"]
+        if "pubkey" in db_listing:
+            db_listing["pubkey"] = pubkey_from_db(db_listing["pubkey"])
+        if db_listing.get("paid_by") is not None:
+            db_listing["paid_by"] = pubkey_from_db(db_listing["paid_by"])
 
         return db_listing
 
+    @staticmethod
+    def _encode_keys(mongo_listing: Dict[Any, Any]) -> Dict[Any, Any]:
+        """
+        Store npub and hex pubkeys in their binary form; anything else is kept as the
+        string it was given, as before binary storage. The id lives only in _id.
+        """
+        mongo_listing.pop("id", None)
+        for field in ("pubkey", "paid_by"):
+            if mongo_listing.get(field) is not None:
+                try:
+                    mongo_listing[field] = pubkey_to_db(mongo_listing[field])
+                except ValueError:
+                    pass
+        return mongo_listing
+
+    @staticmethod
+    def _listing_tags(listing: Dict[Any, Any]) -> List[Tag]:
+        """NIP-99 tags of a listing; the d tag is added by publish_addressable"""
+        created_at = listing.get("created_at") or datetime.utcnow()
+        image = listing.get("image") or {}
+        tags = [
+            Tag.custom(cast(TagKind, TagKind.TITLE()), [listing.get("title", "Untitled Listing")]),
+            Tag.parse(["published_at", str(calendar.timegm(created_at.utctimetuple()))]),
+            Tag.parse(["price", str(listing.get("price", 0)), "SAT"]),
+            Tag.parse(["condition", str(getattr(listing.get("condition"), "value", listing.get("condition")))]),
+            Tag.parse(["status", str(getattr(listing.get("status"), "value", listing.get("status")))]),
+        ]
+        if image.get("url"):
+            tags.append(Tag.parse(["image", str(image["url"])]))
+        try:
+            # The seller, since events are signed with the service key
+            tags.append(Tag.parse(["p", npub_to_bytes(listing["pubkey"]).hex()]))
+        except (KeyError, ValueError):
+            pass
+        return tags
+
+    @staticmethod
+    def _listing_kind(listing: Dict[Any, Any]) -> int:
+        """Ended listings are published as drafts, active and sold ones as listings"""
+        status = getattr(listing.get("status"), "value", listing.get("status"))
+        return LISTING_DRAFT_KIND if status == ListingStatus.ENDED.value else LISTING_KIND
+
+    async def publish_listing(self, listing: Dict[Any, Any]) -> Dict[str, Any]:
+        """
+        Publish the current state of a listing, replacing the previous version on the relays.
+        When the listing moves between kind 30402 and 30403, the version under the previous
+        kind is withdrawn with a deletion request. The result includes the kind published.
+        """
+        kind = self._listing_kind(listing)
+        result = await nostr_service.publish_addressable(
+            kind, listing["id"], listing.get("description", ""), self._listing_tags(listing)
+        )
+        previous_kind = listing.get("nostr_kind")
+        if previous_kind in (LISTING_KIND, LISTING_DRAFT_KIND) and previous_kind != kind:
+            try:
+                await nostr_service.delete_addressable(previous_kind, listing["id"])
+            except Exception as e:
+                print(f"Error withdrawing kind {previous_kind} event of listing {listing['id']}: {e}")
+        result["kind"] = kind
+        return result
+
+    async def fetch_listing_event(self, listing: Dict[Any, Any]) -> Optional[Event]:
+        """The listing as currently published, in a single addressable-event query"""
+        if listing.get("source") == "nostr":
+            # Ingested listings are addressed by their author's own d tag
+            if not listing.get("nostr_identifier"):
+                return None
+            return await nostr_service.fetch_addressable(
+                listing.get("nostr_kind", LISTING_KIND), listing["nostr_identifier"], author=listing["pubkey"]
+            )
+        return await nostr_service.fetch_addressable(self._listing_kind(listing), listing["id"])
+
     async def get_listing(self, listing_id: str) -> Optional[Dict[Any, Any]]:
         """
         Get a listing by ID from MongoDB
@@ -64,7 +155,7 @@ class ListingService:
             Listing data or None if not found
         """
         collection = mongodb.db[self.collection_name]
-        listing = await collection.find_one({"_id": listing_id})
+        listing = await collection.find_one({"_id": id_filter(listing_id)})
 
         if not listing:
             return None
@@ -87,7 +178,7 @@ class ListingService:
         Return all listings that were created by the specified public key.
         """
         collection = mongodb.db[self.collection_name]
-        cursor = collection.find({"pubkey": pubkey})
+        cursor = collection.find({"pubkey": pubkey_filter(pubkey)})
         listings = []
         async for listing in cursor:
             listings.append(self._deserialize_listing(listing))
@@ -98,7 +189,7 @@ class ListingService:
         Return all listings from MongoDB where 'paid_by' equals the given public key.
         """
         collection = mongodb.db[self.collection_name]
-        cursor = collection.find({"paid_by": pubkey})
+        cursor = collection.find({"paid_by": pubkey_filter(pubkey)})
         listings = []
         async for listing in cursor:
             listings.append(self._deserialize_listing(listing))
@@ -127,22 +218,14 @@ class ListingService:
         listing_dict["image"] = {"url": str(listing_dict["image"])}
 
         # Prepare the document for MongoDB insertion.
-        mongo_listing = self._serialize_listing(listing_dict)
-        mongo_listing["_id"] = str(listing_dict["id"])
+        mongo_listing = self._encode_keys(self._serialize_listing(listing_dict))
+        mongo_listing["_id"] = id_to_db(listing_dict["id"])
 
         # Publish to Nostr
         try:
-            title = listing_dict.get("title", "Untitled Listing")
-            price = listing_dict.get("price", 0)
-            condition = listing_dict.get("condition", "unknown")
-            content = f"📦 {title}\nPrice: {price}\nCondition: {condition}\n\n{listing_dict.get('description', '')}"
-            tags = [
-                Tag.custom(cast(TagKind, TagKind.TITLE()), [title]),
-                Tag.custom(cast(TagKind, TagKind.AMOUNT()), [str(price)]),
-                Tag.custom(cast(TagKind, TagKind.DESCRIPTION()), [condition]),
-            ]
-            nostr_result = await nostr_service.publish_event(content, tags)
+            nostr_result = await self.publish_listing(listing_dict)
             mongo_listing["nostr_event_id"] = nostr_result["event_id"]
+            mongo_listing["nostr_kind"] = nostr_result["kind"]
             listing_dict["nostr_event_id"] = nostr_result.get("event_id")
         except Exception as e:
             print(f"Error publishing to Nostr: {e}")
@@ -155,10 +238,11 @@ class ListingService:
     async def update_listing(self, listing_id: str, listing_update: ListingUpdate) -> Optional[Dict[Any, Any]]:
         # Get existing listing
         collection = mongodb.db[self.collection_name]
-        existing = await collection.find_one({"_id": listing_id})
+        existing = await collection.find_one({"_id": id_filter(listing_id)})
 
         if not existing:
             return None
+        db_id = existing["_id"]
 
         # Deserialize and apply updates
         existing = self._deserialize_listing(existing)
@@ -173,58 +257,51 @@ class ListingService:
         # Prepare for MongoDB update
         mongo_listing = self._serialize_listing(existing)
 
-        # Initialize event history if it doesn't exist
-        if "nostr_event_history" not in mongo_listing:
-            mongo_listing["nostr_event_history"] = []
-
-        # Update in Nostr if we have a previous event ID
-        if "nostr_event_id" in existing:
+        # Republish under the same d tag, which replaces the previous version;
+        # listings ingested from other clients are published by their author
+        if existing.get("source") != "nostr":
             try:
-                # Save current event to history before updating
-                previous_event = {
-                    "event_id": existing.get("nostr_event_id", ""),
-                    "identifier": existing.get("nostr_identifier", ""),
-                    "timestamp": datetime.utcnow().isoformat()
-                }
-                # Add to history
-                mongo_listing["nostr_event_history"].append(previous_event)
-
-                # Format content for Nostr
-                title = existing.get("title", "Untitled Listing")
-                price = existing.get("price", 0)
-                condition = existing.get("condition", "unknown")
-                content = f"📦 {title} (Updated)\nPrice: ${price}\nCondition: {condition}\n\n{existing.get('description', '')}"
-
-                # Create tags for updated listing
-                tags = [
-                    Tag.custom(cast(TagKind, TagKind.TITLE()), [title]),
-                    Tag.custom(cast(TagKind, TagKind.AMOUNT()), [str(price)]),
-                    Tag.custom(cast(TagKind, TagKind.DESCRIPTION()), [condition]),
-                ]
-
-                # Publish update to Nostr
-                nostr_result = await nostr_service.publish_update(
-                    content,
-                    existing["nostr_event_id"],
-                    tags
-                )
-
-                # Update MongoDB with new Nostr event ID
+                nostr_result = await self.publish_listing(existing)
                 mongo_listing["nostr_event_id"] = nostr_result["event_id"]
-                mongo_listing["nostr_identifier"] = nostr_result["identifier"]
-
-                # Update return object
-                existing["nostr_event_id"] = mongo_listing["nostr_event_id"]
-                existing["nostr_identifier"] = mongo_listing["nostr_identifier"]
-                existing["nostr_event_history"] = mongo_listing["nostr_event_history"]
+                mongo_listing["nostr_kind"] = nostr_result["kind"]
+                existing["nostr_event_id"] = nostr_result["event_id"]
+                existing["nostr_kind"] = nostr_result["kind"]
             except Exception as e:
                 print(f"Error updating in Nostr: {e}")
 
-        # Update in MongoDB
-        await collection.replace_one({"_id": listing_id}, mongo_listing)
+        # Update in MongoDB; if the id migration moved the document to its binary
+        # _id since it was read, the replace goes to the new document instead
+        mongo_listing = self._encode_keys(dict(mongo_listing))
+        result = await collection.replace_one({"_id": db_id}, mongo_listing)
+        if result.matched_count == 0 and isinstance(db_id, str):
+            await collection.replace_one({"_id": id_to_db(db_id)}, mongo_listing)
 
         return existing
 
+    async def mark_sold(self, listing_id: str, buyer_pubkey: Optional[str]) -> Optional[Dict[Any, Any]]:
+        """
+        Atomically move an active listing to sold and record its buyer. Returns the
+        updated listing, or None if it was already sold (or does not exist), so a
+        settlement seen twice cannot overwrite the first buyer.
+        """
+        collection = mongodb.db[self.collection_name]
+        listing = await collection.find_one_and_update(
+            {"_id": id_filter(listing_id), "status": ListingStatus.ACTIVE.value, "paid_by": None},
+            {"$set": {
+                "status": ListingStatus.SOLD.value,
+                "paid_by": pubkey_to_db(buyer_pubkey),
+                "updated_at": datetime.utcnow(),
+            }},
+            return_document=ReturnDocument.AFTER
+        )
+        listing = self._deserialize_listing(listing)
+        if listing is not None and listing.get("source") != "nostr":
+            try:
+                await self.publish_listing(listing)
+            except Exception as e:
+                print(f"Error publishing sold listing to Nostr: {e}")
+        return listing
+
     def validate_proof_of_work(self, listing_data: dict, nonce: int, difficulty: int = 7) -> (bool, str):
         """
         Validates that the SHA-256 hash of the concatenation of the listing data (as a compact JSON)
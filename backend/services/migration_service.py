@@ -0,0 +1,232 @@
+import asyncio
+from datetime import datetime
+from typing import List, Tuple
+
+from pymongo import UpdateOne
+
+from database import mongodb
+from services.encoding import pubkey_to_db, pubkey_from_db, id_to_db, id_filter
+from services.listing_service import listing_service, LISTING_KIND, LISTING_DRAFT_KIND
+from services.review_service import review_service
+
+
+class MigrationService:
+    """
+    Background migration of documents that still hold bech32 pubkeys and UUID strings
+    to the compact binary encoding. Every step is idempotent, so an interrupted run is
+    simply resumed on the next startup.
+    """
+
+    batch_size = 500
+    # Listings published concurrently while republishing
+    publish_concurrency = 16
+    # Records the one-off steps that have completed, so they are skipped on later starts
+    collection_name = "migrations"
+
+    # (collection, field) pairs holding bech32 pubkeys
+    pubkey_fields: List[Tuple[str, str]] = [
+        ("users", "nostr_public_key"),
+        ("listings", "pubkey"),
+        ("listings", "paid_by"),
+        ("reviews", "seller_pubkey"),
+        ("sessions", "public_key"),
+    ]
+
+    # Collections whose _id is a UUID string
+    id_collections: List[str] = ["users", "listings"]
+
+    async def run(self):
+        """All startup migrations; meant to run as a background task"""
+        await self.migrate_binary_encoding()
+        await self.clear_failed_event_ids()
+        await self.republish_listings()
+
+    async def migrate_reviews(self):
+        """
+        The review steps, awaited at startup before requests are served: rebuilding
+        the seller aggregates overwrites them, which would lose concurrent review writes
+        """
+        try:
+            await self._migrate_pubkey_field("reviews", "seller_pubkey")
+        except Exception as e:
+            print(f"Review seller pubkey migration stopped: {e}")
+        await self.migrate_review_sellers()
+
+    async def migrate_binary_encoding(self):
+        """Convert all legacy pubkeys and ids; meant to run as a background task"""
+        try:
+            for collection_name, field in self.pubkey_fields:
+                converted = await self._migrate_pubkey_field(collection_name, field)
+                if converted:
+                    print(f"Migrated {converted} {collection_name}.{field} values to binary")
+
+            for collection_name in self.id_collections:
+                converted = await self._migrate_ids(collection_name)
+                if converted:
+                    print(f"Migrated {converted} {collection_name} ids to binary UUIDs")
+        except Exception as e:
+            print(f"Binary encoding migration stopped: {e}")
+
+    async def clear_failed_event_ids(self):
+        """Drop the "nostr-error-..." placeholders older publishes stored as event ids"""
+        try:
+            result = await mongodb.db["listings"].update_many(
+                {"nostr_event_id": {"$regex": "^nostr-error"}},
+                {"$unset": {"nostr_event_id": ""}}
+            )
+            if result.modified_count:
+                print(f"Cleared {result.modified_count} placeholder Nostr event ids")
+        except Exception as e:
+            print(f"Clearing placeholder Nostr event ids failed: {e}")
+
+    async def republish_listings(self):
+        """
+        Publish listings that only exist as kind 1 notes (or were never published)
+        as addressable listing events, so each one is a single event on the relays.
+        A listing that fails to publish is skipped and retried on the next start;
+        once every listing is published the step no longer runs.
+        """
+        step = "republish_listings"
+        migrations = mongodb.db[self.collection_name]
+        collection = mongodb.db[listing_service.collection_name]
+        slots = asyncio.Semaphore(self.publish_concurrency)
+
+        async def publish(listing):
+            async with slots:
+                try:
+                    return await listing_service.publish_listing(listing)
+                except Exception as e:
+                    print(f"Republishing listing {listing['id']} failed: {e}")
+                    return None
+
+        republished = 0
+        failed = []
+        try:
+            if await migrations.find_one({"_id": step}):
+                return
+            while True:
+                cursor = collection.find({
+                    "_id": {"$nin": failed},
+                    "nostr_kind": {"$nin": [LISTING_KIND, LISTING_DRAFT_KIND]},
+                    "source": {"$ne": "nostr"},
+                }).limit(self.batch_size)
+                docs = [doc async for doc in cursor]
+                if not docs:
+                    break
+                ids = [doc["_id"] for doc in docs]
+                listings = [listing_service._deserialize_listing(doc) for doc in docs]
+                results = await asyncio.gather(*(publish(listing) for listing in listings))
+
+                operations = []
+                for db_id, result in zip(ids, results):
+                    if result is None:
+                        failed.append(db_id)
+                        continue
+                    operations.append(UpdateOne(
+                        {"_id": db_id},
+                        {"$set": {"nostr_event_id": result["event_id"], "nostr_kind": result["kind"]}}
+                    ))
+                if operations:
+                    await collection.bulk_write(operations, ordered=False)
+                    republished += len(operations)
+
+            if not failed:
+                await migrations.update_one(
+                    {"_id": step}, {"$set": {"completed_at": datetime.utcnow()}}, upsert=True
+                )
+        except Exception as e:
+            print(f"Republishing listings as addressable events stopped: {e}")
+        if republished or failed:
+            print(f"Republished {republished} listings as addressable events, {len(failed)} failed")
+
+    async def migrate_review_sellers(self):
+        """
+        Older reviews stored the reviewer in seller_pubkey and no creation time: move it to
+        reviewer_pubkey, take the seller from the reviewed listing, then rebuild the seller
+        aggregates if they do not add up to the verified reviews
+        """
+        reviews = mongodb.db[review_service.collection_name]
+        listings = mongodb.db[listing_service.collection_name]
+        try:
+            # Review pages are ordered by created_at; older reviews get their ObjectId's time
+            await reviews.update_many(
+                {"created_at": {"$exists": False}},
+                [{"$set": {"created_at": {"$toDate": "$_id"}}}]
+            )
+
+            fixed = 0
+            cursor = reviews.find({"reviewer_pubkey": {"$exists": False}}).batch_size(self.batch_size)
+            async for review in cursor:
+                listing = await listings.find_one({"_id": id_filter(review["transaction_id"])}, {"pubkey": 1})
+                update = {"reviewer_pubkey": review["seller_pubkey"]}
+                try:
+                    update["seller_pubkey"] = pubkey_to_db(pubkey_from_db(listing["pubkey"]))
+                except (TypeError, ValueError):
+                    # Without the listing the seller is unknown; keep the review out of the aggregates
+                    update["verified"] = False
+                await reviews.update_one({"_id": review["_id"], "reviewer_pubkey": {"$exists": False}}, {"$set": update})
+                fixed += 1
+
+            if fixed or not await review_service.reputation_in_sync():
+                sellers = await review_service.rebuild_reputation()
+                print(f"Moved reviewers of {fixed} reviews, rebuilt reputation of {sellers} sellers")
+        except Exception as e:
+            print(f"Review seller migration stopped: {e}")
+
+    async def _migrate_pubkey_field(self, collection_name: str, field: str) -> int:
+        collection = mongodb.db[collection_name]
+        cursor = collection.find({field: {"$type": "string"}}, {field: 1}).batch_size(self.batch_size)
+
+        converted = 0
+        operations = []
+        async for doc in cursor:
+            try:
+                binary_pubkey = pubkey_to_db(doc[field])
+            except ValueError:
+                print(f"Skipping invalid pubkey in {collection_name}.{field}: {doc[field]}")
+                continue
+
+            # Matching on the old value keeps the update safe against concurrent writes
+            operations.append(UpdateOne(
+                {"_id": doc["_id"], field: doc[field]},
+                {"$set": {field: binary_pubkey}}
+            ))
+            if len(operations) >= self.batch_size:
+                converted += (await collection.bulk_write(operations, ordered=False)).modified_count
+                operations = []
+
+        if operations:
+            converted += (await collection.bulk_write(operations, ordered=False)).modified_count
+        return converted
+
+    async def _migrate_ids(self, collection_name: str) -> int:
+        """
+        _id is immutable in MongoDB, so each document is re-inserted under its binary
+        UUID and the string-keyed original is removed afterwards. The original is only
+        removed if it is unchanged since it was copied; a write in between is copied again.
+        """
+        collection = mongodb.db[collection_name]
+        cursor = collection.find({"_id": {"$type": "string"}}).batch_size(self.batch_size)
+
+        converted = 0
+        async for doc in cursor:
+            try:
+                binary_id = id_to_db(doc["_id"])
+            except ValueError:
+                print(f"Skipping non-UUID id in {collection_name}: {doc['_id']}")
+                continue
+
+            while doc is not None:
+                migrated = {key: value for key, value in doc.items() if key != "id"}
+                migrated["_id"] = binary_id
+                # Upsert, as an earlier, interrupted run may have copied it already
+                await collection.replace_one({"_id": binary_id}, migrated, upsert=True)
+                if (await collection.delete_one(doc)).deleted_count:
+                    break
+                doc = await collection.find_one({"_id": doc["_id"]})
+            converted += 1
+
+        return converted
+
+
+migration_service = MigrationService()
@@ -1,16 +1,37 @@
+import asyncio
 import hashlib
 import os
 import secrets
 import time
-from typing import Dict, List, Optional
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
 from dotenv import load_dotenv
-from nostr_sdk import Keys, Client, EventBuilder, NostrSigner, Tag, Kind, KindStandard
+from nostr_sdk import (Keys, Client, Event, EventBuilder, Filter, HandleNotification, NostrSigner,
+                       PublicKey, RelayMessage, RelayStatus, Tag, Kind, KindStandard)
+from pymongo import UpdateOne
 import json
-import websocket
 import bech32
 
+from database import mongodb
+from services.relay_health import RelayHealthTracker
+
 load_dotenv()
 
+# Relays that must answer OK for an event to count as delivered; 0 means a majority
+NOSTR_PUBLISH_QUORUM = int(os.getenv("NOSTR_PUBLISH_QUORUM", "0"))
+# Events sent concurrently by one batch publish
+PUBLISH_PIPELINE_DEPTH = 64
+# Events short of their quorum are re-sent this often, up to this many times
+DELIVERY_RETRY_INTERVAL_SECONDS = 60
+DELIVERY_MAX_ATTEMPTS = 5
+# Reads go to this many of the fastest healthy read relays
+RELAY_READ_FANOUT = 2
+RELAY_READ_TIMEOUT_SECONDS = 5
+
+
+class NostrPublishError(Exception):
+    """The event could not be built, signed or handed to the relays"""
+
 
 async def npub_to_hex(npub):
     """
@@ -24,25 +45,71 @@ async def npub_to_hex(npub):
     return bytes(data_bytes).hex()
 
 
+class RelayNotificationHandler(HandleNotification):
+    """
+    Feeds rate-limit NOTICE and CLOSED messages into the relay health scores and
+    hands subscription events to the callback registered for the subscription
+    """
+
+    def __init__(self, health: RelayHealthTracker, subscriptions: Dict[str, Callable[[Event], None]]):
+        super().__init__()
+        self.health = health
+        self.subscriptions = subscriptions
+
+    async def handle_msg(self, relay_url: str, msg: RelayMessage):
+        message = msg.as_enum()
+        if message.is_notice() or message.is_closed():
+            self.health.record_notice(relay_url, message.message)
+
+    async def handle(self, relay_url: str, subscription_id: str, event: Event):
+        callback = self.subscriptions.get(subscription_id)
+        if callback:
+            try:
+                callback(event)
+            except Exception as e:
+                print(f"Error handling event {event.id().to_hex()} from {relay_url}: {e}")
+
+
 class NostrService:
     """
     A Nostr service for publishing various types of events
     to the Nostr network using the nostr-sdk library
     """
 
-    def __init__(self, private_key_hex: str = None, relays: List[str] = None):
+    collection_name = "nostr_deliveries"
+
+    def __init__(self, private_key_hex: str = None, relays: List[str] = None, read_relays: List[str] = None):
         """
         Initialize the Nostr service
 
         Args:
             private_key_hex: Hex string of private key
-            relays: List of relay URLs
+            relays: List of relay URLs events are published to
+            read_relays: List of relay URLs queried for events, defaults to relays
         """
         self.private_key_hex = private_key_hex
         self.relays = relays if relays else ["ws://localhost:8080"]
+        self.read_relays = read_relays if read_relays else list(self.relays)
+        self.health = RelayHealthTracker(self.relays + self.read_relays)
         self.client = None
         self.signer = None
         self.is_connected = False
+        # subscription id -> callback for its events
+        self.subscriptions: Dict[str, Callable[[Event], None]] = {}
+        self._connect_lock = asyncio.Lock()
+        self._notification_task: Optional[asyncio.Task] = None
+        # Sends still running after their event reached the quorum; they only update the scores
+        self._stragglers: Set[asyncio.Task] = set()
+
+    @property
+    def quorum(self) -> int:
+        majority = len(self.relays) // 2 + 1
+        return min(NOSTR_PUBLISH_QUORUM or majority, len(self.relays))
+
+    async def ensure_indexes(self):
+        """Index the deliveries still short of their quorum, which the retry loop scans"""
+        collection = mongodb.db[self.collection_name]
+        await collection.create_index([("quorum_met", 1), ("attempts", 1)])
 
     def _generate_unique_id(self):
         """Generate a unique ID for events."""
@@ -53,48 +120,42 @@ class NostrService:
 
         return unique_id
 
-    async def connect(self, custom_private_key: str = None):
+    async def connect(self):
         """
-        Connect to Nostr relays
-
-        Args:
-            custom_private_key: Optional private key to use instead of the default
+        Connect to Nostr relays, once, with the service key; concurrent callers share
+        the connection instead of replacing it
         """
-        if self.is_connected:
-            return
-
-        try:
-            if custom_private_key:
-                keys = Keys.parse(custom_private_key)
-            else:
-                keys = Keys.parse(self.private_key_hex)
-
-            self.signer = NostrSigner.keys(keys)
-            self.client = Client(self.signer)
-
-            for relay in self.relays:
-                await self.client.add_relay(relay)
-
-            await self.client.connect()
-            self.is_connected = True
-        except Exception as e:
-            self.is_connected = False
-            raise e
-
-    async def ensure_connected(self, custom_private_key: str = None):
+        async with self._connect_lock:
+            if not self.is_connected:
+                try:
+                    self.signer = NostrSigner.keys(Keys.parse(self.private_key_hex))
+                    self.client = Client(self.signer)
+
+                    for relay in self.relays:
+                        await self.client.add_relay(relay)
+                    for relay in self.read_relays:
+                        await self.client.add_read_relay(relay)
+
+                    await self.client.connect()
+                    self._notification_task = asyncio.create_task(
+                        self.client.handle_notifications(RelayNotificationHandler(self.health, self.subscriptions))
+                    )
+                    self.is_connected = True
+                except Exception as e:
+                    self.is_connected = False
+                    raise e
+
+    async def ensure_connected(self):
         """
         Ensure we're connected to relays before operations
-
-        Args:
-            custom_private_key: Optional private key to use for this connection
         """
-        if not self.is_connected or custom_private_key:
-            await self.connect(custom_private_key)
+        if not self.is_connected:
+            await self.connect()
 
     async def publish_event(self,
                             content: str,
                             tags: List[Tag] = None,
-                            kind_value: int = None) -> Dict[str, str]:
+                            kind_value: int = None) -> Dict[str, Any]:
         """
         Publish a generic event to Nostr relays with an automatically generated unique identifier.
 
@@ -104,15 +165,15 @@ class NostrService:
             kind_value: Integer value of the Kind (optional)
 
         Returns:
-            Dictionary with event_id and identifier
+            Dictionary with event_id, identifier and the per-relay delivery status
+
+        Raises:
+            NostrPublishError: if the event could not be signed or sent at all
         """
         await self.ensure_connected()
 
         if not self.client or not self.signer:
-            return {
-                "event_id": "nostr-error-not-initialized",
-                "identifier": ""
-            }
+            raise NostrPublishError("Nostr client is not initialized")
 
         try:
             unique_id = self._generate_unique_id()
@@ -131,33 +192,28 @@ class NostrService:
             for tag in tags:
                 builder = builder.tags([tag])
             event = await builder.sign(self.signer)
-            await self.client.send_event(event)
-            event_id = event.id().to_hex()
-            return {
-                "event_id": event_id, #nostr event id
-                "identifier": unique_id #our id
-            }
         except Exception as e:
-            return {
-                "event_id": f"nostr-error-{str(e)}",
-                "identifier": ""
-            }
+            raise NostrPublishError(f"Error building Nostr event: {e}")
+
+        delivery = (await self.send_events([event]))[0]
+        return {
+            "event_id": delivery["event_id"], #nostr event id
+            "identifier": unique_id, #our id
+            "delivery": delivery,
+        }
 
     
     async def publish_update(self,
                              content: str,
                              previous_event_id: str,
-                             tags: List[Tag] = None) -> Dict[str, str]:
+                             tags: List[Tag] = None) -> Dict[str, Any]:
         """
         Publish an update to a previous Nostr event, referencing the original event.
         """
         await self.ensure_connected()
 
         if not self.client or not self.signer:
-            return {
-                "event_id": "nostr-error-not-initialized",
-                "identifier": ""
-            }
+            raise NostrPublishError("Nostr client is not initialized")
 
         try:
             # Generate a unique identifier
@@ -181,25 +237,284 @@ class NostrService:
             for tag in tags:
                 builder = builder.tags([tag])
 
-            # Sign and send the event
+            # Sign the event
             event = await builder.sign(self.signer)
-            await self.client.send_event(event)
+        except Exception as e:
+            raise NostrPublishError(f"Error building Nostr update: {e}")
+
+        delivery = (await self.send_events([event]))[0]
+        return {
+            "event_id": delivery["event_id"],
+            "identifier": unique_id,
+            "delivery": delivery,
+        }
+
+    async def publish_addressable(self,
+                                  kind_value: int,
+                                  identifier: str,
+                                  content: str,
+                                  tags: List[Tag] = None) -> Dict[str, Any]:
+        """
+        Publish an addressable (parameterized replaceable) event: relays keep only the
+        newest event per kind, author and d tag, so publishing again replaces it.
 
-            # Get the event ID in hex format
-            event_id = event.id().to_hex()
+        Returns:
+            Dictionary with event_id, identifier (the d tag) and the per-relay delivery status
+        """
+        await self.ensure_connected()
 
+        if not self.client or not self.signer:
+            raise NostrPublishError("Nostr client is not initialized")
+
+        try:
+            builder = EventBuilder(Kind(kind_value), content).tags([Tag.identifier(identifier)] + (tags or []))
+            event = await builder.sign(self.signer)
+        except Exception as e:
+            raise NostrPublishError(f"Error building Nostr event: {e}")
+
+        delivery = (await self.send_events([event]))[0]
+        return {
+            "event_id": delivery["event_id"],
+            "identifier": identifier,
+            "delivery": delivery,
+        }
+
+    async def fetch_addressable(self, kind_value: int, identifier: str, author: str = None) -> Optional[Event]:
+        """The current version of an addressable event (by default one of ours), or None"""
+        await self.ensure_connected()
+        author_key = PublicKey.parse(author) if author else await self.signer.get_public_key()
+        address_filter = Filter().kind(Kind(kind_value)).author(author_key).identifier(identifier).limit(1)
+        events = await self.fetch_events(address_filter, relays=self.relays)
+        return max(events, key=lambda event: event.created_at().as_secs()) if events else None
+
+    async def delete_addressable(self, kind_value: int, identifier: str) -> Dict[str, Any]:
+        """Ask the relays to drop our addressable event of this kind and d tag (a NIP-09 deletion request)"""
+        await self.ensure_connected()
+        if not self.client or not self.signer:
+            raise NostrPublishError("Nostr client is not initialized")
+        pubkey = (await self.signer.get_public_key()).to_hex()
+        builder = EventBuilder(Kind.from_std(KindStandard.EVENT_DELETION), "").tags([
+            Tag.parse(["a", f"{kind_value}:{pubkey}:{identifier}"]),
+            Tag.parse(["k", str(kind_value)]),
+        ])
+        return (await self.publish_events([builder]))[0]
+
+    async def publish_events(self, builders: List[EventBuilder]) -> List[Dict[str, Any]]:
+        """Sign a batch of events with the service key and publish them pipelined"""
+        await self.ensure_connected()
+        if not self.client or not self.signer:
+            raise NostrPublishError("Nostr client is not initialized")
+        try:
+            events = [await builder.sign(self.signer) for builder in builders]
+        except Exception as e:
+            raise NostrPublishError(f"Error signing Nostr events: {e}")
+        return await self.send_events(events)
+
+    async def send_events(self,
+                          events: List[Event],
+                          previously_accepted: Dict[str, List[str]] = None) -> List[Dict[str, Any]]:
+        """
+        Send signed events with up to PUBLISH_PIPELINE_DEPTH in flight and persist the outcome.
+        Each event goes to the usable write relays one send per relay, so every answer feeds
+        the relay health scores, and returns as soon as the quorum answered OK; relays still
+        pending then are neither accepted nor rejected. Events short of the quorum keep their
+        JSON so the retry loop can re-send them.
+        """
+        previously_accepted = previously_accepted or {}
+        semaphore = asyncio.Semaphore(PUBLISH_PIPELINE_DEPTH)
+        quorum = self.quorum
+
+        async def send(event: Event) -> Dict[str, Any]:
+            # Relays that acknowledged an earlier attempt still hold the event
+            event_id = event.id().to_hex()
+            accepted = set(previously_accepted.get(event_id, []))
+            rejected = {}
+            async with semaphore:
+                targets = [url for url in self.health.write_relays(self.relays, quorum) if url not in accepted]
+                pending = {asyncio.create_task(self._send_to(url, event)) for url in targets}
+                while pending and len(accepted) < quorum:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        url, error = task.result()
+                        if error is None:
+                            accepted.add(url)
+                        else:
+                            rejected[url] = error
+            for task in pending:
+                self._stragglers.add(task)
+                task.add_done_callback(self._stragglers.discard)
             return {
                 "event_id": event_id,
-                "identifier": unique_id
+                "accepted": sorted(accepted),
+                "rejected": rejected,
+                "quorum": quorum,
+                "quorum_met": len(accepted) >= quorum,
             }
+
+        deliveries = await asyncio.gather(*(send(event) for event in events))
+        await self._record_deliveries(list(zip(events, deliveries)))
+        for delivery in deliveries:
+            if not delivery["quorum_met"]:
+                print(f"Nostr event {delivery['event_id']} reached {len(delivery['accepted'])}/"
+                      f"{delivery['quorum']} relays: {delivery['rejected']}")
+        return deliveries
+
+    async def _relay_connected(self, url: str) -> bool:
+        """
+        Sends to a disconnected relay wait for it to reconnect, so they are scored as
+        failed at once; a relay still connecting (e.g. right after startup) is waited for
+        """
+        try:
+            connected = (await self.client.relay(url)).status() not in (
+                RelayStatus.DISCONNECTED, RelayStatus.TERMINATED
+            )
+        except Exception:
+            connected = False
+        if not connected:
+            self.health.record(url, None, False, "not connected")
+        return connected
+
+    async def _send_to(self, url: str, event: Event) -> Tuple[str, Optional[str]]:
+        """Send the event to one relay and score the answer; returns the relay and its error, if any"""
+        if not await self._relay_connected(url):
+            return url, "not connected"
+        started = time.perf_counter()
+        try:
+            output = await self.client.send_event_to([url], event)
+            error = None if output.success else next(iter(output.failed.values()), None) or "no answer"
         except Exception as e:
-            return {
-                "event_id": f"nostr-error-{str(e)}",
-                "identifier": ""
+            error = str(e)
+        self.health.record(url, time.perf_counter() - started, error is None, error)
+        return url, error
+
+    async def fetch_events(self,
+                           filter: Filter,
+                           timeout: float = RELAY_READ_TIMEOUT_SECONDS,
+                           relays: List[str] = None) -> List[Event]:
+        """
+        Query the RELAY_READ_FANOUT fastest healthy read relays (or of relays, if given) and
+        return the events of the first one that has any (merged with any answered at the
+        same time), or none
+        """
+        await self.ensure_connected()
+
+        async def fetch(url: str) -> List[Event]:
+            if not await self._relay_connected(url):
+                return []
+            started = time.perf_counter()
+            try:
+                events = (await self.client.fetch_events_from([url], filter, timedelta(seconds=timeout))).to_vec()
+            except Exception as e:
+                self.health.record(url, time.perf_counter() - started, False, str(e))
+                return []
+            elapsed = time.perf_counter() - started
+            # A relay that never sent EOSE is only cut off by the timeout
+            timed_out = elapsed >= timeout * 0.95
+            self.health.record(url, elapsed, not timed_out, "timed out" if timed_out else None)
+            return events
+
+        pending = {asyncio.create_task(fetch(url)) for url in self.health.read_relays(relays or self.read_relays, RELAY_READ_FANOUT)}
+        merged = {}
+        while pending and not merged:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                for event in task.result():
+                    merged.setdefault(event.id().to_hex(), event)
+        for task in pending:
+            self._stragglers.add(task)
+            task.add_done_callback(self._stragglers.discard)
+        return list(merged.values())
+
+    async def subscribe(self, filter: Filter, callback: Callable[[Event], None], relays: List[str] = None) -> str:
+        """
+        Stream events matching the filter from the given relays (the write relays by
+        default) to callback, which runs on the event loop and must not block
+        """
+        await self.ensure_connected()
+        output = await self.client.subscribe_to(relays or self.relays, filter)
+        self.subscriptions[output.id] = callback
+        return output.id
+
+    async def unsubscribe(self, subscription_id: str):
+        self.subscriptions.pop(subscription_id, None)
+        if self.client and self.is_connected:
+            await self.client.unsubscribe(subscription_id)
+
+    def relay_diagnostics(self) -> Dict[str, Any]:
+        scores = {item["url"]: item for item in self.health.snapshot()}
+        return {
+            "write_relays": [scores[url] for url in scores if url in self.relays],
+            "read_relays": [scores[url] for url in scores if url in self.read_relays],
+            "quorum": self.quorum,
+        }
+
+    async def _record_deliveries(self, sent: List[tuple]):
+        if mongodb.db is None or not sent:
+            return
+        now = datetime.utcnow()
+        operations = []
+        for event, delivery in sent:
+            update = {
+                "$set": {
+                    "accepted": delivery["accepted"],
+                    "rejected": delivery["rejected"],
+                    "quorum": delivery["quorum"],
+                    "quorum_met": delivery["quorum_met"],
+                    "updated_at": now,
+                },
+                "$inc": {"attempts": 1},
+                "$setOnInsert": {"created_at": now},
             }
+            if delivery["quorum_met"]:
+                update["$unset"] = {"event_json": ""}
+            else:
+                update["$set"]["event_json"] = event.as_json()
+            operations.append(UpdateOne({"_id": delivery["event_id"]}, update, upsert=True))
+        try:
+            await mongodb.db[self.collection_name].bulk_write(operations, ordered=False)
+        except Exception as e:
+            print(f"Error recording Nostr deliveries: {e}")
+
+    async def get_delivery(self, event_id: str) -> Optional[Dict[str, Any]]:
+        delivery = await mongodb.db[self.collection_name].find_one({"_id": event_id}, {"event_json": 0})
+        if delivery:
+            delivery["event_id"] = delivery.pop("_id")
+        return delivery
+
+    async def retry_pending_deliveries(self) -> int:
+        """Re-send stored events that did not reach their quorum; returns how many now did"""
+        collection = mongodb.db[self.collection_name]
+        cursor = collection.find(
+            {"quorum_met": False, "attempts": {"$lt": DELIVERY_MAX_ATTEMPTS}, "event_json": {"$exists": True}}
+        ).limit(PUBLISH_PIPELINE_DEPTH * 4)
+        events = []
+        previously_accepted = {}
+        async for delivery in cursor:
+            events.append(Event.from_json(delivery["event_json"]))
+            previously_accepted[delivery["_id"]] = delivery.get("accepted", [])
+        if not events:
+            return 0
+        await self.ensure_connected()
+        deliveries = await self.send_events(events, previously_accepted)
+        return sum(1 for delivery in deliveries if delivery["quorum_met"])
+
+    async def run_delivery_retries(self):
+        """Retry loop, started from the app lifespan"""
+        while True:
+            await asyncio.sleep(DELIVERY_RETRY_INTERVAL_SECONDS)
+            try:
+                await self.retry_pending_deliveries()
+            except Exception as e:
+                print(f"Error retrying Nostr deliveries: {e}")
 
     async def close(self):
         """Close connections to relays"""
+        for task in list(self._stragglers):
+            task.cancel()
+        if self._notification_task:
+            self._notification_task.cancel()
+            self._notification_task = None
+        self.subscriptions.clear()
         if self.client and self.is_connected:
             await self.client.disconnect()
             self.is_connected = False
@@ -208,27 +523,21 @@ class NostrService:
 
     async def get_nostr_profile(self,pubkey):
         """
-                Return a nostr profile from the Primal Nostr relay
+                Return a nostr profile (kind 0 content) from the read relays
         """
-        ws = websocket.create_connection("wss://relay.primal.net/")
         pubkey_hex = await npub_to_hex(pubkey)
-        req = ["REQ", "find-ln", {"kinds": [0], "authors": [pubkey_hex]}]
-        ws.send(json.dumps(req))
-        while True:
-            response = json.loads(ws.recv())
-            if response[0] == "EVENT" and response[2]["kind"] == 0:
-                metadata = json.loads(response[2]["content"])
-                ws.close()
-                return metadata
-            if response[0] == "EOSE":
-                break
-        ws.close()
-        return None
+        profile_filter = Filter().kind(Kind(0)).author(PublicKey.parse(pubkey_hex)).limit(1)
+        events = await self.fetch_events(profile_filter)
+        if not events:
+            return None
+        latest = max(events, key=lambda event: event.created_at().as_secs())
+        return json.loads(latest.content())
 
 
 # load env variables
 private_key_hex = os.getenv("NOSTR_PRIVATE_KEY")
 relays = os.getenv("NOSTR_RELAYS", "ws://localhost:8080").split(",")
+read_relays = os.getenv("NOSTR_READ_RELAYS", "wss://relay.primal.net").split(",")
 
 if not private_key_hex:
     raise ValueError("NOSTR_PRIVATE_KEY environment variable is not set")
@@ -239,4 +548,5 @@ if not relays:
 nostr_service = NostrService(
     private_key_hex=private_key_hex,
     relays=relays,
+    read_relays=read_relays,
 )
\ No newline at end of file
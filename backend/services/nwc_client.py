@@ -0,0 +1,271 @@
+import asyncio
+import json
+import secrets
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from websockets.asyncio.client import connect
+
+from services.nwc_session import NWCSession
+
+NWC_REQUEST_KIND = 23194
+NWC_RESPONSE_KIND = 23195
+NWC_NOTIFICATION_KIND = 23196
+
+# Seconds to wait for a wallet response; paying may involve Lightning routing
+NWC_DEFAULT_TIMEOUT = 15
+NWC_PAY_TIMEOUT = 60
+
+# Relays commonly cap subscriptions per connection, so the pool opens another
+# connection to the same relay once this many app pubkeys are subscribed
+NWC_MAX_SUBSCRIPTIONS_PER_CONNECTION = 20
+# Subscriptions unused for this long are closed to make room for others
+NWC_IDLE_SUBSCRIPTION_SECONDS = 300
+# Websocket ping interval keeping pooled connections alive
+NWC_PING_INTERVAL_SECONDS = 20
+
+
+class NWCError(Exception):
+    """The relay rejected a request or the wallet did not answer in time"""
+
+
+class NWCConnection:
+    """
+    A persistent relay websocket shared by all wallets using that relay. Each app pubkey
+    gets one long-lived subscription to its kind 23195 responses and 23196 notifications;
+    a background task hands every response to the caller waiting on the request id in
+    its e tag, and every notification to on_notification. Responses not signed by the
+    caller's wallet are dropped, so a relay cannot answer in the wallet's place.
+    """
+
+    def __init__(self, relay_url: str, on_notification: Callable[[dict], None] = None):
+        self.relay_url = relay_url
+        self.on_notification = on_notification
+        self.websocket = None
+        self._reader: Optional[asyncio.Task] = None
+        # request id -> (future of the response, session of the requesting wallet)
+        self._pending: Dict[str, tuple] = {}
+        # app pubkey -> [subscription id, last used]
+        self.subscriptions: Dict[str, list] = {}
+
+    async def open(self):
+        self.websocket = await connect(self.relay_url, ping_interval=NWC_PING_INTERVAL_SECONDS)
+        self._reader = asyncio.create_task(self._read_loop())
+
+    async def close(self):
+        if self._reader:
+            self._reader.cancel()
+        if self.websocket:
+            await self.websocket.close()
+        self._fail_pending(NWCError("connection closed"))
+
+    @property
+    def is_open(self) -> bool:
+        return self._reader is not None and not self._reader.done()
+
+    @property
+    def has_capacity(self) -> bool:
+        return len(self.subscriptions) < NWC_MAX_SUBSCRIPTIONS_PER_CONNECTION
+
+    async def subscribe(self, app_pubkey: str):
+        """Open the long-lived response subscription of an app pubkey unless it exists"""
+        subscription = self.subscriptions.get(app_pubkey)
+        if subscription:
+            subscription[1] = time.monotonic()
+            return
+
+        subscription_id = secrets.token_hex(8)
+        self.subscriptions[app_pubkey] = [subscription_id, time.monotonic()]
+        # "since" allows for clock skew between us and the wallet service
+        subscription_filter = {"kinds": [NWC_RESPONSE_KIND, NWC_NOTIFICATION_KIND], "#p": [app_pubkey], "since": int(time.time()) - 60}
+        await self.websocket.send(json.dumps(["REQ", subscription_id, subscription_filter]))
+
+    async def close_idle_subscriptions(self):
+        cutoff = time.monotonic() - NWC_IDLE_SUBSCRIPTION_SECONDS
+        for app_pubkey, (subscription_id, last_used) in list(self.subscriptions.items()):
+            if last_used < cutoff:
+                del self.subscriptions[app_pubkey]
+                await self.websocket.send(json.dumps(["CLOSE", subscription_id]))
+
+    async def _read_loop(self):
+        try:
+            async for raw_message in self.websocket:
+                self._dispatch(json.loads(raw_message))
+        except Exception as e:
+            self._fail_pending(NWCError(f"relay connection lost: {e}"))
+        else:
+            self._fail_pending(NWCError("relay closed the connection"))
+
+    def _dispatch(self, message: list):
+        if message[0] == "EVENT" and len(message) >= 3:
+            event = message[2]
+            if event.get("kind") == NWC_NOTIFICATION_KIND:
+                if self.on_notification:
+                    self.on_notification(event)
+                return
+            for tag in event.get("tags", []):
+                if len(tag) >= 2 and tag[0] == "e" and tag[1] in self._pending:
+                    future, session = self._pending[tag[1]]
+                    # A forged answer is ignored and the caller keeps waiting for the wallet's
+                    if not future.done() and session.verify_event(event):
+                        future.set_result(event)
+        elif message[0] == "OK" and len(message) >= 3 and not message[2]:
+            # The relay refused our request event, no response will ever come
+            future, _ = self._pending.get(message[1], (None, None))
+            if future and not future.done():
+                reason = message[3] if len(message) > 3 else ""
+                future.set_exception(NWCError(f"relay rejected request: {reason}"))
+        elif message[0] == "NOTICE":
+            print(f"NWC relay notice from {self.relay_url}: {message[1:]}")
+
+    def _fail_pending(self, error: Exception):
+        for future, _ in self._pending.values():
+            if not future.done():
+                future.set_exception(error)
+
+    async def request(self, session: NWCSession, method: str, params: Dict[str, Any], timeout: float) -> dict:
+        """
+        Make sure the app pubkey's response subscription exists, then publish the
+        request on the same connection, so the answer costs a single relay round trip.
+        """
+        message = json.dumps({"method": method, "params": params})
+        event = session.sign_event({
+            "kind": NWC_REQUEST_KIND,
+            "content": session.encrypt(message),
+            "tags": [["p", session.wallet_pubkey]],
+            "created_at": int(time.time()),
+            "pubkey": session.app_pubkey,
+        })
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[event["id"]] = (future, session)
+        try:
+            await self.subscribe(session.app_pubkey)
+            await self.websocket.send(json.dumps(["EVENT", event], separators=(",", ":")))
+            response = await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            raise NWCError(f"wallet did not answer {method} within {timeout}s")
+        finally:
+            self._pending.pop(event["id"], None)
+
+        return json.loads(session.decrypt(response["content"]))
+
+
+class NWCRelayPool:
+    """Persistent NWC connections per relay URL, shared by every wallet on that relay"""
+
+    def __init__(self, on_notification: Callable[[dict], None] = None):
+        self.on_notification = on_notification
+        self._connections: Dict[str, List[NWCConnection]] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    async def acquire(self, relay_url: str, app_pubkey: str) -> NWCConnection:
+        """
+        Return the connection already carrying this app pubkey's subscription, or one
+        with room for it. Opening is serialized per relay, so a burst of concurrent
+        calls shares one new socket instead of opening one each.
+        """
+        lock = self._locks.setdefault(relay_url, asyncio.Lock())
+        async with lock:
+            connections = [c for c in self._connections.get(relay_url, []) if c.is_open]
+            self._connections[relay_url] = connections
+
+            for connection in connections:
+                if app_pubkey in connection.subscriptions:
+                    return connection
+
+            for connection in connections:
+                await connection.close_idle_subscriptions()
+                if connection.has_capacity:
+                    break
+            else:
+                connection = NWCConnection(relay_url, self.on_notification)
+                await connection.open()
+                connections.append(connection)
+
+            # Subscribing under the lock keeps concurrent callers from overfilling a connection
+            await connection.subscribe(app_pubkey)
+            return connection
+
+    async def close(self):
+        for connections in self._connections.values():
+            for connection in connections:
+                await connection.close()
+        self._connections.clear()
+
+
+class NWCClient:
+    """Asyncio Nostr Wallet Connect (NIP-47) client on top of the shared relay pool"""
+
+    def __init__(self):
+        self.pool = NWCRelayPool(on_notification=self._on_notification)
+        # app pubkey -> (session, handler) for wallets whose notifications someone listens to
+        self._notification_handlers: Dict[str, tuple] = {}
+
+    async def request(self,
+                      session: NWCSession,
+                      method: str,
+                      params: Optional[Dict[str, Any]] = None,
+                      timeout: float = NWC_DEFAULT_TIMEOUT) -> dict:
+        """Send one NIP-47 request and return the decrypted wallet response"""
+        connection = await self.pool.acquire(session.relay, session.app_pubkey)
+        return await connection.request(session, method, params or {}, timeout)
+
+    async def close(self):
+        await self.pool.close()
+
+    async def add_notification_handler(self, session: NWCSession, handler: Callable[[dict], None]):
+        """
+        Call handler with every decrypted NIP-47 notification of the wallet, e.g.
+        {"notification_type": "payment_sent", "notification": {...}}
+        """
+        self._notification_handlers[session.app_pubkey] = (session, handler)
+        await self.pool.acquire(session.relay, session.app_pubkey)
+
+    def remove_notification_handler(self, session: NWCSession):
+        self._notification_handlers.pop(session.app_pubkey, None)
+
+    def _on_notification(self, event: dict):
+        for tag in event.get("tags", []):
+            if len(tag) >= 2 and tag[0] == "p" and tag[1] in self._notification_handlers:
+                session, handler = self._notification_handlers[tag[1]]
+                if not session.verify_event(event):
+                    print(f"Ignoring NWC notification not signed by the wallet of {tag[1]}")
+                    return
+                try:
+                    handler(json.loads(session.decrypt(event["content"])))
+                except Exception as e:
+                    print(f"Error handling NWC notification: {e}")
+                return
+
+    async def make_invoice(self, session: NWCSession, amount_sats: int, description: str) -> dict:
+        return await self.request(session, "make_invoice", {"amount": amount_sats * 1000, "description": description})
+
+    async def lookup_invoice(self, session: NWCSession, invoice: str = None, payment_hash: str = None) -> dict:
+        if invoice is None and payment_hash is None:
+            raise ValueError("Either 'invoice' or 'payment_hash' must be provided")
+
+        params = {}
+        if invoice is not None:
+            params["invoice"] = invoice
+        if payment_hash is not None:
+            params["payment_hash"] = payment_hash
+        return await self.request(session, "lookup_invoice", params)
+
+    async def pay_invoice(self, session: NWCSession, invoice: str, amount_msats: int = None) -> dict:
+        params = {"invoice": invoice}
+        if amount_msats:
+            params["amount"] = amount_msats
+        return await self.request(session, "pay_invoice", params, timeout=NWC_PAY_TIMEOUT)
+
+    async def get_info(self, session: NWCSession) -> dict:
+        return await self.request(session, "get_info")
+
+    async def get_balance(self, session: NWCSession) -> dict:
+        return await self.request(session, "get_balance")
+
+    async def list_transactions(self, session: NWCSession, params: Dict[str, Any] = None) -> dict:
+        return await self.request(session, "list_transactions", params)
+
+
+nwc_client = NWCClient()
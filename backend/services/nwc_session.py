@@ -0,0 +1,97 @@
+import base64
+import hashlib
+import json
+import urllib.parse
+from typing import Any, Dict
+
+from Crypto import Random
+from Crypto.Cipher import AES
+from secp256k1 import PrivateKey, PublicKey
+
+from services.cache import TTLCache
+from services.nwc import processNWCstring
+
+# Parsed sessions are kept per connection string (bounded LRU)
+NWC_SESSION_CACHE_MAX_ENTRIES = 1024
+NWC_SESSION_CACHE_TTL_SECONDS = 3600
+
+
+class NWCSession:
+    """
+    A parsed Nostr Wallet Connect connection string. The app pubkey and the NIP-04
+    shared AES key are derived once, so each request only pays for AES and one
+    Schnorr signature instead of re-parsing the URI and redoing the ECDH.
+    """
+
+    def __init__(self, connection_string: str):
+        nwc_info = processNWCstring(connection_string)
+        if not nwc_info:
+            raise ValueError("Invalid NWC connection string")
+
+        self.info = nwc_info
+        self.relay = urllib.parse.unquote(nwc_info["relay"])
+        self.wallet_pubkey = nwc_info["wallet_pubkey"]
+        self.app_privkey = nwc_info["app_privkey"]
+        self.app_pubkey = nwc_info["app_pubkey"]
+
+        self._private_key = PrivateKey(bytes.fromhex(self.app_privkey))
+        # The even-y point of the wallet's x-only key, which its BIP340 signatures verify against
+        self._wallet_key = PublicKey(bytes.fromhex("02" + self.wallet_pubkey), True)
+        # NIP-04: x coordinate of the ECDH point between the app key and the wallet key
+        self.shared_key = self._wallet_key.tweak_mul(bytes.fromhex(self.app_privkey)).serialize()[1:]
+
+    def encrypt(self, plaintext: str) -> str:
+        data = plaintext.encode("utf-8")
+        padding = AES.block_size - len(data) % AES.block_size
+        data += bytes([padding]) * padding
+
+        iv = Random.new().read(AES.block_size)
+        ciphertext = AES.new(self.shared_key, AES.MODE_CBC, iv).encrypt(data)
+        return base64.b64encode(ciphertext).decode("ascii") + "?iv=" + base64.b64encode(iv).decode("ascii")
+
+    def decrypt(self, payload: str) -> str:
+        ciphertext, iv = payload.split("?iv=")
+        data = AES.new(self.shared_key, AES.MODE_CBC, base64.b64decode(iv)).decrypt(base64.b64decode(ciphertext))
+        return data[:-data[-1]].decode("utf-8")
+
+    def sign_event(self, event: Dict[str, Any]) -> Dict[str, Any]:
+        """Fill in the NIP-01 id and Schnorr signature of an event from the app key"""
+        digest = event_id(event)
+        event["id"] = digest.hex()
+        event["sig"] = self._private_key.schnorr_sign(digest, None, raw=True).hex()
+        return event
+
+    def verify_event(self, event: Dict[str, Any]) -> bool:
+        """Whether the event is from the wallet: its pubkey, NIP-01 id and Schnorr signature all check out"""
+        try:
+            if event["pubkey"] != self.wallet_pubkey:
+                return False
+            digest = event_id(event)
+            if event["id"] != digest.hex():
+                return False
+            return self._wallet_key.schnorr_verify(digest, bytes.fromhex(event["sig"]), None, raw=True)
+        except Exception:
+            return False
+
+
+def event_id(event: Dict[str, Any]) -> bytes:
+    """The NIP-01 id of an event: sha256 of its canonical serialization"""
+    serialized = json.dumps(
+        [0, event["pubkey"], event["created_at"], event["kind"], event["tags"], event["content"]],
+        separators=(",", ":"),
+        ensure_ascii=False
+    )
+    return hashlib.sha256(serialized.encode("utf-8")).digest()
+
+
+_sessions = TTLCache(maxsize=NWC_SESSION_CACHE_MAX_ENTRIES, ttl=NWC_SESSION_CACHE_TTL_SECONDS)
+
+
+def get_nwc_session(connection_string: str) -> NWCSession:
+    """Return the cached session for a connection string, parsing it on first use"""
+    key = hashlib.sha256(connection_string.encode("utf-8")).digest()
+    session = _sessions.get(key)
+    if session is None:
+        session = NWCSession(connection_string)
+        _sessions.set(key, session)
+    return session
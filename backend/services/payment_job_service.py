@@ -0,0 +1,213 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Set
+from uuid import uuid4
+
+from database import mongodb
+from models.invoice import PaymentJobState
+from services.bolt11 import decode_bolt11
+from services.encoding import id_to_db, id_from_db
+from services.invoice_service import invoice_service, preimage_matches
+from services.nwc_session import get_nwc_session
+from services.settlement_watcher import settlement_watcher
+
+# Payments in flight per wallet; more are queued until a slot frees up
+PAYMENT_JOB_CONCURRENCY_PER_WALLET = 2
+# Jobs are kept in MongoDB this long so clients can still read the outcome
+PAYMENT_JOB_TTL_SECONDS = 3600
+# An unfinished job not updated for this long was left behind by a stopped
+# worker and no longer stands in for a new payment of the same invoice
+PAYMENT_JOB_STALE_SECONDS = 600
+# A pay_invoice answer without a preimage is confirmed by lookups for this long
+PAYMENT_JOB_CONFIRM_SECONDS = 120
+# Upper bound for a client long-polling a job, and how often a long-poll
+# re-reads a job that another worker is running
+PAYMENT_JOB_WAIT_MAX_SECONDS = 30
+PAYMENT_JOB_WAIT_POLL_SECONDS = 1
+
+FINAL_STATES = (PaymentJobState.SETTLED.value, PaymentJobState.FAILED.value)
+
+
+class PaymentJobService:
+    """
+    Runs invoice payments in the background. Submitting returns a job at once; a
+    worker task pays and confirms it while at most PAYMENT_JOB_CONCURRENCY_PER_WALLET
+    payments per wallet are in flight, and clients long-poll the job for the outcome.
+    Jobs are stored in MongoDB, so every worker can answer for every job.
+    """
+
+    collection_name = "payment_jobs"
+
+    def __init__(self):
+        # app pubkey -> [semaphore, jobs holding or waiting for it]; dropped once idle
+        self._wallet_slots: Dict[str, List[Any]] = {}
+        # Set when a job run by this worker changes state, so local long-polls wake up at once
+        self._changed: Dict[str, asyncio.Event] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def ensure_indexes(self):
+        """Expire jobs after PAYMENT_JOB_TTL_SECONDS, find unfinished jobs by payment hash"""
+        collection = mongodb.db[self.collection_name]
+        await collection.create_index("expires_at", expireAfterSeconds=0)
+        await collection.create_index([("payment_hash", 1), ("state", 1)])
+
+    @staticmethod
+    def _deserialize_job(db_job: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        if db_job is None:
+            return None
+        db_job["id"] = id_from_db(db_job.pop("_id"))
+        db_job.pop("expires_at", None)
+        if db_job.get("listing_id") is not None:
+            db_job["listing_id"] = id_from_db(db_job["listing_id"])
+        return db_job
+
+    async def submit(self, nwc_buyer_string: str, invoicestr: str) -> Dict[str, Any]:
+        """Queue the payment and return its job; an invoice already being paid returns that job"""
+        session = get_nwc_session(nwc_buyer_string)
+        payment_hash = decode_bolt11(invoicestr).payment_hash
+        collection = mongodb.db[self.collection_name]
+        now = datetime.utcnow()
+
+        active = await collection.find_one({
+            "payment_hash": payment_hash,
+            "state": {"$nin": list(FINAL_STATES)},
+            "updated_at": {"$gte": now - timedelta(seconds=PAYMENT_JOB_STALE_SECONDS)},
+        })
+        if active is not None:
+            return self._deserialize_job(active)
+
+        record = await invoice_service.get_ledger_entry(payment_hash)
+        job_id = str(uuid4())
+        listing_id = record.get("listing_id") if record else None
+        await collection.insert_one({
+            "_id": id_to_db(job_id),
+            "state": PaymentJobState.QUEUED.value,
+            "payment_hash": payment_hash,
+            "listing_id": id_to_db(listing_id) if listing_id is not None else None,
+            "preimage": None,
+            "error": None,
+            "created_at": now,
+            "updated_at": now,
+            "expires_at": now + timedelta(seconds=PAYMENT_JOB_TTL_SECONDS),
+        })
+        job = {
+            "id": job_id,
+            "state": PaymentJobState.QUEUED.value,
+            "payment_hash": payment_hash,
+            "listing_id": listing_id,
+            "preimage": None,
+            "error": None,
+            "created_at": now,
+            "updated_at": now,
+        }
+        self._changed[job_id] = asyncio.Event()
+
+        task = asyncio.create_task(self._run(job, session.app_pubkey, nwc_buyer_string, invoicestr))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return dict(job)
+
+    async def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            db_id = id_to_db(job_id)
+        except ValueError:
+            return None
+        collection = mongodb.db[self.collection_name]
+        return self._deserialize_job(await collection.find_one({"_id": db_id}))
+
+    async def wait_for_job(self, job_id: str, timeout: float) -> Optional[Dict[str, Any]]:
+        """Long-poll: return the job once it changes state or is final, or as it is after timeout"""
+        job = await self.get_job(job_id)
+        if job is None or job["state"] in FINAL_STATES:
+            return job
+
+        deadline = asyncio.get_running_loop().time() + min(timeout, PAYMENT_JOB_WAIT_MAX_SECONDS)
+        while True:
+            remaining = deadline - asyncio.get_running_loop().time()
+            if remaining <= 0:
+                return job
+            # Jobs run by this worker wake the long-poll directly, others are re-read
+            changed = self._changed.get(job_id)
+            try:
+                if changed is not None:
+                    await asyncio.wait_for(changed.wait(), remaining)
+                else:
+                    await asyncio.sleep(min(remaining, PAYMENT_JOB_WAIT_POLL_SECONDS))
+            except asyncio.TimeoutError:
+                pass
+            current = await self.get_job(job_id)
+            if current is None or current["state"] != job["state"]:
+                return current
+            job = current
+
+    async def close(self):
+        for task in list(self._tasks):
+            task.cancel()
+
+    async def _update(self, job: Dict[str, Any], state: PaymentJobState, **fields):
+        job.update(fields, state=state.value, updated_at=datetime.utcnow())
+        collection = mongodb.db[self.collection_name]
+        await collection.update_one(
+            {"_id": id_to_db(job["id"])},
+            {"$set": {**fields, "state": job["state"], "updated_at": job["updated_at"]}}
+        )
+        # Wake current waiters, later ones wait on a fresh event
+        changed = self._changed.get(job["id"])
+        if state.value in FINAL_STATES:
+            self._changed.pop(job["id"], None)
+        else:
+            self._changed[job["id"]] = asyncio.Event()
+        if changed:
+            changed.set()
+
+    async def _run(self, job: Dict[str, Any], app_pubkey: str, nwc_buyer_string: str, invoicestr: str):
+        slots = self._wallet_slots.setdefault(
+            app_pubkey, [asyncio.Semaphore(PAYMENT_JOB_CONCURRENCY_PER_WALLET), 0]
+        )
+        slots[1] += 1
+        try:
+            async with slots[0]:
+                await self._update(job, PaymentJobState.PAYING)
+                result = await invoice_service.try_to_pay_invoice(nwc_buyer_string, invoicestr) or {}
+                if result.get("error"):
+                    error = result["error"]
+                    await self._update(job, PaymentJobState.FAILED, error=f"{error.get('code')}: {error.get('message')}")
+                    return
+
+                await self._update(job, PaymentJobState.CONFIRMING, preimage=(result.get("result") or {}).get("preimage"))
+                if await self._confirm(nwc_buyer_string, invoicestr, job["payment_hash"], job["preimage"]):
+                    await self._update(job, PaymentJobState.SETTLED)
+                else:
+                    await self._update(job, PaymentJobState.FAILED, error="payment was not confirmed in time")
+        except asyncio.CancelledError:
+            await self._update(job, PaymentJobState.FAILED, error="server shutting down")
+            raise
+        except Exception as e:
+            await self._update(job, PaymentJobState.FAILED, error=str(e))
+            return
+        finally:
+            slots[1] -= 1
+            if slots[1] == 0 and self._wallet_slots.get(app_pubkey) is slots:
+                del self._wallet_slots[app_pubkey]
+
+        try:
+            # Marks the listing sold, or keeps watching the invoice if it is still pending
+            await settlement_watcher.track(nwc_buyer_string, invoicestr)
+        except Exception as e:
+            print(f"Error tracking settlement of {job['payment_hash']}: {e}")
+
+    async def _confirm(self, nwc_buyer_string: str, invoicestr: str, payment_hash: str, preimage: Optional[str]) -> bool:
+        """A matching preimage proves the payment; otherwise look it up with backoff until confirmed"""
+        if preimage_matches(preimage, payment_hash):
+            return True
+        delay = 1
+        deadline = asyncio.get_running_loop().time() + PAYMENT_JOB_CONFIRM_SECONDS
+        while asyncio.get_running_loop().time() < deadline:
+            if await invoice_service.check_payment(nwc_buyer_string, invoicestr):
+                return True
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 15)
+        return False
+
+
+payment_job_service = PaymentJobService()
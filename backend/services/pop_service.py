@@ -1,34 +1,65 @@
-import time
-from typing import Dict, Any, Optional
-from uuid import UUID
+import hashlib
 import json
+from functools import lru_cache
+from typing import Optional
+
+from secp256k1 import PrivateKey, PublicKey
+
 from models.pop import ProofOfPurchase
 from database import mongodb
-from ecdsa import SigningKey, VerifyingKey, BadSignatureError
-from ecdsa.curves import SECP256k1
-import hashlib
-import base64
+from services.encoding import npub_to_bytes
+
+
+def pubkey_to_xonly(pubkey: str) -> bytes:
+    """The 32-byte x-only key of an npub or a hex Nostr pubkey"""
+    if pubkey.startswith("npub"):
+        return npub_to_bytes(pubkey)
+    raw_pubkey = bytes.fromhex(pubkey)
+    if len(raw_pubkey) != 32:
+        raise ValueError(f"Invalid public key length: {len(raw_pubkey)} (expected 32 bytes)")
+    return raw_pubkey
+
+
+@lru_cache(maxsize=4096)
+def _verifying_key(pubkey: str) -> PublicKey:
+    # BIP340 keys are x-only; the even-y point is the one they stand for
+    try:
+        return PublicKey(b"\x02" + pubkey_to_xonly(pubkey), True)
+    except Exception as e:
+        raise ValueError(f"Invalid public key: {pubkey}") from e
+
 
 def create_signature(private_key: str, message: str) -> str:
-    sk = SigningKey.from_string(bytes.fromhex(private_key), curve=SECP256k1)
+    """BIP340 Schnorr signature (hex) over sha256(message), as Nostr signs event ids"""
     message_hash = hashlib.sha256(message.encode('utf-8')).digest()
-    signature = sk.sign(message_hash)
-    return base64.b64encode(signature).decode('utf-8')
+    return PrivateKey(bytes.fromhex(private_key)).schnorr_sign(message_hash, None, raw=True).hex()
 
 
 def verify_signature(public_key: str, signature: str, message: str) -> bool:
-    vk = VerifyingKey.from_string(bytes.fromhex(public_key), curve=SECP256k1)
+    """Check a signature from create_signature against an npub or hex Nostr pubkey"""
     message_hash = hashlib.sha256(message.encode('utf-8')).digest()
     try:
-        vk.verify(base64.b64decode(signature), message_hash)
-        return True
-    except BadSignatureError:
+        return _verifying_key(public_key).schnorr_verify(message_hash, bytes.fromhex(signature), None, raw=True)
+    except Exception:
         return False
 
+
 class PoPService:
     """Proof of purchase"""
+
+    collection_name = "proofs_of_purchase"
+
+    @staticmethod
+    def _message(pop: ProofOfPurchase) -> str:
+        return json.dumps({
+            "transaction_id": pop.transaction_id,
+            "listing_id": pop.listing_id,
+            "buyer_pubkey": pop.buyer_pubkey,
+            "seller_pubkey": pop.seller_pubkey,
+        }, sort_keys=True)
+
     async def create_proof_of_purchase(
-        self, 
+        self,
         transaction_id: str,
         listing_id: str,
         buyer_pubkey: str,
@@ -36,57 +67,32 @@ class PoPService:
         seller_private_key: str  # todo: handle it
     ) -> ProofOfPurchase:
 
-        message = {
-            "transaction_id": transaction_id,
-            "listing_id": listing_id,
-            "buyer_pubkey": buyer_pubkey,
-            "seller_pubkey": seller_pubkey,
-        }
-        message_str = json.dumps(message, sort_keys=True)
-        
-        # todo: damn it wtf
-        seller_signature = create_signature(seller_private_key, message_str)
-        
         pop = ProofOfPurchase(
             transaction_id=transaction_id,
             listing_id=listing_id,
             buyer_pubkey=buyer_pubkey,
             seller_pubkey=seller_pubkey,
-            seller_signature=seller_signature,
+            seller_signature="",
         )
-        
+        pop.seller_signature = create_signature(seller_private_key, self._message(pop))
+
         try:
-            await mongodb.proofs_of_purchase.insert_one(pop.dict())
+            await mongodb.db[self.collection_name].insert_one(pop.dict())
         except Exception as e:
             raise ValueError(f"error storing PoP: {e}")
 
         return pop
-    
+
     async def get_proof_of_purchase(self, transaction_id: str) -> Optional[ProofOfPurchase]:
-        return ProofOfPurchase(
-            listing_id="b028dc76-0517-44f7-ac90-979e3d4bdfa4",
-            transaction_id="transaction_id",
-            buyer_pubkey="example_buyer_pubkey",
-            seller_pubkey="example_seller_pubkey",
-            seller_signature="example_signature",
-        )
-        pop_data = await mongodb.pops.find_one({"listing_id": transaction_id})
-        
+        pop_data = await mongodb.db[self.collection_name].find_one({"transaction_id": transaction_id}, {"_id": 0})
+
         if not pop_data:
             return None
 
         return ProofOfPurchase(**pop_data)
-    
+
     async def verify_proof_of_purchase(self, pop: ProofOfPurchase) -> bool:
-        message = {
-            "transaction_id": pop.transaction_id,
-            "listing_id": pop.listing_id,
-            "buyer_pubkey": pop.buyer_pubkey,
-            "seller_pubkey": pop.seller_pubkey,
-        }
-        
-        message_str = json.dumps(message, sort_keys=True)
-        return verify_signature(pop.seller_pubkey, pop.seller_signature, message_str)
+        return verify_signature(pop.seller_pubkey, pop.seller_signature, self._message(pop))
 
 
-proof_of_purchase_service = PoPService()
\ No newline at end of file
+proof_of_purchase_service = PoPService()
@@ -0,0 +1,123 @@
+import os
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Set RATE_LIMIT_ENABLED=false to switch limiting off, e.g. for load tests
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() != "false"
+
+
+class RateLimit(NamedTuple):
+    # "ip", or "ip_pubkey" for the pubkey a request claims to act for from one IP; the pubkey
+    # is not authenticated on these routes, so a bucket per pubkey alone would let anyone
+    # drain a victim's bucket and lock them out
+    scope: str
+    rate: float  # tokens refilled per second
+    burst: int  # bucket capacity
+
+
+# Central policy table: every limit of a route must pass for the request to proceed
+RATE_LIMIT_POLICIES: Dict[str, List[RateLimit]] = {
+    "auth_challenge": [RateLimit("ip", rate=2.0, burst=20), RateLimit("ip_pubkey", rate=0.5, burst=5)],
+    "auth_verify": [RateLimit("ip", rate=2.0, burst=20)],
+    "listing_create": [RateLimit("ip", rate=0.5, burst=10), RateLimit("ip_pubkey", rate=0.1, burst=5)],
+    "invoice_create": [RateLimit("ip", rate=1.0, burst=10)],
+    "invoice_pay": [RateLimit("ip", rate=1.0, burst=10)],
+}
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated_at", "full_at")
+
+    def __init__(self, tokens: float, updated_at: float):
+        self.tokens = tokens
+        self.updated_at = updated_at
+        # Once full again the bucket is indistinguishable from a fresh one and can be dropped
+        self.full_at = updated_at
+
+
+class ShardedRateLimiter:
+    """
+    In-memory token buckets spread over independently locked shards, so that
+    concurrent callers rarely contend and idle buckets can be swept per shard.
+    """
+
+    def __init__(self, shards: int = 16, max_buckets_per_shard: int = 10000):
+        self.max_buckets_per_shard = max_buckets_per_shard
+        self._shards: List[Tuple[threading.Lock, Dict[Tuple[str, str], TokenBucket]]] = [
+            (threading.Lock(), {}) for _ in range(shards)
+        ]
+
+    def _shard(self, bucket_key: Tuple[str, str]) -> int:
+        return hash(bucket_key) % len(self._shards)
+
+    def _refill(self, bucket_key: Tuple[str, str], limit: RateLimit, now: float) -> TokenBucket:
+        """The bucket with its tokens brought up to date; the shard lock must be held"""
+        buckets = self._shards[self._shard(bucket_key)][1]
+        bucket = buckets.get(bucket_key)
+        if bucket is None:
+            if len(buckets) >= self.max_buckets_per_shard:
+                self._sweep(buckets, now)
+            bucket = buckets[bucket_key] = TokenBucket(limit.burst, now)
+        else:
+            bucket.tokens = min(limit.burst, bucket.tokens + (now - bucket.updated_at) * limit.rate)
+            bucket.updated_at = now
+        return bucket
+
+    def hit(self, bucket_key: Tuple[str, str], limit: RateLimit) -> Optional[float]:
+        """
+        Take one token from the bucket. Returns None if the request is allowed,
+        otherwise the number of seconds until a token becomes available.
+        """
+        return self.hit_all([(bucket_key, limit)])
+
+    def hit_all(self, hits: List[Tuple[Tuple[str, str], RateLimit]]) -> Optional[float]:
+        """
+        Take one token from every bucket, or from none of them if any is empty, so a
+        rejected request does not use up the budget of the limits it passed. Returns
+        None if allowed, otherwise the seconds until every bucket has a token.
+        """
+        # Shard locks are always taken in index order, so callers cannot deadlock
+        locks = [self._shards[index][0] for index in sorted({self._shard(key) for key, _ in hits})]
+        for lock in locks:
+            lock.acquire()
+        try:
+            now = time.monotonic()
+            buckets = [(self._refill(key, limit, now), limit) for key, limit in hits]
+            waits = [(1 - bucket.tokens) / limit.rate for bucket, limit in buckets if bucket.tokens < 1]
+            if waits:
+                return max(waits)
+            for bucket, limit in buckets:
+                bucket.tokens -= 1
+                bucket.full_at = now + (limit.burst - bucket.tokens) / limit.rate
+            return None
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+    def _sweep(self, buckets: Dict[Tuple[str, str], TokenBucket], now: float):
+        """Drop buckets that have refilled completely; if still crowded, the least recently used half"""
+        for key in [key for key, bucket in buckets.items() if bucket.full_at <= now]:
+            del buckets[key]
+        if len(buckets) >= self.max_buckets_per_shard:
+            for key in sorted(buckets, key=lambda k: buckets[k].updated_at)[:len(buckets) // 2]:
+                del buckets[key]
+
+    def check(self, policy_name: str, identities: Dict[str, Optional[str]]) -> Optional[float]:
+        """
+        Apply every limit of a policy; identities maps a scope ("ip", "ip_pubkey") to the
+        caller's value for it. Returns None if allowed, otherwise a retry-after in seconds.
+        """
+        hits = []
+        for limit in RATE_LIMIT_POLICIES[policy_name]:
+            identity = identities.get(limit.scope)
+            if identity is not None:
+                hits.append(((f"{policy_name}:{limit.scope}", identity), limit))
+        return self.hit_all(hits) if hits else None
+
+
+rate_limiter = ShardedRateLimiter()
@@ -0,0 +1,91 @@
+import asyncio
+import calendar
+from typing import Dict
+
+from database import mongodb
+from models.invoice import InvoiceState
+from services.invoice_service import invoice_service
+from services.nwc_client import nwc_client
+from services.settlement_watcher import settlement_watcher, WalletWatch
+
+# How often watched wallets are reconciled, and the list_transactions page size
+RECONCILE_INTERVAL_SECONDS = 15
+RECONCILE_BATCH_SIZE = 100
+# Bounds one reconciliation run per wallet to this many pages
+RECONCILE_MAX_PAGES = 20
+# Transactions are filtered by creation time; the window starts this long before
+# the oldest pending invoice to allow for clock skew between server and wallet
+RECONCILE_OVERLAP_SECONDS = 600
+
+
+class ReconciliationService:
+    """
+    Settles pending invoices in bulk: pages through each watched wallet's
+    list_transactions since its oldest still-pending invoice was created and
+    matches the settled entries against the pending ledger by payment hash in a
+    single query, so a wallet with 1,000 pending invoices costs ten calls instead
+    of 1,000 lookups.
+    """
+
+    async def run(self):
+        """Scheduler loop, started from the app lifespan"""
+        while True:
+            await asyncio.sleep(RECONCILE_INTERVAL_SECONDS)
+            try:
+                await self.reconcile_all()
+            except Exception as e:
+                print(f"Wallet reconciliation failed: {e}")
+
+    async def reconcile_all(self) -> int:
+        settled = 0
+        for wallet in settlement_watcher.reconciled_wallets():
+            try:
+                settled += await self.reconcile_wallet(wallet)
+            except Exception as e:
+                print(f"Reconciling wallet {wallet.session.app_pubkey} failed: {e}")
+        return settled
+
+    async def reconcile_wallet(self, wallet: WalletWatch) -> int:
+        """Settle the wallet's pending invoices found in its transaction history; returns how many"""
+        session = wallet.session
+        if not wallet.invoices:
+            return 0
+        # A wallet transaction is created along with its invoice, so listing from the oldest
+        # pending invoice covers every pending one, however late it settles
+        oldest = min(item.created_at for item in wallet.invoices.values())
+        since = calendar.timegm(oldest.utctimetuple()) - RECONCILE_OVERLAP_SECONDS
+
+        transactions: Dict[str, dict] = {}
+        for page in range(RECONCILE_MAX_PAGES):
+            response = await nwc_client.list_transactions(session, {
+                "from": since,
+                "limit": RECONCILE_BATCH_SIZE,
+                "offset": page * RECONCILE_BATCH_SIZE,
+            })
+            if response.get("error"):
+                raise RuntimeError(f"list_transactions failed: {response['error']}")
+
+            page_transactions = (response.get("result") or {}).get("transactions") or []
+            for transaction in page_transactions:
+                if transaction.get("payment_hash") and transaction.get("settled_at") is not None:
+                    transactions[transaction["payment_hash"]] = transaction
+            if len(page_transactions) < RECONCILE_BATCH_SIZE:
+                break
+
+        settled = 0
+        if transactions:
+            ledger = mongodb.db[invoice_service.collection_name]
+            cursor = ledger.find(
+                {"payment_hash": {"$in": list(transactions)}, "state": InvoiceState.PENDING.value},
+                {"payment_hash": 1}
+            )
+            async for record in cursor:
+                transaction = transactions[record["payment_hash"]]
+                if await settlement_watcher.settle(
+                    record["payment_hash"], transaction.get("preimage"), transaction["settled_at"]
+                ):
+                    settled += 1
+        return settled
+
+
+reconciliation_service = ReconciliationService()
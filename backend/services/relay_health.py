@@ -0,0 +1,174 @@
+import time
+from typing import Dict, Iterable, List, Optional
+
+from models.diagnostics import RelayState
+
+# Weight of the newest sample in the rolling latency and error rate
+RELAY_HEALTH_SMOOTHING = 0.2
+# A relay is put on probation after this many failures in a row, or once its
+# rolling error rate passes the threshold (after a few samples)
+RELAY_FAILURES_BEFORE_PROBATION = 3
+RELAY_ERROR_RATE_THRESHOLD = 0.5
+RELAY_MIN_SAMPLES = 5
+# Degraded relays are left alone this long before they get traffic again;
+# the backoff doubles every time a probation ends in failure
+RELAY_PROBATION_INITIAL_SECONDS = 30
+RELAY_PROBATION_MAX_SECONDS = 600
+# Successes in a row that bring a relay on probation back to healthy
+RELAY_RECOVERY_SUCCESSES = 3
+# A rate-limited relay (NOTICE or "rate-limited:" OK prefix) is skipped this long
+RELAY_RATE_LIMIT_SECONDS = 30
+# Latency assumed for relays that have not answered yet
+RELAY_DEFAULT_LATENCY_MS = 500
+
+
+class RelayHealth:
+    """Rolling health of one relay, fed with the outcome of every request sent to it"""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.latency_ms: Optional[float] = None
+        self.error_rate = 0.0
+        self.samples = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.consecutive_successes = 0
+        self.rate_limit_notices = 0
+        self.rate_limited_until = 0.0
+        self.degraded_until = 0.0
+        self.backoff = RELAY_PROBATION_INITIAL_SECONDS
+        self.last_error: Optional[str] = None
+        self._state = RelayState.HEALTHY
+
+    @property
+    def state(self) -> RelayState:
+        # A degraded relay whose backoff ran out is probed with live traffic
+        if self._state == RelayState.DEGRADED and self.degraded_until <= time.monotonic():
+            self._state = RelayState.PROBATION
+        return self._state
+
+    @property
+    def rate_limited(self) -> bool:
+        return self.rate_limited_until > time.monotonic()
+
+    @property
+    def score(self) -> float:
+        """Expected cost of a request in milliseconds; lower is better"""
+        latency = self.latency_ms if self.latency_ms is not None else RELAY_DEFAULT_LATENCY_MS
+        return latency * (1 + 4 * self.error_rate)
+
+    def record(self, latency: Optional[float], ok: bool, error: str = None):
+        """Add one request outcome; latency is None for requests that never reached the relay"""
+        if latency is not None:
+            latency_ms = latency * 1000
+            if self.latency_ms is None:
+                self.latency_ms = latency_ms
+            else:
+                self.latency_ms += RELAY_HEALTH_SMOOTHING * (latency_ms - self.latency_ms)
+        self.error_rate += RELAY_HEALTH_SMOOTHING * ((0.0 if ok else 1.0) - self.error_rate)
+        self.samples += 1
+
+        if ok:
+            self.consecutive_failures = 0
+            self.consecutive_successes += 1
+            if self.state == RelayState.PROBATION and self.consecutive_successes >= RELAY_RECOVERY_SUCCESSES:
+                self._state = RelayState.HEALTHY
+                self.backoff = RELAY_PROBATION_INITIAL_SECONDS
+            return
+
+        self.failures += 1
+        self.consecutive_successes = 0
+        self.consecutive_failures += 1
+        self.last_error = error
+        if error and error.startswith("rate-limited"):
+            self.record_rate_limit()
+
+        state = self.state
+        if state == RelayState.PROBATION:
+            self._degrade(min(self.backoff * 2, RELAY_PROBATION_MAX_SECONDS))
+        elif state == RelayState.HEALTHY and (
+            self.consecutive_failures >= RELAY_FAILURES_BEFORE_PROBATION
+            or (self.samples >= RELAY_MIN_SAMPLES and self.error_rate > RELAY_ERROR_RATE_THRESHOLD)
+        ):
+            self._degrade(RELAY_PROBATION_INITIAL_SECONDS)
+
+    def record_rate_limit(self):
+        self.rate_limit_notices += 1
+        self.rate_limited_until = time.monotonic() + RELAY_RATE_LIMIT_SECONDS
+
+    def _degrade(self, backoff: float):
+        self._state = RelayState.DEGRADED
+        self.backoff = backoff
+        self.degraded_until = time.monotonic() + backoff
+        print(f"Relay {self.url} degraded for {backoff:.0f}s: {self.last_error}")
+
+    def to_dict(self) -> Dict:
+        now = time.monotonic()
+        return {
+            "url": self.url,
+            "state": self.state,
+            "score": round(self.score, 1),
+            "latency_ms": round(self.latency_ms, 1) if self.latency_ms is not None else None,
+            "error_rate": round(self.error_rate, 3),
+            "samples": self.samples,
+            "failures": self.failures,
+            "rate_limit_notices": self.rate_limit_notices,
+            "rate_limited": self.rate_limited,
+            "retry_in_seconds": round(max(self.degraded_until - now, 0), 1) if self._state == RelayState.DEGRADED else None,
+            "last_error": self.last_error,
+        }
+
+
+class RelayHealthTracker:
+    """
+    Scores a set of relays so requests go where they are answered fastest: reads to
+    the best few healthy relays, writes to every usable relay (topped up with degraded
+    ones when fewer than the quorum are left). Relays that keep failing are benched
+    with an exponential backoff and probed with live traffic before they count again.
+    """
+
+    def __init__(self, relays: Iterable[str] = ()):
+        self.relays: Dict[str, RelayHealth] = {}
+        for url in relays:
+            self.add(url)
+
+    def add(self, url: str) -> RelayHealth:
+        health = self.relays.get(url)
+        if health is None:
+            health = self.relays[url] = RelayHealth(url)
+        return health
+
+    def record(self, url: str, latency: Optional[float], ok: bool, error: str = None):
+        self.add(url).record(latency, ok, error)
+
+    def record_notice(self, url: str, message: str):
+        if "rate" in message.lower() and "limit" in message.lower():
+            self.add(url).record_rate_limit()
+
+    def _usable(self, urls: Iterable[str]) -> List[RelayHealth]:
+        usable = [self.add(url) for url in urls]
+        usable = [health for health in usable if health.state != RelayState.DEGRADED and not health.rate_limited]
+        return sorted(usable, key=lambda health: (health.state != RelayState.HEALTHY, health.score))
+
+    def read_relays(self, urls: Iterable[str], count: int) -> List[str]:
+        """The count fastest usable relays among urls, or the least bad ones if none are usable"""
+        urls = list(urls)
+        usable = self._usable(urls)
+        if not usable:
+            usable = sorted((self.add(url) for url in urls), key=lambda health: health.degraded_until)
+        return [health.url for health in usable[:count]]
+
+    def write_relays(self, urls: Iterable[str], quorum: int) -> List[str]:
+        """Every usable relay among urls, plus the soonest-to-recover others if that is short of quorum"""
+        urls = list(urls)
+        selected = [health.url for health in self._usable(urls)]
+        if len(selected) < quorum:
+            benched = sorted(
+                (self.add(url) for url in urls if url not in selected),
+                key=lambda health: (health.rate_limited, health.degraded_until)
+            )
+            selected += [health.url for health in benched[:quorum - len(selected)]]
+        return selected
+
+    def snapshot(self) -> List[Dict]:
+        return sorted((health.to_dict() for health in self.relays.values()), key=lambda item: item["score"])
@@ -0,0 +1,221 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+
+import numpy as np
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from database import mongodb
+from models.review import SellerReputation, TrustScoreKind
+from services.cache import TTLCache
+from services.encoding import pubkey_to_db
+from services.review_service import review_service
+
+# How often all seller scores are recomputed from the verified reviews, and how
+# often each worker checks whether a run is due (only one worker runs it)
+REPUTATION_SCORING_INTERVAL_SECONDS = 900
+REPUTATION_SCORING_CHECK_SECONDS = 60
+# Scores are written in batches of this size
+REPUTATION_WRITE_BATCH_SIZE = 1000
+# Bayesian smoothing: every seller starts with this many virtual reviews at the
+# marketplace-wide mean, so a single 5-star review cannot outrank hundreds of 4.9s
+REPUTATION_PRIOR_WEIGHT = 10
+# Mean used as the prior until the first run has computed the real one
+REPUTATION_DEFAULT_PRIOR_MEAN = 3.0
+# The stored prior is re-read at most this often per worker
+REPUTATION_PRIOR_CACHE_SECONDS = 60
+# A review's weight in the time-decayed score halves every this many days
+REPUTATION_HALF_LIFE_DAYS = 180
+
+
+def decay_weight(now: datetime, half_life_days: float = REPUTATION_HALF_LIFE_DAYS) -> dict:
+    """
+    MongoDB expression for a review's weight in the time-decayed score: 1 for a review
+    written at now (or later, or without a creation time), halving every half_life_days.
+    """
+    age_ms = {"$max": [{"$subtract": [now, {"$ifNull": ["$created_at", now]}]}, 0]}
+    return {"$pow": [0.5, {"$divide": [age_ms, half_life_days * 86400 * 1000]}]}
+
+
+def score_sellers(counts: np.ndarray,
+                  rating_sums: np.ndarray,
+                  weights: np.ndarray,
+                  weighted_sums: np.ndarray,
+                  prior_weight: float = REPUTATION_PRIOR_WEIGHT) -> Tuple[np.ndarray, np.ndarray, float]:
+    """
+    Score every seller from their review totals in vectorized passes.
+
+    Args:
+        counts: number of reviews of each seller
+        rating_sums: sum of the ratings of each seller
+        weights: sum of the decay weights of each seller's reviews
+        weighted_sums: sum of the decay-weighted ratings of each seller
+
+    Returns:
+        Bayesian-smoothed and time-decayed Bayesian means per seller, and the
+        marketplace-wide mean used as their prior
+    """
+    total = counts.sum()
+    prior_mean = float(rating_sums.sum() / total) if total else REPUTATION_DEFAULT_PRIOR_MEAN
+    prior = prior_weight * prior_mean
+    bayesian = (prior + rating_sums) / (prior_weight + counts)
+    decayed = (prior + weighted_sums) / (prior_weight + weights)
+    return bayesian, decayed, prior_mean
+
+
+class ReputationScoringService:
+    """
+    Periodic batch job over all verified reviews: MongoDB sums each seller's reviews
+    in one $group pass, NumPy computes the Bayesian-smoothed and time-decayed scores
+    for all sellers at once, and they are written into the seller_reputation
+    aggregates in bulk. The prior and the time of the last run are
+    kept in one document, which also lets a single worker claim each run.
+    """
+
+    collection_name = "reputation_scoring"
+    state_id = "seller_scores"
+
+    def __init__(self):
+        self.prior_cache = TTLCache(maxsize=1, ttl=REPUTATION_PRIOR_CACHE_SECONDS)
+
+    async def run(self):
+        """Scheduler loop, started from the app lifespan on every worker"""
+        while True:
+            try:
+                if await self._claim_run():
+                    await self.recompute()
+            except Exception as e:
+                print(f"Reputation scoring failed: {e}")
+            await asyncio.sleep(REPUTATION_SCORING_CHECK_SECONDS)
+
+    async def _claim_run(self) -> bool:
+        """Atomically take the next run if none started within the interval; False if another worker has it"""
+        now = datetime.utcnow()
+        due = now - timedelta(seconds=REPUTATION_SCORING_INTERVAL_SECONDS)
+        try:
+            state = await mongodb.db[self.collection_name].find_one_and_update(
+                {"_id": self.state_id, "$or": [{"last_run_at": {"$lt": due}}, {"last_run_at": {"$exists": False}}]},
+                {"$set": {"last_run_at": now}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            return False
+        return state is not None
+
+    async def get_prior_mean(self) -> float:
+        """The marketplace-wide mean of the last run, the prior of every Bayesian score"""
+        prior_mean = self.prior_cache.get(self.state_id)
+        if prior_mean is None:
+            state = await mongodb.db[self.collection_name].find_one({"_id": self.state_id}, {"prior_mean": 1})
+            prior_mean = (state or {}).get("prior_mean", REPUTATION_DEFAULT_PRIOR_MEAN)
+            self.prior_cache.set(self.state_id, prior_mean)
+        return prior_mean
+
+    async def seller_totals(self, now: datetime) -> Tuple[List[bytes], np.ndarray]:
+        """
+        Review totals of every seller with verified reviews, summed by MongoDB in one
+        $group pass: the sellers and a (sellers, 4) array of review count, rating sum,
+        decay weight sum and decay-weighted rating sum.
+        """
+        weight = decay_weight(now)
+        cursor = mongodb.db[review_service.collection_name].aggregate([
+            {"$match": {"verified": True}},
+            {"$group": {
+                "_id": "$seller_pubkey",
+                "count": {"$sum": 1},
+                "rating_sum": {"$sum": "$rating"},
+                "weight": {"$sum": weight},
+                "weighted_sum": {"$sum": {"$multiply": [weight, "$rating"]}},
+            }},
+        ], allowDiskUse=True)
+
+        sellers: Dict[bytes, int] = {}
+        seller_index, totals = [], []
+        async for group in cursor:
+            seller = group["_id"]
+            # Legacy string pubkeys are grouped apart and merged with the binary ones
+            seller = bytes(pubkey_to_db(seller) if isinstance(seller, str) else seller)
+            seller_index.append(sellers.setdefault(seller, len(sellers)))
+            totals.append((group["count"], group["rating_sum"], group["weight"], group["weighted_sum"]))
+        if not sellers:
+            return [], np.zeros((0, 4))
+
+        index = np.array(seller_index, dtype=np.int64)
+        totals = np.array(totals, dtype=np.float64)
+        merged = np.stack([
+            np.bincount(index, weights=totals[:, column], minlength=len(sellers)) for column in range(4)
+        ], axis=1)
+        return list(sellers), merged
+
+    async def recompute(self) -> int:
+        """Score every seller with verified reviews; returns how many were scored"""
+        started = time.perf_counter()
+        now = datetime.utcnow()
+        sellers, totals = await self.seller_totals(now)
+        if not sellers:
+            return 0
+        counts = totals[:, 0]
+        bayesian, decayed, prior_mean = score_sellers(counts, totals[:, 1], totals[:, 2], totals[:, 3])
+
+        collection = mongodb.db[review_service.reputation_collection_name]
+        operations = []
+        for seller, count, bayesian_score, decayed_score in zip(
+            sellers, counts.astype(np.int64).tolist(), bayesian.tolist(), decayed.tolist()
+        ):
+            operations.append(UpdateOne(
+                {"_id": pubkey_to_db(seller)},
+                {"$set": {
+                    "bayesian_score": bayesian_score,
+                    "decayed_score": decayed_score,
+                    "scored_review_count": count,
+                    "scored_at": now,
+                }},
+                upsert=True
+            ))
+            if len(operations) >= REPUTATION_WRITE_BATCH_SIZE:
+                await collection.bulk_write(operations, ordered=False)
+                operations = []
+        if operations:
+            await collection.bulk_write(operations, ordered=False)
+
+        # Stored with the scores, so every worker derives live scores from the same prior
+        await mongodb.db[self.collection_name].update_one(
+            {"_id": self.state_id},
+            {"$set": {"prior_mean": prior_mean, "scored_at": now}},
+            upsert=True
+        )
+        self.prior_cache.set(self.state_id, prior_mean)
+
+        print(f"Scored {len(sellers)} sellers from {int(counts.sum())} reviews "
+              f"in {time.perf_counter() - started:.2f}s")
+        return len(sellers)
+
+    @staticmethod
+    def bayesian_score(reputation: SellerReputation, prior_mean: float) -> float:
+        """Bayesian mean straight from the $inc-maintained counters"""
+        return (REPUTATION_PRIOR_WEIGHT * prior_mean + reputation.rating_sum) / (
+            REPUTATION_PRIOR_WEIGHT + reputation.review_count
+        )
+
+    async def get_trust_score(self, seller_pubkey: str, kind: TrustScoreKind = TrustScoreKind.MEAN) -> float:
+        """
+        The seller's score of the given kind. The Bayesian score is derived from the
+        live counters when reviews were written since the last run. The decayed score
+        is the one stored by the last run (see scored_at on the reputation); before a
+        seller's first run it falls back to the Bayesian score.
+        """
+        reputation = await review_service.get_reputation(seller_pubkey)
+        if kind == TrustScoreKind.MEAN:
+            return reputation.average_rating
+
+        if kind == TrustScoreKind.DECAYED and reputation.decayed_score is not None:
+            return reputation.decayed_score
+        if reputation.scored_review_count == reputation.review_count and reputation.bayesian_score is not None:
+            return reputation.bayesian_score
+        return self.bayesian_score(reputation, await self.get_prior_mean())
+
+
+reputation_scoring_service = ReputationScoringService()
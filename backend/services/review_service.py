@@ -1,50 +1,271 @@
-from typing import Dict, Any, List, Optional
-from models.review import ReviewCreate, ReviewResponse
-from services.pop_service import proof_of_purchase_service
+import json
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+from models.review import ReviewCreate, ReviewResponse, ReviewPage, ReviewSort, SellerReputation
 from database import mongodb
+from services.encoding import pubkey_to_db, pubkey_from_db, pubkey_filter, id_filter, b64url_encode, b64url_decode
+
+RATINGS = ("1", "2", "3", "4", "5")
+REVIEW_PAGE_DEFAULT_SIZE = 20
+REVIEW_PAGE_MAX_SIZE = 100
+
+# Sort keys per order; the trailing _id makes every key unique, so the last
+# review of a page is an exact position to continue from
+REVIEW_SORT_KEYS: Dict[ReviewSort, List[Tuple[str, int]]] = {
+    ReviewSort.NEWEST: [("created_at", -1), ("_id", -1)],
+    ReviewSort.OLDEST: [("created_at", 1), ("_id", 1)],
+    ReviewSort.HIGHEST: [("rating", -1), ("created_at", -1), ("_id", -1)],
+    ReviewSort.LOWEST: [("rating", 1), ("created_at", 1), ("_id", 1)],
+}
+
 
 class ReviewService:
-    async def create_review(self, review_data: ReviewCreate, seller_pubkey: str) -> ReviewResponse:
+    collection_name = "reviews"
+    # One document per seller with review count, rating sum, histogram and last review time,
+    # kept up to date with $inc so reputation reads are a single _id lookup
+    reputation_collection_name = "seller_reputation"
+
+    async def ensure_indexes(self):
+        collection = mongodb.db[self.collection_name]
+        await collection.create_index("seller_pubkey")
+        # Keyset pages by time, and by rating or a rating filter
+        await collection.create_index([("seller_pubkey", 1), ("verified", 1), ("created_at", -1), ("_id", -1)])
+        await collection.create_index([("seller_pubkey", 1), ("verified", 1), ("rating", -1), ("created_at", -1), ("_id", -1)])
+        try:
+            await collection.create_index("transaction_id", unique=True)
+        except OperationFailure:
+            # Replace the non-unique index of earlier versions
+            await collection.drop_index("transaction_id_1")
+            await collection.create_index("transaction_id", unique=True)
+
+    @staticmethod
+    def _to_response(review: Dict[str, Any]) -> ReviewResponse:
+        return ReviewResponse(**{
+            **review,
+            "id": str(review["_id"]) if "_id" in review else review.get("id"),
+            "seller_pubkey": pubkey_from_db(review["seller_pubkey"]),
+            "reviewer_pubkey": pubkey_from_db(review.get("reviewer_pubkey")),
+        })
+
+    async def _update_reputation(self, seller_pubkey: Any, rating: int, delta: int, reviewed_at: datetime = None):
+        update = {"$inc": {"review_count": delta, "rating_sum": delta * rating, f"histogram.{rating}": delta}}
+        if reviewed_at is not None:
+            update["$max"] = {"last_review_at": reviewed_at}
+        await mongodb.db[self.reputation_collection_name].update_one({"_id": seller_pubkey}, update, upsert=True)
 
+    async def create_review(self, review_data: ReviewCreate, reviewer_pubkey: str) -> ReviewResponse:
+        """
+        Review the seller of a purchased listing; transaction_id is the listing id and
+        only its buyer may review it, once
+        """
         if review_data.rating < 1 or review_data.rating > 5:
             raise ValueError("Rating must be an integer between 1 and 5")
-        
+
+        listing = await mongodb.db["listings"].find_one(
+            {"_id": id_filter(review_data.transaction_id)}, {"pubkey": 1, "paid_by": 1}
+        )
+        if not listing:
+            raise ValueError("Unknown transaction")
+        if pubkey_from_db(listing.get("paid_by")) != reviewer_pubkey:
+            raise ValueError("Only the buyer of a listing can review it")
+        # Listings not yet migrated still hold the npub string; aggregates are keyed by bytes
+        seller_pubkey = pubkey_to_db(pubkey_from_db(listing["pubkey"]))
+
         review = {
             "transaction_id": review_data.transaction_id,
             "seller_pubkey": seller_pubkey,
+            "reviewer_pubkey": pubkey_to_db(reviewer_pubkey),
             "rating": review_data.rating,
             "comment": review_data.comment,
-            "verified": True
+            "verified": True,
+            "created_at": datetime.utcnow(),
         }
-        
-        collection = mongodb.db["reviews"]
-        result = await collection.find_one({"transaction_id": review_data.transaction_id})
-        if result:
+
+        collection = mongodb.db[self.collection_name]
+        try:
+            # The unique transaction_id index makes this the single check against duplicates
+            await collection.insert_one(review)
+        except DuplicateKeyError:
             raise ValueError("Review already exists for this transaction")
-        
-        await collection.insert_one(review)
-
-        
-        return ReviewResponse(**review)
-    
-    async def get_reviews_for_seller(self, seller_pubkey: str) -> List[ReviewResponse]:
-        collection = mongodb.db["reviews"]
-        cursor = collection.find({"seller_pubkey": seller_pubkey, "verified": True})
-
-        reviews = await cursor.to_list(length=8)
-        return [ReviewResponse(**review) for review in reviews]
-    
+        try:
+            await self._update_reputation(review["seller_pubkey"], review["rating"], 1, review["created_at"])
+        except Exception:
+            # Without its aggregate update the review would make the aggregate drift
+            await collection.delete_one({"_id": review["_id"]})
+            raise
+
+        return self._to_response(review)
+
+    async def delete_review(self, review_id: str, reviewer_pubkey: str) -> bool:
+        """Delete one of the reviewer's own reviews; False if there is no such review"""
+        try:
+            object_id = ObjectId(review_id)
+        except InvalidId:
+            return False
+
+        collection = mongodb.db[self.collection_name]
+        review = await collection.find_one_and_delete(
+            {"_id": object_id, "reviewer_pubkey": pubkey_filter(reviewer_pubkey)}
+        )
+        if not review:
+            return False
+        if review.get("verified"):
+            try:
+                await self._update_reputation(pubkey_to_db(pubkey_from_db(review["seller_pubkey"])), review["rating"], -1)
+            except Exception:
+                await collection.insert_one(review)
+                raise
+        return True
+
+    async def get_reviews_for_seller(self,
+                                     seller_pubkey: str,
+                                     limit: int = REVIEW_PAGE_DEFAULT_SIZE,
+                                     cursor: Optional[str] = None,
+                                     sort: ReviewSort = ReviewSort.NEWEST,
+                                     rating: Optional[int] = None) -> ReviewPage:
+        """
+        One page of the seller's verified reviews in the given order, optionally only those
+        with one rating. Pages continue after the cursor of the previous one (keyset
+        pagination), so deep pages cost the same as the first.
+        """
+        limit = max(1, min(limit, REVIEW_PAGE_MAX_SIZE))
+        sort_keys = REVIEW_SORT_KEYS[sort]
+        query: Dict[str, Any] = {"seller_pubkey": pubkey_filter(seller_pubkey), "verified": True}
+        if rating is not None:
+            query["rating"] = rating
+        if cursor:
+            query = {"$and": [query, self._after(sort_keys, self._decode_cursor(cursor, sort))]}
+
+        collection = mongodb.db[self.collection_name]
+        reviews = await collection.find(query).sort(sort_keys).limit(limit + 1).to_list(length=limit + 1)
+
+        next_cursor = None
+        if len(reviews) > limit:
+            reviews = reviews[:limit]
+            next_cursor = self._encode_cursor(reviews[-1], sort)
+        return ReviewPage(items=[self._to_response(review) for review in reviews], next_cursor=next_cursor)
+
+    @staticmethod
+    def _after(sort_keys: List[Tuple[str, int]], position: Dict[str, Any]) -> Dict[str, Any]:
+        """Filter for the documents sorting after position: (a > x) or (a == x and b > y) ..."""
+        clauses = []
+        for index, (field, direction) in enumerate(sort_keys):
+            clause = {previous: position[previous] for previous, _ in sort_keys[:index]}
+            clause[field] = {"$gt" if direction == 1 else "$lt": position[field]}
+            clauses.append(clause)
+        return {"$or": clauses}
+
+    @staticmethod
+    def _encode_cursor(review: Dict[str, Any], sort: ReviewSort) -> str:
+        position = {
+            "sort": sort.value,
+            "created_at": review["created_at"].isoformat(),
+            "rating": review["rating"],
+            "_id": str(review["_id"]),
+        }
+        return b64url_encode(json.dumps(position, separators=(",", ":")).encode("utf-8"))
+
+    @staticmethod
+    def _decode_cursor(cursor: str, sort: ReviewSort) -> Dict[str, Any]:
+        try:
+            position = json.loads(b64url_decode(cursor))
+            if position["sort"] != sort.value:
+                raise ValueError("cursor belongs to another sort order")
+            return {
+                "created_at": datetime.fromisoformat(position["created_at"]),
+                "rating": int(position["rating"]),
+                "_id": ObjectId(position["_id"]),
+            }
+        except (KeyError, TypeError, InvalidId, ValueError) as e:
+            raise ValueError(f"Invalid cursor: {e}")
+
+    async def get_reputation(self, seller_pubkey: str) -> SellerReputation:
+        """The seller's review aggregate, read with one _id lookup"""
+        try:
+            seller_id = pubkey_to_db(seller_pubkey)
+        except ValueError:
+            return SellerReputation(seller_pubkey=seller_pubkey)
+        aggregate = await mongodb.db[self.reputation_collection_name].find_one({"_id": seller_id})
+        return self._to_reputation(seller_pubkey, aggregate)
+
+    @staticmethod
+    def _to_reputation(seller_pubkey: str, aggregate: Optional[Dict[str, Any]]) -> SellerReputation:
+        if not aggregate or aggregate.get("review_count", 0) <= 0:
+            return SellerReputation(seller_pubkey=seller_pubkey)
+        histogram = aggregate.get("histogram") or {}
+        return SellerReputation(
+            seller_pubkey=seller_pubkey,
+            review_count=aggregate["review_count"],
+            rating_sum=aggregate["rating_sum"],
+            average_rating=aggregate["rating_sum"] / aggregate["review_count"],
+            histogram={rating: histogram.get(rating, 0) for rating in RATINGS},
+            last_review_at=aggregate.get("last_review_at"),
+            bayesian_score=aggregate.get("bayesian_score"),
+            decayed_score=aggregate.get("decayed_score"),
+            scored_review_count=aggregate.get("scored_review_count"),
+            scored_at=aggregate.get("scored_at"),
+        )
+
     async def calculate_trust_score(self, seller_pubkey: str) -> float:
         """
         Calculate trust score for a seller based on verified reviews
         Trust score = sum of ratings / number of reviews
         """
-        reviews = await self.get_reviews_for_seller(seller_pubkey)
-        
-        if not reviews:
-            return 0.0
-            
-        total_stars = sum(review.rating for review in reviews)
-        return total_stars / len(reviews)
+        return (await self.get_reputation(seller_pubkey)).average_rating
+
+    async def reputation_in_sync(self) -> bool:
+        """Whether the aggregates count exactly the verified reviews, a cheap check for drift"""
+        totals = await mongodb.db[self.reputation_collection_name].aggregate([
+            {"$group": {"_id": None, "review_count": {"$sum": "$review_count"}}}
+        ]).to_list(length=1)
+        counted = totals[0]["review_count"] if totals else 0
+        return counted == await mongodb.db[self.collection_name].count_documents({"verified": True})
+
+    async def rebuild_reputation(self) -> int:
+        """
+        Recompute every seller aggregate from the verified reviews, e.g. for reviews written
+        before the aggregate existed; returns the number of sellers. The aggregates are
+        overwritten, so this runs at startup before reviews are served, see MigrationService.
+        """
+        pipeline = [
+            {"$match": {"verified": True}},
+            {"$group": {
+                "_id": {"seller": "$seller_pubkey", "rating": "$rating"},
+                "count": {"$sum": 1},
+                "last_review_at": {"$max": "$created_at"},
+            }},
+            {"$group": {
+                "_id": "$_id.seller",
+                "review_count": {"$sum": "$count"},
+                "rating_sum": {"$sum": {"$multiply": ["$count", "$_id.rating"]}},
+                "histogram": {"$push": {"k": {"$toString": "$_id.rating"}, "v": "$count"}},
+                "last_review_at": {"$max": "$last_review_at"},
+            }},
+            {"$set": {"histogram": {"$arrayToObject": "$histogram"}}},
+        ]
+        aggregates = await mongodb.db[self.collection_name].aggregate(pipeline).to_list(length=None)
+        reputation = mongodb.db[self.reputation_collection_name]
+        sellers = []
+        operations = []
+        for aggregate in aggregates:
+            # Reviews from before created_at was stored have no time
+            if aggregate.get("last_review_at") is None:
+                aggregate.pop("last_review_at", None)
+            sellers.append(aggregate.pop("_id"))
+            operations.append(UpdateOne({"_id": sellers[-1]}, {"$set": aggregate}, upsert=True))
+        if operations:
+            await reputation.bulk_write(operations, ordered=False)
+        # Sellers whose verified reviews are all gone
+        await reputation.update_many(
+            {"_id": {"$nin": sellers}, "review_count": {"$ne": 0}},
+            {"$set": {"review_count": 0, "rating_sum": 0, "histogram": {}}}
+        )
+        return len(aggregates)
 
-review_service = ReviewService()
\ No newline at end of file
+review_service = ReviewService()
@@ -0,0 +1,309 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from models.invoice import InvoiceState
+from models.listing import ListingStatus
+from services.bolt11 import decode_bolt11
+from services.invoice_service import invoice_service, preimage_matches
+from services.listing_service import listing_service
+from services.nwc_client import nwc_client
+from services.nwc_session import NWCSession, get_nwc_session
+
+# lookup_invoice polling backs off exponentially per invoice
+SETTLEMENT_POLL_INITIAL_SECONDS = 2
+SETTLEMENT_POLL_MAX_SECONDS = 60
+# Wallets that push payment notifications are only polled per invoice as a safety net
+SETTLEMENT_POLL_FALLBACK_SECONDS = 30
+# Invoices of wallets reconciled in bulk through list_transactions are not polled;
+# they are looked up once this long before they expire, and expired afterwards
+SETTLEMENT_EXPIRY_CHECK_SECONDS = 60
+# Upper bound for a client long-polling a listing's settlement, and how often a
+# long-poll re-reads the listing in case another worker recorded the settlement
+SETTLEMENT_WAIT_MAX_SECONDS = 30
+SETTLEMENT_WAIT_POLL_SECONDS = 2
+# Pending ledger invoices no watcher follows, e.g. after a restart, are swept this often:
+# checked through their LUD-21 verify URL in batches of this size where the LNURL-pay
+# service offers one, and marked expired this long after they expired
+SETTLEMENT_SWEEP_INTERVAL_SECONDS = 60
+SETTLEMENT_SWEEP_BATCH_SIZE = 100
+SETTLEMENT_EXPIRY_GRACE_SECONDS = 2 * SETTLEMENT_SWEEP_INTERVAL_SECONDS
+
+
+class WatchedInvoice:
+    __slots__ = ("payment_hash", "invoice", "created_at", "expires_at", "interval", "next_check", "settlement")
+
+    def __init__(self, payment_hash: str, invoice: str, created_at: datetime, expires_at: datetime, interval: float):
+        self.payment_hash = payment_hash
+        self.invoice = invoice
+        self.created_at = created_at
+        self.expires_at = expires_at
+        self.interval = interval
+        self.next_check = time.monotonic() + interval
+        # Filled in by a wallet notification so the next check needs no lookup
+        self.settlement: Optional[dict] = None
+
+
+class WalletWatch:
+    """The pending invoices of one wallet, checked together by a single task"""
+
+    def __init__(self, session: NWCSession):
+        self.session = session
+        self.invoices: Dict[str, WatchedInvoice] = {}
+        self.notifications = False
+        # Set when the wallet supports list_transactions, see ReconciliationService
+        self.reconciled = False
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+
+class SettlementWatcher:
+    """
+    Tracks pending ledger invoices server side. When one settles, the listing it pays
+    for is atomically marked sold to its buyer and clients long-polling the listing
+    are woken up, so the frontend no longer has to update the listing itself.
+
+    Watched wallets live in memory only; the wallet's connection string is a spending
+    secret and is not stored. Invoices left pending by a restart are picked up again
+    by sweep() through their LUD-21 verify URL, or by the next client status check,
+    and expire once past their expiry.
+    """
+
+    def __init__(self):
+        # app pubkey -> pending invoices of that wallet
+        self._wallets: Dict[str, WalletWatch] = {}
+        # listing id -> futures of clients waiting for its settlement
+        self._waiters: Dict[str, List[asyncio.Future]] = {}
+
+    async def track(self, nwc_string: str, invoicestr: str) -> Optional[Dict[Any, Any]]:
+        """
+        Complete the listing of a settled ledger invoice, or start watching a pending one
+        through the given wallet. Returns the ledger entry, None for unknown invoices.
+        """
+        payment_hash = decode_bolt11(invoicestr).payment_hash
+        record = await invoice_service.get_ledger_entry(payment_hash)
+        if record is None:
+            return None
+
+        if record["state"] == InvoiceState.SETTLED.value:
+            await self._complete(record)
+        elif record["state"] == InvoiceState.PENDING.value:
+            self._watch(get_nwc_session(nwc_string), record)
+        return record
+
+    async def run(self):
+        """Sweep loop, started from the app lifespan; the first sweep resumes what a restart left pending"""
+        while True:
+            try:
+                await self.sweep()
+            except Exception as e:
+                print(f"Settlement sweep failed: {e}")
+            await asyncio.sleep(SETTLEMENT_SWEEP_INTERVAL_SECONDS)
+
+    async def sweep(self) -> int:
+        """
+        Settle the pending invoices that no wallet watched here follows from their LUD-21
+        verify URL, then expire the overdue ones; returns how many settled.
+        """
+        watched = [payment_hash for wallet in self._wallets.values() for payment_hash in wallet.invoices]
+        settled = 0
+        while True:
+            records = await invoice_service.claim_verifications(watched, SETTLEMENT_SWEEP_BATCH_SIZE)
+            settled += sum(await asyncio.gather(*(self._verify(record) for record in records)))
+            if len(records) < SETTLEMENT_SWEEP_BATCH_SIZE:
+                break
+        # The grace lets a payment made just before expiry be verified first
+        await invoice_service.expire_overdue(
+            datetime.utcnow() - timedelta(seconds=SETTLEMENT_EXPIRY_GRACE_SECONDS)
+        )
+        return settled
+
+    async def _verify(self, record: Dict[Any, Any]) -> bool:
+        try:
+            result = await invoice_service.verify_settlement(record["verify_url"])
+        except Exception as e:
+            print(f"LNURL verify failed for {record['payment_hash']}: {e}")
+            return False
+        return bool(result.get("settled")) and await self.settle(record["payment_hash"], result.get("preimage"))
+
+    def reconciled_wallets(self) -> List[WalletWatch]:
+        """Watched wallets whose pending invoices can be settled in bulk from list_transactions"""
+        return [wallet for wallet in self._wallets.values() if wallet.reconciled and wallet.invoices]
+
+    async def settle(self, payment_hash: str, preimage: Optional[str], settled_at: Optional[int] = None) -> bool:
+        """
+        Record the settlement in the ledger and mark the listing sold. Only a preimage
+        hashing to the payment hash counts; returns False (and keeps watching) otherwise.
+        """
+        if not preimage_matches(preimage, payment_hash):
+            print(f"Wallet reported {payment_hash} settled without a matching preimage")
+            return False
+        for wallet in self._wallets.values():
+            wallet.invoices.pop(payment_hash, None)
+        await invoice_service.mark_settled(payment_hash, preimage, settled_at)
+        record = await invoice_service.get_ledger_entry(payment_hash)
+        if record and record["state"] == InvoiceState.SETTLED.value:
+            await self._complete(record)
+        return True
+
+    async def wait_for_listing(self, listing_id: str, timeout: float) -> Optional[Dict[Any, Any]]:
+        """Long-poll: return the listing once it is no longer active, or as it is after timeout"""
+        future = asyncio.get_running_loop().create_future()
+        # Register before reading, so a settlement in between is not missed
+        self._waiters.setdefault(listing_id, []).append(future)
+        try:
+            deadline = asyncio.get_running_loop().time() + min(timeout, SETTLEMENT_WAIT_MAX_SECONDS)
+            while True:
+                listing = await listing_service.get_listing(listing_id)
+                if listing is None or listing.get("status") != ListingStatus.ACTIVE.value:
+                    return listing
+                remaining = deadline - asyncio.get_running_loop().time()
+                if remaining <= 0:
+                    return listing
+                # Settlements on this worker wake the long-poll directly, others are re-read
+                try:
+                    return await asyncio.wait_for(asyncio.shield(future), min(remaining, SETTLEMENT_WAIT_POLL_SECONDS))
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            waiters = self._waiters.get(listing_id, [])
+            if future in waiters:
+                waiters.remove(future)
+            if not waiters:
+                self._waiters.pop(listing_id, None)
+
+    async def close(self):
+        for wallet in list(self._wallets.values()):
+            wallet.task.cancel()
+        self._wallets.clear()
+
+    def _watch(self, session: NWCSession, record: Dict[Any, Any]):
+        wallet = self._wallets.get(session.app_pubkey)
+        if wallet is None:
+            wallet = self._wallets[session.app_pubkey] = WalletWatch(session)
+            wallet.task = asyncio.create_task(self._run(wallet))
+
+        if record["payment_hash"] not in wallet.invoices:
+            interval = SETTLEMENT_POLL_FALLBACK_SECONDS if wallet.notifications else SETTLEMENT_POLL_INITIAL_SECONDS
+            item = WatchedInvoice(
+                record["payment_hash"], record["invoice"], record["created_at"], record["expires_at"], interval
+            )
+            if wallet.reconciled:
+                item.next_check = self._expiry_check(item)
+            wallet.invoices[record["payment_hash"]] = item
+            wallet.wakeup.set()
+
+    async def _run(self, wallet: WalletWatch):
+        """Check every due invoice of the wallet in one go, then sleep until the next one is due"""
+        try:
+            await self._probe_wallet(wallet)
+            while wallet.invoices:
+                now = time.monotonic()
+                due = [item for item in wallet.invoices.values() if item.next_check <= now]
+                if due:
+                    await asyncio.gather(*(self._check(wallet, item) for item in due))
+                if not wallet.invoices:
+                    break
+
+                wallet.wakeup.clear()
+                delay = min(item.next_check for item in wallet.invoices.values()) - time.monotonic()
+                try:
+                    await asyncio.wait_for(wallet.wakeup.wait(), max(delay, 0))
+                except asyncio.TimeoutError:
+                    pass
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Settlement watcher for wallet {wallet.session.app_pubkey} stopped: {e}")
+        finally:
+            nwc_client.remove_notification_handler(wallet.session)
+            if self._wallets.get(wallet.session.app_pubkey) is wallet:
+                del self._wallets[wallet.session.app_pubkey]
+
+    async def _probe_wallet(self, wallet: WalletWatch):
+        """
+        Subscribe to the wallet's payment notifications and enable bulk reconciliation
+        if its get_info advertises them; per-invoice polling then slows down, or with
+        reconciliation stops until shortly before each invoice expires.
+        """
+        try:
+            info = (await nwc_client.get_info(wallet.session)).get("result") or {}
+        except Exception as e:
+            print(f"NWC get_info failed, polling only: {e}")
+            return
+
+        wallet.reconciled = "list_transactions" in (info.get("methods") or [])
+        if {"payment_sent", "payment_received"} & set(info.get("notifications") or []):
+            await self._enable_notifications(wallet)
+        for item in wallet.invoices.values():
+            if wallet.reconciled:
+                item.next_check = self._expiry_check(item)
+            elif wallet.notifications:
+                item.interval = SETTLEMENT_POLL_FALLBACK_SECONDS
+                item.next_check = max(item.next_check, time.monotonic() + item.interval)
+
+    async def _enable_notifications(self, wallet: WalletWatch):
+        def on_notification(payload: dict):
+            transaction = payload.get("notification") or {}
+            item = wallet.invoices.get(transaction.get("payment_hash"))
+            if item and transaction.get("settled_at") is not None:
+                item.settlement = transaction
+                item.next_check = 0
+                wallet.wakeup.set()
+
+        await nwc_client.add_notification_handler(wallet.session, on_notification)
+        wallet.notifications = True
+
+    async def _check(self, wallet: WalletWatch, item: WatchedInvoice):
+        settlement = item.settlement
+        if settlement is None:
+            if item.expires_at <= datetime.utcnow():
+                await invoice_service.mark_expired(item.payment_hash)
+                wallet.invoices.pop(item.payment_hash, None)
+                return
+            try:
+                result = await nwc_client.lookup_invoice(wallet.session, invoice=item.invoice)
+                settlement = result.get("result") or {}
+            except Exception as e:
+                print(f"Invoice lookup failed for {item.payment_hash}: {e}")
+                settlement = {}
+
+        if settlement.get("settled_at") is not None and await self.settle(
+            item.payment_hash, settlement.get("preimage"), settlement["settled_at"]
+        ):
+            return
+        item.settlement = None
+        if wallet.reconciled:
+            item.next_check = self._expiry_check(item)
+            return
+        item.interval = min(item.interval * 2, SETTLEMENT_POLL_MAX_SECONDS)
+        item.next_check = time.monotonic() + item.interval
+
+    @staticmethod
+    def _expiry_check(item: WatchedInvoice) -> float:
+        """
+        Next check of an invoice of a reconciled wallet: a last lookup SETTLEMENT_EXPIRY_CHECK_SECONDS
+        before it expires, after that one just past its expiry, which marks it expired.
+        """
+        remaining = (item.expires_at - datetime.utcnow()).total_seconds()
+        if remaining > SETTLEMENT_EXPIRY_CHECK_SECONDS:
+            remaining -= SETTLEMENT_EXPIRY_CHECK_SECONDS
+        else:
+            remaining += 1
+        return time.monotonic() + max(remaining, 0)
+
+    async def _complete(self, record: Dict[Any, Any]):
+        listing_id = record.get("listing_id")
+        if listing_id is None:
+            return
+        listing = await listing_service.mark_sold(listing_id, record.get("buyer_pubkey"))
+        if listing is None:
+            listing = await listing_service.get_listing(listing_id)
+
+        for future in self._waiters.pop(listing_id, []):
+            if not future.done():
+                future.set_result(listing)
+
+
+settlement_watcher = SettlementWatcher()
@@ -0,0 +1,195 @@
+import asyncio
+import hashlib
+import hmac
+import os
+import secrets
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from database import mongodb
+from services.encoding import b64url_encode, b64url_decode
+
+load_dotenv()
+
+# "session" keeps the MongoDB-backed session ids as bearer tokens,
+# "signed" issues stateless HMAC-signed tokens after /auth/verify
+AUTH_TOKEN_MODE = os.getenv("AUTH_TOKEN_MODE", "session")
+
+# Comma separated "key_id:hex_secret" pairs; the first key signs new tokens and the
+# others are only accepted for validation, which allows rotating keys without logouts
+AUTH_TOKEN_KEYS = os.getenv("AUTH_TOKEN_KEYS", "")
+
+TOKEN_SEPARATOR = "."
+# Revocations written by other workers are picked up this often; the re-read covers a
+# slightly longer window so revocations stamped by a worker with a lagging clock are not missed
+REVOCATION_REFRESH_SECONDS = 2
+REVOCATION_REFRESH_OVERLAP_SECONDS = 10
+
+
+class KeyRing:
+    """HMAC secrets indexed by key id; the first key is the active signing key"""
+
+    def __init__(self, keys: List[Tuple[str, bytes]]):
+        if not keys:
+            raise ValueError("Key ring needs at least one key")
+        self.keys: Dict[str, bytes] = dict(keys)
+        self.active_key_id = keys[0][0]
+
+    @classmethod
+    def from_env(cls, value: str) -> "KeyRing":
+        keys = []
+        for entry in filter(None, (item.strip() for item in value.split(","))):
+            key_id, _, secret_hex = entry.partition(":")
+            if not key_id or not secret_hex or TOKEN_SEPARATOR in key_id:
+                raise ValueError(f"Invalid AUTH_TOKEN_KEYS entry: {key_id}")
+            keys.append((key_id, bytes.fromhex(secret_hex)))
+
+        if not keys:
+            # Tokens signed with an ephemeral key do not survive a restart
+            print("⚠️ AUTH_TOKEN_KEYS is not set, using an ephemeral token signing key")
+            keys.append(("ephemeral", secrets.token_bytes(32)))
+        return cls(keys)
+
+    @property
+    def active(self) -> Tuple[str, bytes]:
+        return self.active_key_id, self.keys[self.active_key_id]
+
+    def get(self, key_id: str) -> Optional[bytes]:
+        return self.keys.get(key_id)
+
+
+class TokenClaims:
+    def __init__(self, public_key: bytes, expires_at: int, token_id: bytes):
+        self.public_key = public_key
+        self.expires_at = expires_at
+        self.token_id = token_id
+
+
+class TokenService:
+    """
+    Compact signed bearer tokens of the form "<key id>.<payload>.<mac>", where the
+    payload carries the raw pubkey, the expiry and a random token id. Validation is
+    in memory; logouts are covered by a small revocation list of token ids, which is
+    refreshed from MongoDB every few seconds so logouts on other workers apply too.
+    """
+
+    collection_name = "revoked_tokens"
+
+    def __init__(self, mode: str = AUTH_TOKEN_MODE, keys: str = AUTH_TOKEN_KEYS):
+        self.enabled = mode == "signed"
+        self.key_ring = KeyRing.from_env(keys) if self.enabled else None
+        # token id -> unix expiry; entries are dropped once the token would have expired anyway
+        self.revoked: Dict[bytes, int] = {}
+        self._refreshed_at = 0.0
+        self._refreshed_until: Optional[datetime] = None
+        self._refresh_lock = asyncio.Lock()
+
+    @staticmethod
+    def is_signed_token(token: str) -> bool:
+        return token.count(TOKEN_SEPARATOR) == 2
+
+    @staticmethod
+    def _sign(secret: bytes, key_id: str, payload: bytes) -> bytes:
+        return hmac.new(secret, key_id.encode() + TOKEN_SEPARATOR.encode() + payload, hashlib.sha256).digest()
+
+    def issue(self, public_key: bytes, lifetime_seconds: int) -> str:
+        key_id, secret = self.key_ring.active
+        expires_at = int(time.time()) + lifetime_seconds
+        payload = public_key + expires_at.to_bytes(8, "big") + secrets.token_bytes(8)
+        mac = self._sign(secret, key_id, payload)
+        return TOKEN_SEPARATOR.join([key_id, b64url_encode(payload), b64url_encode(mac)])
+
+    def validate(self, token: str) -> Optional[TokenClaims]:
+        """Return the token claims, or None if the token is forged, expired or revoked"""
+        if not self.enabled or not self.is_signed_token(token):
+            return None
+
+        key_id, payload_b64, mac_b64 = token.split(TOKEN_SEPARATOR)
+        secret = self.key_ring.get(key_id)
+        if secret is None:
+            return None
+
+        try:
+            payload = b64url_decode(payload_b64)
+            mac = b64url_decode(mac_b64)
+        except (ValueError, TypeError):
+            return None
+
+        if len(payload) != 48 or not hmac.compare_digest(mac, self._sign(secret, key_id, payload)):
+            return None
+
+        claims = TokenClaims(payload[:32], int.from_bytes(payload[32:40], "big"), payload[40:])
+        if claims.expires_at <= time.time() or claims.token_id in self.revoked:
+            return None
+        return claims
+
+    async def revoke(self, token: str) -> bool:
+        claims = self.validate(token)
+        if not claims:
+            return False
+
+        self._prune_revoked()
+        self.revoked[claims.token_id] = claims.expires_at
+        # Persisted so that revocations survive restarts and reach the other workers;
+        # removed by a TTL index after expiry
+        await mongodb.db[self.collection_name].update_one(
+            {"_id": claims.token_id},
+            {"$set": {
+                "expires_at": datetime.utcfromtimestamp(claims.expires_at),
+                "revoked_at": datetime.utcnow(),
+            }},
+            upsert=True
+        )
+        return True
+
+    async def validate_current(self, token: str) -> Optional[TokenClaims]:
+        """validate() against a revocation list at most REVOCATION_REFRESH_SECONDS old"""
+        if not self.enabled or not self.is_signed_token(token):
+            return None
+        await self.refresh_revocations()
+        return self.validate(token)
+
+    async def refresh_revocations(self):
+        """Read the revocations added since the last refresh, if that is more than a moment ago"""
+        if time.monotonic() - self._refreshed_at < REVOCATION_REFRESH_SECONDS:
+            return
+        async with self._refresh_lock:
+            if time.monotonic() - self._refreshed_at < REVOCATION_REFRESH_SECONDS:
+                return
+            now = datetime.utcnow()
+            query = {"expires_at": {"$gt": now}}
+            if self._refreshed_until is not None:
+                query["revoked_at"] = {"$gte": self._refreshed_until - timedelta(seconds=REVOCATION_REFRESH_OVERLAP_SECONDS)}
+            await self._read_revocations(query)
+            self._prune_revoked()
+            self._refreshed_until = now
+            self._refreshed_at = time.monotonic()
+
+    async def _read_revocations(self, query: Dict):
+        async for entry in mongodb.db[self.collection_name].find(query, {"expires_at": 1}):
+            expires_at = (entry["expires_at"] - datetime(1970, 1, 1)).total_seconds()
+            self.revoked[bytes(entry["_id"])] = int(expires_at)
+
+    def _prune_revoked(self):
+        now = time.time()
+        for token_id in [token_id for token_id, expires_at in self.revoked.items() if expires_at <= now]:
+            del self.revoked[token_id]
+
+    async def load_revocations(self):
+        """Load the persisted revocation list; called once at startup"""
+        if not self.enabled:
+            return
+
+        collection = mongodb.db[self.collection_name]
+        await collection.create_index("expires_at", expireAfterSeconds=0)
+        await collection.create_index("revoked_at")
+        now = datetime.utcnow()
+        await self._read_revocations({"expires_at": {"$gt": now}})
+        self._refreshed_until = now
+        self._refreshed_at = time.monotonic()
+
+
+token_service = TokenService()
@@ -1,13 +1,40 @@
+import json
 from uuid import uuid4
 from datetime import datetime
+from typing import Any, Dict, List, Optional
 from nostr_sdk import Keys
 from database import mongodb
 from bech32 import bech32_decode, convertbits
 from services.nostr_service import nostr_service
+from services.encoding import pubkey_to_db, pubkey_from_db, pubkey_filter, id_to_db, id_from_db, b64url_encode, b64url_decode
+from services.listing_service import listing_service
+from services.review_service import review_service
+from models.listing import ListingStatus
+
+SELLER_PAGE_DEFAULT_SIZE = 50
+SELLER_PAGE_MAX_SIZE = 100
+
 
 class UserService:
     collection_name = "users"
 
+    async def ensure_indexes(self):
+        """Create the indexes used by user lookups"""
+        collection = mongodb.db[self.collection_name]
+        await collection.create_index("nostr_public_key")
+        # Seller directory pages
+        await collection.create_index([("created_at", 1), ("_id", 1)])
+
+    @staticmethod
+    def _deserialize_user(db_user: dict) -> dict:
+        """Convert a MongoDB user document (binary id and pubkey) to its API form"""
+        if db_user is None:
+            return None
+
+        db_user["id"] = id_from_db(db_user.pop("_id", None) or db_user.get("id"))
+        db_user["nostr_public_key"] = pubkey_from_db(db_user.get("nostr_public_key"))
+        return db_user
+
     def generate_nostr_key_pair(self, prefix: str):
         """
         Generate a Nostr key pair repeatedly until the public key starts with the given prefix.
@@ -47,8 +74,8 @@ class UserService:
 
         # No profile is created; we simply store empty strings for profile details.
         user_record = {
-            "id": str(user_id),
-            "nostr_public_key": public_key_bech32,
+            "_id": id_to_db(user_id),
+            "nostr_public_key": pubkey_to_db(public_key_bech32),
             "created_at": created_at,
             "raw_seed": raw_seed,
             "username": "",
@@ -56,7 +83,6 @@ class UserService:
             "about": "",
             "picture": ""
         }
-        user_record["_id"] = str(user_id)
 
         collection = mongodb.db[self.collection_name]
         await collection.insert_one(user_record)
@@ -96,7 +122,7 @@ class UserService:
         raw_seed = self.derive_raw_seed_from_private_key(private_key)
 
         collection = mongodb.db[self.collection_name]
-        user = await collection.find_one({"nostr_public_key": derived_public_key})
+        user = await collection.find_one({"nostr_public_key": pubkey_filter(derived_public_key)})
 
         if user:
             # Update raw_seed if it is not present
@@ -110,8 +136,8 @@ class UserService:
             user_id = uuid4()
             created_at = datetime.utcnow()
             user_record = {
-                "id": str(user_id),
-                "nostr_public_key": derived_public_key,
+                "_id": id_to_db(user_id),
+                "nostr_public_key": pubkey_to_db(derived_public_key),
                 "created_at": created_at,
                 "raw_seed": raw_seed,
                 "username": "",
@@ -119,10 +145,10 @@ class UserService:
                 "about": "",
                 "picture": ""
             }
-            user_record["_id"] = str(user_id)
             await collection.insert_one(user_record)
             user = user_record
 
+        user = self._deserialize_user(user)
         return {
             "id": user["id"],
             "nostr_public_key": user["nostr_public_key"],
@@ -136,10 +162,10 @@ class UserService:
     async def get_user_by_public_key(self, public_key: str) -> dict:
         """Get user by their public key"""
         collection = mongodb.db[self.collection_name]
-        user = await collection.find_one({"nostr_public_key": public_key})
+        user = await collection.find_one({"nostr_public_key": pubkey_filter(public_key)})
         if not user:
             return None
-        return user
+        return self._deserialize_user(user)
     
     async def get_all_users(self) -> list:
         """Returns all users but only their pubkeys and ids"""
@@ -147,8 +173,9 @@ class UserService:
         cursor = collection.find({})
         users = []
         async for user in cursor:
+            user = self._deserialize_user(user)
             user_data = {
-                "id": str(user["_id"]),
+                "id": user["id"],
                 "nostr_public_key": user.get("nostr_public_key"),
                 "created_at": user.get("created_at"),
                 "username": user.get("username", ""),
@@ -159,4 +186,104 @@ class UserService:
             users.append(user_data)
         return users
 
+    async def get_seller_directory(self, limit: int = SELLER_PAGE_DEFAULT_SIZE, cursor: Optional[str] = None) -> dict:
+        """
+        One page of users, oldest first, each with active and sold listing counts and the
+        reputation aggregate: the users and their reputation in one aggregation pipeline,
+        the listing counts of the whole page in one more (two round trips instead of a
+        review request per seller)
+        """
+        limit = max(1, min(limit, SELLER_PAGE_MAX_SIZE))
+        pipeline = []
+        if cursor:
+            created_at, last_id = self._decode_cursor(cursor)
+            pipeline.append({"$match": {"$or": [
+                {"created_at": {"$gt": created_at}},
+                {"created_at": created_at, "_id": {"$gt": last_id}},
+            ]}})
+        pipeline += [
+            {"$sort": {"created_at": 1, "_id": 1}},
+            {"$limit": limit + 1},
+            {"$lookup": {
+                "from": review_service.reputation_collection_name,
+                "localField": "nostr_public_key",
+                "foreignField": "_id",
+                "as": "reputation",
+            }},
+            {"$project": {"raw_seed": 0, "picture": 0}},
+        ]
+
+        collection = mongodb.db[self.collection_name]
+        users = await collection.aggregate(pipeline).to_list(length=limit + 1)
+        next_cursor = None
+        if len(users) > limit:
+            users = users[:limit]
+            next_cursor = self._encode_cursor(users[-1])
+
+        listing_counts = await self._listing_counts([user.get("nostr_public_key") for user in users])
+        sellers = []
+        for user in users:
+            counts = listing_counts.get(self._pubkey_key(user.get("nostr_public_key")), {})
+            reputation = user.pop("reputation")
+            user = self._deserialize_user(user)
+            sellers.append({
+                "id": user["id"],
+                "nostr_public_key": user["nostr_public_key"],
+                "created_at": user["created_at"],
+                "username": user.get("username") or "",
+                "display_name": user.get("display_name") or "",
+                "about": user.get("about") or "",
+                "active_listings": counts.get(ListingStatus.ACTIVE.value, 0),
+                "sold_listings": counts.get(ListingStatus.SOLD.value, 0),
+                "reputation": review_service._to_reputation(
+                    user["nostr_public_key"], reputation[0] if reputation else None
+                ),
+            })
+        return {"items": sellers, "next_cursor": next_cursor}
+
+    @staticmethod
+    def _pubkey_key(pubkey: Any) -> Any:
+        """The same key for a pubkey stored in binary and in its legacy string form"""
+        try:
+            return bytes(pubkey_to_db(pubkey))
+        except (TypeError, ValueError):
+            return pubkey
+
+    async def _listing_counts(self, pubkeys: List[Any]) -> Dict[Any, Dict[str, int]]:
+        """
+        Listing counts per status of each pubkey (keyed by _pubkey_key), from one query on
+        the indexed listings pubkey that matches both encodings, like pubkey_filter
+        """
+        forms = []
+        for pubkey in pubkeys:
+            if pubkey is not None:
+                match = pubkey_filter(pubkey)
+                forms.extend(match["$in"] if "$in" in match else [match["$eq"]])
+        counts: Dict[Any, Dict[str, int]] = {}
+        if not forms:
+            return counts
+
+        cursor = mongodb.db[listing_service.collection_name].aggregate([
+            {"$match": {"pubkey": {"$in": forms}}},
+            {"$group": {"_id": {"pubkey": "$pubkey", "status": "$status"}, "count": {"$sum": 1}}},
+        ])
+        async for item in cursor:
+            seller = counts.setdefault(self._pubkey_key(item["_id"]["pubkey"]), {})
+            status = item["_id"].get("status")
+            seller[status] = seller.get(status, 0) + item["count"]
+        return counts
+
+    @staticmethod
+    def _encode_cursor(user: dict) -> str:
+        position = {"created_at": user["created_at"].isoformat(), "id": id_from_db(user["_id"])}
+        return b64url_encode(json.dumps(position, separators=(",", ":")).encode("utf-8"))
+
+    @staticmethod
+    def _decode_cursor(cursor: str):
+        try:
+            position = json.loads(b64url_decode(cursor))
+            return datetime.fromisoformat(position["created_at"]), id_to_db(position["id"])
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"Invalid cursor: {e}")
+
 user_service = UserService()
\ No newline at end of file
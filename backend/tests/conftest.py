@@ -0,0 +1,10 @@
+import os
+import sys
+
+# The services import each other as top-level packages from backend/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from secp256k1 import PrivateKey  # noqa: E402
+
+# The app's Nostr identity is read at import time; tests get a throwaway one
+os.environ.setdefault("NOSTR_PRIVATE_KEY", PrivateKey().serialize())
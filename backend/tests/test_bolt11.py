@@ -0,0 +1,53 @@
+import pytest
+
+from services.bolt11 import DEFAULT_EXPIRY_SECONDS, decode_bolt11
+
+# Test vectors from the BOLT 11 specification
+SPEC_PAYMENT_HASH = "0001020304050607080900010203040506070809000102030405060708090102"
+SPEC_TIMESTAMP = 1496314658
+
+DONATION = (
+    "lnbc1pvjluezsp5zyg3zyg3zyg3zyg3zyg3zyg3zyg3zyg3zyg3zyg3zyg3zyg3zygspp5qqqsyqcyq5rqwzqfqqqsyqcyq5rqwzqfqqqs"
+    "yqcyq5rqwzqfqypqdpl2pkx2ctnv5sxxmmwwd5kgetjypeh2ursdae8g6twvus8g6rfwvs8qun0dfjkxaq9qrsgq357wnc5r2ueh7ck6q93d"
+    "j32dlqnls087fxdwk8qakdyafkq3yap9us6v52vjjsrvywa6rt52cm9r9zqt8r2t7mlcwspyetp5h2tztugp9lfyql"
+)
+COFFEE = (
+    "lnbc2500u1pvjluezsp5zyg3zyg3zyg3zyg3zyg3zyg3zyg3zyg3zyg3zyg3zyg3zyg3zygspp5qqqsyqcyq5rqwzqfqqqsyqcyq5rqwzqf"
+    "qqqsyqcyq5rqwzqfqypqdq5xysxxatsyp3k7enxv4jsxqzpu9qrsgquk0rl77nj30yxdy8j9vdx85fkpmdla2087ne0xh8nhedh8w27kyke0l"
+    "p53ut353s06fv3qfegext0eh0ymjpf39tuven09sam30g4vgpfna3rh"
+)
+HASHED_DESCRIPTION = (
+    "lnbc20m1pvjluezsp5zyg3zyg3zyg3zyg3zyg3zyg3zyg3zyg3zyg3zyg3zyg3zyg3zygspp5qqqsyqcyq5rqwzqfqqqsyqcyq5rqwzqfqqq"
+    "syqcyq5rqwzqfqypqhp58yjmdan79s6qqdhdzgynm4zwqd5d7xmw5fk98klysy043l2ahrqs9qrsgq7ea976txfraylvgzuxs8kgcw23ezlrs"
+    "zfnh8r6qtfpr6cxga50aj6txm9rxrydzd06dfeawfk6swupvz4erwnyutnjq7x39ymw6j38gp7ynn44"
+)
+
+
+@pytest.mark.parametrize("invoice, amount_msat, expiry", [
+    (DONATION, None, DEFAULT_EXPIRY_SECONDS),
+    (COFFEE, 250_000_000, 60),
+    (HASHED_DESCRIPTION, 2_000_000_000, DEFAULT_EXPIRY_SECONDS),
+])
+def test_spec_vectors(invoice, amount_msat, expiry):
+    decoded = decode_bolt11(invoice)
+    assert decoded.payment_hash == SPEC_PAYMENT_HASH
+    assert decoded.amount_msat == amount_msat
+    assert decoded.timestamp == SPEC_TIMESTAMP
+    assert decoded.expiry == expiry
+    assert decoded.expires_at == SPEC_TIMESTAMP + expiry
+
+
+def test_prefix_and_case_are_ignored():
+    assert decode_bolt11("lightning:" + COFFEE.upper()).payment_hash == SPEC_PAYMENT_HASH
+
+
+def test_corrupted_checksum_is_rejected():
+    corrupted = COFFEE[:-1] + ("q" if COFFEE[-1] != "q" else "p")
+    with pytest.raises(ValueError):
+        decode_bolt11(corrupted)
+
+
+@pytest.mark.parametrize("invoice", ["", "lnbc1", "not an invoice", COFFEE[:60]])
+def test_malformed_invoices_are_rejected(invoice):
+    with pytest.raises(ValueError):
+        decode_bolt11(invoice)
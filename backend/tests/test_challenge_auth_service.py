@@ -0,0 +1,51 @@
+import asyncio
+
+import nacl.signing
+
+from services.challenge_auth_service import ChallengeAuthService
+
+MESSAGE = b"auth-challenge:session"
+
+
+def test_missing_seed_key_is_looked_up_once(monkeypatch):
+    service = ChallengeAuthService()
+    lookups = []
+
+    async def load_seed_verify_key(raw_pubkey):
+        lookups.append(raw_pubkey)
+        return None
+
+    monkeypatch.setattr(service, "_load_seed_verify_key", load_seed_verify_key)
+    signing_key = nacl.signing.SigningKey.generate()
+    raw_pubkey = bytes(signing_key.verify_key)
+    forged = nacl.signing.SigningKey.generate().sign(MESSAGE).signature
+
+    async def scenario():
+        for _ in range(3):
+            assert not await service._verify_signature(raw_pubkey, MESSAGE, forged)
+        assert await service._verify_signature(raw_pubkey, MESSAGE, signing_key.sign(MESSAGE).signature)
+
+    asyncio.run(scenario())
+    assert lookups == [raw_pubkey]
+
+
+def test_seed_key_is_preferred_once_it_verified(monkeypatch):
+    service = ChallengeAuthService()
+    seed_key = nacl.signing.SigningKey.generate()
+    lookups = []
+
+    async def load_seed_verify_key(raw_pubkey):
+        lookups.append(raw_pubkey)
+        return seed_key.verify_key
+
+    monkeypatch.setattr(service, "_load_seed_verify_key", load_seed_verify_key)
+    raw_pubkey = bytes(nacl.signing.SigningKey.generate().verify_key)
+    signature = seed_key.sign(MESSAGE).signature
+
+    async def scenario():
+        for _ in range(3):
+            assert await service._verify_signature(raw_pubkey, MESSAGE, signature)
+
+    asyncio.run(scenario())
+    assert len(lookups) == 1
+    assert service.verify_keys.get(raw_pubkey)["preferred"] == "seed"
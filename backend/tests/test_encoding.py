@@ -0,0 +1,67 @@
+from uuid import uuid4
+
+import pytest
+from bson.binary import Binary, UUID_SUBTYPE
+
+from services.encoding import (b64url_decode, b64url_encode, bytes_to_npub, id_filter, id_from_db, id_to_db,
+                               npub_to_bytes, pubkey_filter, pubkey_from_db, pubkey_to_db)
+
+RAW_PUBKEY = bytes(range(32))
+NPUB = bytes_to_npub(RAW_PUBKEY)
+
+
+def test_npub_round_trip():
+    assert NPUB.startswith("npub1")
+    assert npub_to_bytes(NPUB) == RAW_PUBKEY
+
+
+def test_pubkey_to_db_accepts_npub_hex_and_bytes():
+    expected = Binary(RAW_PUBKEY)
+    assert pubkey_to_db(NPUB) == expected
+    assert pubkey_to_db(RAW_PUBKEY.hex()) == expected
+    assert pubkey_to_db(RAW_PUBKEY) == expected
+    assert pubkey_to_db(None) is None
+
+
+def test_pubkey_from_db_returns_npub():
+    assert pubkey_from_db(pubkey_to_db(RAW_PUBKEY.hex())) == NPUB
+    # Legacy string values are returned unchanged
+    assert pubkey_from_db(NPUB) == NPUB
+    assert pubkey_from_db(None) is None
+
+
+@pytest.mark.parametrize("pubkey", ["npub1invalid", "abcd", "zz" * 32, (b"\x01" * 31).hex()])
+def test_invalid_pubkeys_are_rejected(pubkey):
+    with pytest.raises(ValueError):
+        pubkey_to_db(pubkey)
+
+
+def test_pubkey_filter_matches_binary_and_legacy_string():
+    assert pubkey_filter(NPUB) == {"$in": [Binary(RAW_PUBKEY), NPUB]}
+    assert pubkey_filter(RAW_PUBKEY) == {"$in": [Binary(RAW_PUBKEY), NPUB]}
+    assert pubkey_filter("not-a-pubkey") == {"$eq": "not-a-pubkey"}
+
+
+def test_id_round_trip():
+    value = uuid4()
+    stored = id_to_db(str(value))
+    assert stored.subtype == UUID_SUBTYPE
+    assert id_to_db(value) == stored
+    assert id_from_db(stored) == str(value)
+    assert id_from_db(value) == str(value)
+    assert id_from_db(None) is None
+
+
+def test_id_filter_falls_back_for_non_uuids():
+    value = str(uuid4())
+    assert id_filter(value) == {"$in": [id_to_db(value), value]}
+    assert id_filter("legacy-id") == {"$eq": "legacy-id"}
+    with pytest.raises(ValueError):
+        id_to_db("legacy-id")
+
+
+@pytest.mark.parametrize("data", [b"", b"a", b"ab", b"abc", bytes(range(256))])
+def test_b64url_round_trip(data):
+    encoded = b64url_encode(data)
+    assert "=" not in encoded
+    assert b64url_decode(encoded) == data
@@ -0,0 +1,80 @@
+import asyncio
+import time
+
+import pytest
+from nostr_sdk import EventBuilder, Keys, Kind, Tag, Timestamp
+
+from database import mongodb
+from services import ingestion_service as ingestion_service_module
+from services.ingestion_service import INGEST_CHECKPOINT_OVERLAP_SECONDS, IngestionService
+from services.nostr_service import nostr_service
+
+NOW = int(time.time())
+KEYS = Keys.generate()
+
+
+def event(created_at: int):
+    # No d tag: verified and checkpointed, but nothing to write
+    return EventBuilder(Kind(30402), "listing").tags([Tag.parse(["title", "camera"])]) \
+        .custom_created_at(Timestamp.from_secs(created_at)).sign_with_keys(KEYS)
+
+
+@pytest.fixture
+def database():
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    previous = mongodb.db
+    mongodb.db = mongomock_motor.AsyncMongoMockClient()["ingestion"]
+    yield mongodb.db
+    mongodb.db = previous
+
+
+@pytest.fixture
+def subscriptions(monkeypatch):
+    filters = []
+
+    async def subscribe(listing_filter, callback, relays=None):
+        filters.append(listing_filter)
+        return f"subscription-{len(filters)}"
+
+    async def unsubscribe(subscription_id):
+        pass
+
+    monkeypatch.setattr(nostr_service, "signer", None)
+    monkeypatch.setattr(nostr_service, "subscribe", subscribe)
+    monkeypatch.setattr(nostr_service, "unsubscribe", unsubscribe)
+    return filters
+
+
+async def checkpoint():
+    return (await mongodb.db[IngestionService.collection_name].find_one({"_id": IngestionService.checkpoint_id}))["since"]
+
+
+def test_full_queue_drops_events_and_replays_them(database, subscriptions, monkeypatch):
+    monkeypatch.setattr(ingestion_service_module, "INGEST_QUEUE_MAX_EVENTS", 2)
+    monkeypatch.setattr(ingestion_service_module, "INGEST_FLUSH_SECONDS", 0.01)
+
+    async def scenario():
+        service = IngestionService()
+        await service._advance_checkpoint(NOW)
+        before = await checkpoint()
+
+        for created_at in (NOW - 10, NOW - 20, NOW - 5000, NOW - 30):
+            service._on_event(event(created_at))
+        assert service.queue.qsize() == 2
+        assert service.oldest_dropped == NOW - 5000
+
+        # The writer drains the queue, holds the checkpoint at the oldest dropped event
+        # instead of advancing it, and hands back to run() for a resubscribe
+        await asyncio.wait_for(service._consume(), 5)
+        assert service.queue.empty()
+        assert await checkpoint() == NOW - 5000 - INGEST_CHECKPOINT_OVERLAP_SECONDS < before
+
+        await service._subscribe()
+        assert service.oldest_dropped is None
+        assert subscriptions[-1].as_record().since.as_secs() == NOW - 5000 - INGEST_CHECKPOINT_OVERLAP_SECONDS
+
+        # Without drops the checkpoint advances again
+        await service.ingest([event(NOW)])
+        assert await checkpoint() == before
+
+    asyncio.run(scenario())
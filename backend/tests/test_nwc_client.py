@@ -0,0 +1,79 @@
+import asyncio
+import json
+import time
+
+from secp256k1 import PrivateKey
+
+from services.nwc_client import NWC_NOTIFICATION_KIND, NWC_RESPONSE_KIND, NWCClient, NWCConnection
+from services.nwc_session import NWCSession
+
+WALLET_KEY = PrivateKey()
+WALLET_PUBKEY = WALLET_KEY.pubkey.serialize().hex()[2:]
+APP_KEY = PrivateKey()
+CONNECTION_STRING = (
+    f"nostr+walletconnect://{WALLET_PUBKEY}"
+    f"?relay=wss%3A%2F%2Frelay.example.com&secret={APP_KEY.serialize()}"
+)
+
+
+def wallet_event(session: NWCSession, kind: int, payload: dict, tags: list, signer: PrivateKey = WALLET_KEY) -> dict:
+    """An event as the wallet would send it, signed by signer"""
+    wallet_side = NWCSession(CONNECTION_STRING)
+    wallet_side._private_key = signer
+    return wallet_side.sign_event({
+        "kind": kind,
+        "content": session.encrypt(json.dumps(payload)),
+        "tags": tags,
+        "created_at": int(time.time()),
+        "pubkey": WALLET_PUBKEY,
+    })
+
+
+def test_verify_event():
+    session = NWCSession(CONNECTION_STRING)
+    event = wallet_event(session, NWC_RESPONSE_KIND, {"result": {}}, [["p", session.app_pubkey]])
+    assert session.verify_event(event)
+
+    # Signed by someone else under the wallet's pubkey
+    assert not session.verify_event(wallet_event(session, NWC_RESPONSE_KIND, {}, [], signer=PrivateKey()))
+    # Content swapped after signing
+    assert not session.verify_event({**event, "content": session.encrypt("{}")})
+    # Id and content swapped, signature copied
+    forged = wallet_event(session, NWC_RESPONSE_KIND, {}, [], signer=PrivateKey())
+    assert not session.verify_event({**forged, "sig": event["sig"]})
+    assert not session.verify_event({**event, "sig": "zz"})
+    assert not session.verify_event({"pubkey": WALLET_PUBKEY})
+
+
+def test_forged_responses_are_ignored():
+    async def scenario():
+        session = NWCSession(CONNECTION_STRING)
+        connection = NWCConnection("wss://relay.example.com")
+        future = asyncio.get_running_loop().create_future()
+        connection._pending["request-id"] = (future, session)
+        tags = [["p", session.app_pubkey], ["e", "request-id"]]
+
+        forged = wallet_event(session, NWC_RESPONSE_KIND, {"result": "forged"}, tags, signer=PrivateKey())
+        connection._dispatch(["EVENT", "sub", forged])
+        assert not future.done()
+
+        real = wallet_event(session, NWC_RESPONSE_KIND, {"result": "real"}, tags)
+        connection._dispatch(["EVENT", "sub", real])
+        assert json.loads(session.decrypt((await future)["content"])) == {"result": "real"}
+
+    asyncio.run(scenario())
+
+
+def test_forged_notifications_are_ignored():
+    async def scenario():
+        client = NWCClient()
+        session = NWCSession(CONNECTION_STRING)
+        received = []
+        client._notification_handlers[session.app_pubkey] = (session, received.append)
+        tags = [["p", session.app_pubkey]]
+
+        client._on_notification(wallet_event(session, NWC_NOTIFICATION_KIND, {"forged": True}, tags, signer=PrivateKey()))
+        client._on_notification(wallet_event(session, NWC_NOTIFICATION_KIND, {"forged": False}, tags))
+        assert received == [{"forged": False}]
+
+    asyncio.run(scenario())
@@ -0,0 +1,75 @@
+import pytest
+
+from services import rate_limiter as rate_limiter_module
+from services.rate_limiter import RateLimit, ShardedRateLimiter
+
+LIMIT = RateLimit("ip", rate=2.0, burst=3)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A controllable time.monotonic for the limiter"""
+    now = [1000.0]
+    monkeypatch.setattr(rate_limiter_module.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_burst_then_rejection(clock):
+    limiter = ShardedRateLimiter()
+    key = ("policy:ip", "10.0.0.1")
+    assert [limiter.hit(key, LIMIT) for _ in range(3)] == [None, None, None]
+    # Empty bucket: one token arrives after 1 / rate seconds
+    assert limiter.hit(key, LIMIT) == pytest.approx(0.5)
+
+
+def test_refill_over_time(clock):
+    limiter = ShardedRateLimiter()
+    key = ("policy:ip", "10.0.0.1")
+    for _ in range(3):
+        limiter.hit(key, LIMIT)
+    clock[0] += 0.5
+    assert limiter.hit(key, LIMIT) is None
+    assert limiter.hit(key, LIMIT) is not None
+    # Refill stops at the burst size
+    clock[0] += 60
+    assert [limiter.hit(key, LIMIT) for _ in range(4)][-1] is not None
+
+
+def test_buckets_are_independent(clock):
+    limiter = ShardedRateLimiter()
+    for _ in range(3):
+        limiter.hit(("policy:ip", "10.0.0.1"), LIMIT)
+    assert limiter.hit(("policy:ip", "10.0.0.2"), LIMIT) is None
+
+
+def test_rejected_request_spends_no_tokens(clock):
+    limiter = ShardedRateLimiter()
+    wide = (("policy:ip", "10.0.0.1"), RateLimit("ip", rate=1.0, burst=10))
+    narrow = (("policy:ip_pubkey", "10.0.0.1|npub1a"), RateLimit("ip_pubkey", rate=1.0, burst=1))
+    assert limiter.hit_all([wide, narrow]) is None
+    for _ in range(5):
+        assert limiter.hit_all([wide, narrow]) is not None
+    # The rejections left the wide bucket at 9 tokens
+    assert [limiter.hit(*wide) for _ in range(9)] == [None] * 9
+    assert limiter.hit(*wide) is not None
+
+
+def test_check_applies_every_limit_of_a_policy(clock):
+    limiter = ShardedRateLimiter()
+    identities = {"ip": "10.0.0.1", "ip_pubkey": "10.0.0.1|npub1a"}
+    # auth_challenge allows 5 challenges per pubkey and IP
+    assert [limiter.check("auth_challenge", identities) for _ in range(5)] == [None] * 5
+    assert limiter.check("auth_challenge", identities) is not None
+    # Another pubkey from the same IP has its own bucket
+    assert limiter.check("auth_challenge", {"ip": "10.0.0.1", "ip_pubkey": "10.0.0.1|npub1b"}) is None
+    # Scopes without an identity are skipped
+    assert limiter.check("invoice_pay", {}) is None
+
+
+def test_sweep_drops_refilled_buckets(clock):
+    limiter = ShardedRateLimiter(shards=1, max_buckets_per_shard=2)
+    limiter.hit(("policy:ip", "a"), LIMIT)
+    limiter.hit(("policy:ip", "b"), LIMIT)
+    clock[0] += 60
+    limiter.hit(("policy:ip", "c"), LIMIT)
+    assert set(limiter._shards[0][1]) == {("policy:ip", "c")}
@@ -0,0 +1,101 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from database import mongodb
+from models.review import SellerReputation
+from services.encoding import pubkey_to_db
+from services.reputation_scoring import (REPUTATION_DEFAULT_PRIOR_MEAN, REPUTATION_HALF_LIFE_DAYS,
+                                         REPUTATION_PRIOR_WEIGHT, ReputationScoringService,
+                                         reputation_scoring_service, score_sellers)
+
+NOW = datetime(2027, 1, 15)
+SELLER = "ab" * 32
+OTHER_SELLER = "cd" * 32
+
+
+def totals(*sellers):
+    """sellers: lists of ratings, all fresh"""
+    counts = np.array([len(ratings) for ratings in sellers], dtype=np.float64)
+    sums = np.array([sum(ratings) for ratings in sellers], dtype=np.float64)
+    return counts, sums, counts.copy(), sums.copy()
+
+
+def test_bayesian_mean_pulls_towards_the_marketplace_mean():
+    # Seller 0: one 5-star review; seller 1: fifty reviews averaging 4.9; seller 2: fifty 2-star reviews
+    bayesian, decayed, prior_mean = score_sellers(*totals([5], [5] * 45 + [4] * 5, [2] * 50))
+
+    assert prior_mean == pytest.approx((5 + 245 + 100) / 101)
+    w = REPUTATION_PRIOR_WEIGHT
+    assert bayesian[0] == pytest.approx((w * prior_mean + 5) / (w + 1))
+    assert bayesian[1] == pytest.approx((w * prior_mean + 245) / (w + 50))
+    assert bayesian[2] == pytest.approx((w * prior_mean + 100) / (w + 50))
+    # A single perfect review no longer outranks fifty near-perfect ones
+    assert bayesian[1] > bayesian[0]
+    # Fresh reviews are not decayed
+    np.testing.assert_allclose(decayed, bayesian)
+
+
+def test_decayed_mean_uses_the_weights():
+    # Ratings 5 at weight 1 and 1 at weight 0.5
+    counts, sums = np.array([2.0]), np.array([6.0])
+    _, decayed, _ = score_sellers(counts, sums, np.array([1.5]), np.array([5.5]), prior_weight=0)
+    assert decayed[0] == pytest.approx(5.5 / 1.5)
+
+
+def test_no_reviews_uses_the_default_prior():
+    bayesian, _, prior_mean = score_sellers(*totals())
+    assert prior_mean == REPUTATION_DEFAULT_PRIOR_MEAN
+    assert len(bayesian) == 0
+
+
+def test_bayesian_score_from_live_counters_matches_the_batch():
+    bayesian, _, prior_mean = score_sellers(*totals([5, 3, 4]))
+    reputation = SellerReputation(seller_pubkey="npub1x", review_count=3, rating_sum=12)
+    assert ReputationScoringService.bayesian_score(reputation, prior_mean) == pytest.approx(bayesian[0])
+
+
+@pytest.fixture
+def database():
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    previous = mongodb.db
+    mongodb.db = mongomock_motor.AsyncMongoMockClient()["scoring"]
+    yield mongodb.db
+    mongodb.db = previous
+
+
+def review(seller, rating, age_days, verified=True):
+    return {"seller_pubkey": seller, "rating": rating, "created_at": NOW - timedelta(days=age_days), "verified": verified}
+
+
+def test_seller_totals_decay_a_review_by_half_per_half_life(database):
+    async def scenario():
+        await database.reviews.insert_many([
+            review(pubkey_to_db(SELLER), 5, 0),
+            review(pubkey_to_db(SELLER), 1, REPUTATION_HALF_LIFE_DAYS),
+            # Future reviews and reviews without a time count as fresh
+            review(pubkey_to_db(OTHER_SELLER), 4, -10),
+            {"seller_pubkey": pubkey_to_db(OTHER_SELLER), "rating": 2, "verified": True},
+            review(pubkey_to_db(OTHER_SELLER), 1, 0, verified=False),
+        ])
+        return await reputation_scoring_service.seller_totals(NOW)
+
+    sellers, seller_totals = asyncio.run(scenario())
+    by_seller = dict(zip(sellers, seller_totals.tolist()))
+    np.testing.assert_allclose(by_seller[bytes(pubkey_to_db(SELLER))], [2, 6, 1.5, 5.5])
+    np.testing.assert_allclose(by_seller[bytes(pubkey_to_db(OTHER_SELLER))], [2, 6, 2, 6])
+
+
+def test_seller_totals_merge_legacy_string_pubkeys(database):
+    async def scenario():
+        await database.reviews.insert_many([
+            review(pubkey_to_db(SELLER), 5, 0),
+            review(SELLER, 3, 0),
+        ])
+        return await reputation_scoring_service.seller_totals(NOW)
+
+    sellers, seller_totals = asyncio.run(scenario())
+    assert sellers == [bytes(pubkey_to_db(SELLER))]
+    np.testing.assert_allclose(seller_totals, [[2, 8, 2, 8]])
@@ -0,0 +1,127 @@
+import asyncio
+import hashlib
+from datetime import datetime, timedelta
+
+import pytest
+
+from database import mongodb
+from models.invoice import InvoiceState
+from services.invoice_service import invoice_service
+from services.settlement_watcher import SETTLEMENT_EXPIRY_GRACE_SECONDS, SettlementWatcher, WatchedInvoice
+
+PREIMAGE = "11" * 32
+PAYMENT_HASH = hashlib.sha256(bytes.fromhex(PREIMAGE)).hexdigest()
+
+
+@pytest.fixture
+def database():
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    previous = mongodb.db
+    mongodb.db = mongomock_motor.AsyncMongoMockClient()["settlement"]
+    yield mongodb.db
+    mongodb.db = previous
+
+
+def ledger_entry(payment_hash: str, expires_in: float, verify_url=None) -> dict:
+    now = datetime.utcnow()
+    return {
+        "payment_hash": payment_hash,
+        "invoice": "lnbc1",
+        "listing_id": None,
+        "amount": 21,
+        "state": InvoiceState.PENDING.value,
+        "created_at": now,
+        "updated_at": now,
+        "expires_at": now + timedelta(seconds=expires_in),
+        "settled_at": None,
+        "verify_url": verify_url,
+    }
+
+
+async def state(payment_hash: str) -> str:
+    return (await invoice_service.get_ledger_entry(payment_hash))["state"]
+
+
+def test_sweep_settles_unwatched_invoices_through_lud21(database, monkeypatch):
+    verified = []
+
+    async def verify_settlement(verify_url):
+        verified.append(verify_url)
+        if verify_url == "https://ln.example/paid":
+            return {"status": "OK", "settled": True, "preimage": PREIMAGE}
+        if verify_url == "https://ln.example/forged":
+            return {"status": "OK", "settled": True, "preimage": "22" * 32}
+        return {"status": "OK", "settled": False, "preimage": None}
+
+    monkeypatch.setattr(invoice_service, "verify_settlement", verify_settlement)
+
+    async def scenario():
+        await database.invoices.insert_many([
+            ledger_entry(PAYMENT_HASH, 600, "https://ln.example/paid"),
+            ledger_entry("aa" * 32, 600, "https://ln.example/forged"),
+            ledger_entry("bb" * 32, 600, "https://ln.example/unpaid"),
+            ledger_entry("cc" * 32, 600),
+        ])
+        watcher = SettlementWatcher()
+        assert await watcher.sweep() == 1
+        assert await state(PAYMENT_HASH) == InvoiceState.SETTLED.value
+        assert await state("aa" * 32) == InvoiceState.PENDING.value
+        assert sorted(verified) == ["https://ln.example/forged", "https://ln.example/paid", "https://ln.example/unpaid"]
+
+        # Checked invoices wait for LNURL_VERIFY_INTERVAL_SECONDS before the next check
+        verified.clear()
+        assert await watcher.sweep() == 0
+        assert verified == []
+
+    asyncio.run(scenario())
+
+
+def test_sweep_skips_watched_invoices(database, monkeypatch):
+    async def verify_settlement(verify_url):
+        raise AssertionError("watched invoices are checked through their wallet")
+
+    monkeypatch.setattr(invoice_service, "verify_settlement", verify_settlement)
+
+    async def scenario():
+        record = ledger_entry(PAYMENT_HASH, 600, "https://ln.example/paid")
+        await database.invoices.insert_one(record)
+        watcher = SettlementWatcher()
+        wallet = watcher._wallets["app"] = type("Wallet", (), {})()
+        wallet.invoices = {PAYMENT_HASH: WatchedInvoice(
+            PAYMENT_HASH, record["invoice"], record["created_at"], record["expires_at"], 2
+        )}
+        assert await watcher.sweep() == 0
+
+    asyncio.run(scenario())
+
+
+def test_sweep_expires_overdue_invoices_after_the_grace(database):
+    async def scenario():
+        await database.invoices.insert_many([
+            ledger_entry("aa" * 32, -SETTLEMENT_EXPIRY_GRACE_SECONDS - 1),
+            ledger_entry("bb" * 32, -1),
+        ])
+        await SettlementWatcher().sweep()
+        assert await state("aa" * 32) == InvoiceState.EXPIRED.value
+        assert await state("bb" * 32) == InvoiceState.PENDING.value
+
+    asyncio.run(scenario())
+
+
+def test_long_poll_sees_settlements_of_other_workers(monkeypatch):
+    from services import settlement_watcher as settlement_watcher_module
+    from services.listing_service import listing_service
+
+    reads = []
+
+    async def get_listing(listing_id):
+        # Another worker marks the listing sold after the second read
+        reads.append(listing_id)
+        return {"id": listing_id, "status": "sold" if len(reads) > 2 else "active"}
+
+    monkeypatch.setattr(listing_service, "get_listing", get_listing)
+    monkeypatch.setattr(settlement_watcher_module, "SETTLEMENT_WAIT_POLL_SECONDS", 0.01)
+
+    listing = asyncio.run(SettlementWatcher().wait_for_listing("listing", 5))
+    assert listing["status"] == "sold"
+    assert len(reads) == 3
@@ -0,0 +1,98 @@
+import asyncio
+import time
+
+import pytest
+
+from database import mongodb
+from services import token_service as token_service_module
+from services.token_service import KeyRing, TokenService
+
+KEYS = "k1:" + "11" * 32 + ",k0:" + "22" * 32
+PUBKEY = bytes(range(32))
+
+
+def make_service(keys: str = KEYS) -> TokenService:
+    return TokenService(mode="signed", keys=keys)
+
+
+def test_issue_and_validate():
+    service = make_service()
+    token = service.issue(PUBKEY, 60)
+    assert token.startswith("k1.")
+    claims = service.validate(token)
+    assert claims.public_key == PUBKEY
+    assert claims.expires_at == pytest.approx(time.time() + 60, abs=2)
+    assert len(claims.token_id) == 8
+
+
+def test_tokens_of_a_rotated_out_signing_key_still_validate():
+    old = make_service("k0:" + "22" * 32)
+    token = old.issue(PUBKEY, 60)
+    assert make_service().validate(token) is not None
+    assert make_service("k2:" + "33" * 32).validate(token) is None
+
+
+def test_forged_and_malformed_tokens_are_rejected():
+    service = make_service()
+    key_id, payload, mac = service.issue(PUBKEY, 60).split(".")
+    forged = make_service("k1:" + "44" * 32).issue(PUBKEY, 60)
+    assert service.validate(forged) is None
+    assert service.validate(".".join([key_id, payload, mac[:-2] + ("AA" if mac[-2:] != "AA" else "BB")])) is None
+    assert service.validate(".".join([key_id, payload[:-4], mac])) is None
+    assert service.validate("not-a-token") is None
+    assert service.validate("a.b") is None
+
+
+def test_expired_tokens_are_rejected(monkeypatch):
+    service = make_service()
+    token = service.issue(PUBKEY, 60)
+    real_time = time.time
+    monkeypatch.setattr(token_service_module.time, "time", lambda: real_time() + 61)
+    assert service.validate(token) is None
+
+
+def test_session_mode_validates_nothing():
+    service = TokenService(mode="session", keys=KEYS)
+    assert service.validate("k1.a.b") is None
+
+
+def test_key_ring_rejects_bad_entries():
+    with pytest.raises(ValueError):
+        KeyRing.from_env("k.1:" + "11" * 32)
+    with pytest.raises(ValueError):
+        KeyRing([])
+
+
+@pytest.fixture
+def database():
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    previous = mongodb.db
+    mongodb.db = mongomock_motor.AsyncMongoMockClient()["tokens"]
+    yield mongodb.db
+    mongodb.db = previous
+
+
+def test_revocation_reaches_other_workers(database, monkeypatch):
+    async def scenario():
+        worker, other_worker = make_service(), make_service()
+        await worker.load_revocations()
+        await other_worker.load_revocations()
+        token = worker.issue(PUBKEY, 60)
+        assert await other_worker.validate_current(token) is not None
+
+        assert await worker.revoke(token)
+        assert worker.validate(token) is None
+        assert not await worker.revoke(token)
+
+        # The other worker re-reads the revocations once its list is REFRESH_SECONDS old
+        real_monotonic = time.monotonic
+        monkeypatch.setattr(token_service_module.time, "monotonic",
+                            lambda: real_monotonic() + token_service_module.REVOCATION_REFRESH_SECONDS)
+        assert await other_worker.validate_current(token) is None
+
+        # And a restarted worker loads it at startup
+        restarted = make_service()
+        await restarted.load_revocations()
+        assert restarted.validate(token) is None
+
+    asyncio.run(scenario())
@@ -0,0 +1,56 @@
+import asyncio
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+import pytest
+from nostr_sdk import Keys
+
+from database import mongodb
+from services.encoding import id_to_db, pubkey_to_db
+from services.user_service import user_service
+
+
+@pytest.fixture
+def database():
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    previous = mongodb.db
+    mongodb.db = mongomock_motor.AsyncMongoMockClient()["users"]
+    yield mongodb.db
+    mongodb.db = previous
+
+
+def test_seller_directory_counts_listings_in_both_pubkey_encodings(database):
+    async def scenario():
+        sellers = [Keys.generate().public_key().to_bech32() for _ in range(3)]
+        # Mid-migration: the first user and half the listings still store npub strings
+        for index, seller in enumerate(sellers):
+            await database.users.insert_one({
+                "_id": id_to_db(str(uuid4())),
+                "nostr_public_key": seller if index == 0 else pubkey_to_db(seller),
+                "created_at": datetime(2026, 1, 1) + timedelta(seconds=index),
+                "raw_seed": "secret",
+                "username": f"seller{index}",
+            })
+        listings = [(0, "active", True), (0, "active", False), (0, "sold", True),
+                    (1, "active", True), (1, "sold", False), (1, "ended", False)]
+        for index, status, legacy in listings:
+            await database.listings.insert_one({
+                "_id": id_to_db(str(uuid4())),
+                "pubkey": sellers[index] if legacy else pubkey_to_db(sellers[index]),
+                "status": status,
+            })
+
+        first = await user_service.get_seller_directory(limit=2)
+        second = await user_service.get_seller_directory(limit=2, cursor=first["next_cursor"])
+        return sellers, first, second
+
+    sellers, first, second = asyncio.run(scenario())
+    assert [(item["username"], item["active_listings"], item["sold_listings"]) for item in first["items"]] == [
+        ("seller0", 2, 1), ("seller1", 1, 1),
+    ]
+    assert first["items"][0]["nostr_public_key"] == sellers[0]
+    assert "raw_seed" not in first["items"][0]
+    assert [(item["username"], item["active_listings"], item["sold_listings"]) for item in second["items"]] == [
+        ("seller2", 0, 0),
+    ]
+    assert second["next_cursor"] is None
@@ -15,7 +15,7 @@ const AllListings = () => {
   const [buyerNwc, setBuyerNwc] = useState("");
   const [profile, setProfile] = useState(null);
 
-  const { userPublicKey } = useContext(AuthContext);
+  const { authToken } = useContext(AuthContext);
 
   // 1) Fetch all listings on component mount
   useEffect(() => {
@@ -101,7 +101,7 @@ const AllListings = () => {
         throw new Error("Seller's LN address (lud16) not found in profile.");
       }
       // Create invoice
-      const invoiceUrl = `http://localhost:8000/invoices/create_invoice/?seller_ln_address=${encodeURIComponent(sellerLnAddress)}&amount=${encodeURIComponent(listing.price)}&description=${encodeURIComponent(listing.title)}`;
+      const invoiceUrl = `http://localhost:8000/invoices/create_invoice/?seller_ln_address=${encodeURIComponent(sellerLnAddress)}&amount=${encodeURIComponent(listing.price)}&description=${encodeURIComponent(listing.title)}&listing_id=${encodeURIComponent(listing.id)}&session-token=${encodeURIComponent(authToken)}`;
       const invoiceResponse = await fetch(invoiceUrl, {
         method: "POST",
         headers: { "Content-Type": "application/json" },
@@ -127,34 +127,42 @@ const AllListings = () => {
         alert("Please enter your buyer NWC string.");
         return;
       }
-      // Pay invoice
-      const payUrl = `http://localhost:8000/invoices/pay_invoice/?nwc_buyer_string=${encodeURIComponent(buyerNwc)}&invoicestr=${encodeURIComponent(invoiceStr)}`;
-      const payResp = await fetch(payUrl);
-      if (!payResp.ok) {
+      // Submit the payment as a job, then long-poll it until it settles or fails
+      const jobResp = await fetch("http://localhost:8000/invoices/jobs/", {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({ nwc_buyer_string: buyerNwc, invoicestr: invoiceStr }),
+      });
+      if (!jobResp.ok) {
         throw new Error("Failed to pay invoice");
       }
-      const paymentResult = await payResp.json();
-      alert("Payment result: " + JSON.stringify(paymentResult));
+      let job = await jobResp.json();
+      while (job.state !== "settled" && job.state !== "failed") {
+        const pollResp = await fetch(`http://localhost:8000/invoices/jobs/${job.id}?timeout=30`);
+        if (!pollResp.ok) {
+          throw new Error("Failed to fetch payment status");
+        }
+        job = await pollResp.json();
+      }
+      if (job.state === "failed") {
+        throw new Error(job.error || "Payment failed");
+      }
+      alert("Payment settled.");
 
-      // Update listing to ended and set paid_by
-      if (selectedListing && userPublicKey) {
-        const listingId = selectedListing.id;
-        const updateUrl = `http://localhost:8000/listings/${listingId}`;
-        const updatePayload = {
-          status: "ended",
-          paid_by: userPublicKey,
-        };
-        const updateResp = await fetch(updateUrl, {
-          method: "PUT",
-          headers: { "Content-Type": "application/json" },
-          body: JSON.stringify(updatePayload),
-        });
-        if (!updateResp.ok) {
-          throw new Error("Failed to update listing after payment.");
+      // The backend marks the listing sold once the invoice settles; wait for it
+      if (selectedListing) {
+        const waitUrl = `http://localhost:8000/invoices/listing/${encodeURIComponent(selectedListing.id)}/wait?timeout=30`;
+        const waitResp = await fetch(waitUrl);
+        if (!waitResp.ok) {
+          throw new Error("Failed to fetch listing after payment.");
+        }
+        const updatedListing = await waitResp.json();
+        console.log("Listing after payment:", updatedListing);
+        if (updatedListing.status === "sold") {
+          alert(`Listing sold to ${updatedListing.paid_by}.`);
+        } else {
+          alert("Payment not settled yet, the listing will be marked sold once it is.");
         }
-        const updatedListing = await updateResp.json();
-        console.log("Listing updated:", updatedListing);
-        alert(`Listing status updated to "ended" and paid_by set to ${userPublicKey}.`);
       }
 
       setShowPayModal(false);
@@ -187,7 +195,7 @@ const AllListings = () => {
                 width: '300px',
                 cursor: 'pointer',
                 boxShadow: '2px 2px 5px rgba(0,0,0,0.1)',
-                backgroundColor: listing.status === "ended" ? "#ffcccc" : "#fff"
+                backgroundColor: listing.status !== "active" ? "#ffcccc" : "#fff"
               }}
             >
               {listing.image && listing.image.url && (
@@ -294,7 +302,7 @@ const AllListings = () => {
                 </div>
               )}
               
-              {selectedListing.status !== "ended" && (
+              {selectedListing.status === "active" && (
                 <div style={{ marginTop: '20px', display: 'flex', justifyContent: 'center' }}>
                   <button onClick={() => handlePay(selectedListing)}>
                     Pay
@@ -302,7 +310,7 @@ const AllListings = () => {
                 </div>
               )}
               
-              {selectedListing.status === "ended" && selectedListing.paid_by && (
+              {selectedListing.status !== "active" && selectedListing.paid_by && (
                 <p style={{ color: "green" }}>
                   <strong>Paid by:</strong> {selectedListing.paid_by}
                 </p>
@@ -7,35 +7,53 @@ const AllSellers = () => {
   const [error, setError] = useState(null);
   const [selectedSeller, setSelectedSeller] = useState(null);
   const [reviews, setReviews] = useState([]);
+  const [reviewsCursor, setReviewsCursor] = useState(null);
   const [showModal, setShowModal] = useState(false);
+  const [sellersCursor, setSellersCursor] = useState(null);
 
-  useEffect(() => {
-    const fetchSellers = async () => {
-      try {
-        const response = await fetch('http://localhost:8000/users');
-        if (!response.ok) {
-          throw new Error("Error fetching sellers");
-        }
-        const data = await response.json();
-        setSellers(data);
-        setLoading(false);
-      } catch (err) {
-        setError(err.message);
-        setLoading(false);
+  // One request per page: sellers come with listing counts and reputation
+  const fetchSellers = async (cursor) => {
+    try {
+      const params = new URLSearchParams({ limit: 50 });
+      if (cursor) {
+        params.set('cursor', cursor);
+      }
+      const response = await fetch(`http://localhost:8000/users/sellers?${params}`);
+      if (!response.ok) {
+        throw new Error("Error fetching sellers");
       }
-    };
+      const data = await response.json();
+      setSellers((previous) => (cursor ? [...previous, ...data.items] : data.items));
+      setSellersCursor(data.next_cursor);
+      setLoading(false);
+    } catch (err) {
+      setError(err.message);
+      setLoading(false);
+    }
+  };
 
-    fetchSellers();
+  useEffect(() => {
+    fetchSellers(null);
   }, []);
 
+  // Reviews are paged; the cursor of the last page fetches the next one
+  const fetchReviews = async (sellerPubKey, cursor) => {
+    const params = new URLSearchParams({ limit: 20 });
+    if (cursor) {
+      params.set('cursor', cursor);
+    }
+    const response = await fetch(`http://localhost:8000/reviews/seller/${sellerPubKey}?${params}`);
+    if (!response.ok) {
+      throw new Error("Error fetching reviews");
+    }
+    return response.json();
+  };
+
   const handleShowReviews = async (sellerPubKey) => {
     try {
-      const response = await fetch(`http://localhost:8000/reviews/seller/${sellerPubKey}`);
-      if (!response.ok) {
-        throw new Error("Error fetching reviews");
-      }
-      const data = await response.json();
-      setReviews(data);
+      const data = await fetchReviews(sellerPubKey, null);
+      setReviews(data.items);
+      setReviewsCursor(data.next_cursor);
       setSelectedSeller(sellerPubKey);
       setShowModal(true);
     } catch (err) {
@@ -43,9 +61,20 @@ const AllSellers = () => {
     }
   };
 
+  const handleMoreReviews = async () => {
+    try {
+      const data = await fetchReviews(selectedSeller, reviewsCursor);
+      setReviews((previous) => [...previous, ...data.items]);
+      setReviewsCursor(data.next_cursor);
+    } catch (err) {
+      setError(err.message);
+    }
+  };
+
   const handleCloseModal = () => {
     setShowModal(false);
     setReviews([]);
+    setReviewsCursor(null);
     setSelectedSeller(null);
   };
 
@@ -78,6 +107,13 @@ const AllSellers = () => {
             <p><strong>Username:</strong> {seller.username || 'N/A'}</p>
             <p><strong>About:</strong> {seller.about || 'N/A'}</p>
             <p><strong>Created At:</strong> {new Date(seller.created_at).toLocaleString()}</p>
+            <p><strong>Listings:</strong> {seller.active_listings} active, {seller.sold_listings} sold</p>
+            <p>
+              <strong>Rating:</strong>{' '}
+              {seller.reputation.review_count > 0
+                ? `${seller.reputation.average_rating.toFixed(1)} / 5 (${seller.reputation.review_count} reviews)`
+                : 'No reviews yet'}
+            </p>
             <button
               style={{
                 marginTop: '10px',
@@ -95,6 +131,11 @@ const AllSellers = () => {
           </div>
         ))}
       </div>
+      {sellersCursor && (
+        <button style={{ marginTop: '20px' }} onClick={() => fetchSellers(sellersCursor)}>
+          Load more sellers
+        </button>
+      )}
 
       {showModal && (
         <div
@@ -125,6 +166,11 @@ const AllSellers = () => {
           ) : (
             <p>No reviews available.</p>
           )}
+          {reviewsCursor && (
+            <button style={{ marginTop: '10px', marginRight: '10px' }} onClick={handleMoreReviews}>
+              Load more reviews
+            </button>
+          )}
           <button
             style={{
               marginTop: '10px',
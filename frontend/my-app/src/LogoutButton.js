@@ -1,7 +1,18 @@
 import React from 'react';
 
 const LogoutButton = () => {
-  const handleLogout = () => {
+  const handleLogout = async () => {
+    // Revoke the session on the server so the token stops working immediately
+    const token = localStorage.getItem('authToken');
+    if (token) {
+      try {
+        await fetch(`http://localhost:8000/auth/logout?session-token=${encodeURIComponent(token)}`, {
+          method: 'POST'
+        });
+      } catch (err) {
+        console.error('Error revoking session:', err);
+      }
+    }
     // Clear all keys from localStorage
     localStorage.clear();
     // Refresh the page to reset application state
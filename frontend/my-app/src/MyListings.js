@@ -71,7 +71,7 @@ const MyListings = () => {
               width: '300px',
               cursor: 'pointer',
               boxShadow: '2px 2px 5px rgba(0,0,0,0.1)',
-              background: listing.status === "ended" ? "#ffd6d6" : "#fff"
+              background: listing.status !== "active" ? "#ffd6d6" : "#fff"
             }}
           >
             {listing.image && listing.image.url && (
@@ -141,8 +141,8 @@ const MyListings = () => {
             <p><strong>Price:</strong> {selectedListing.price} SATs</p>
             <p><strong>Description:</strong> {selectedListing.description}</p>
             <p><strong>Condition:</strong> {selectedListing.condition}</p>
-            {/* If the listing is ended, display paid_by information */}
-            {selectedListing.status === "ended" && selectedListing.paid_by && (
+            {/* If the listing is sold or ended, display paid_by information */}
+            {selectedListing.status !== "active" && selectedListing.paid_by && (
               <p style={{ color: "green" }}>
                 <strong>Paid by:</strong> {selectedListing.paid_by}
               </p>
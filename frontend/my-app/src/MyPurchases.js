@@ -113,7 +113,7 @@ const MyPurchases = () => {
               padding: '16px',
               width: '300px',
               boxShadow: '2px 2px 5px rgba(0,0,0,0.1)',
-              backgroundColor: listing.status === "ended" ? "#ffd6d6" : "#fff"
+              backgroundColor: listing.status !== "active" ? "#ffd6d6" : "#fff"
             }}
           >
             {listing.image && listing.image.url && (